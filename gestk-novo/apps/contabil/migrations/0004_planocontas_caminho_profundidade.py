@@ -0,0 +1,23 @@
+# Generated by Django 4.2.15 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contabil', '0003_historicallancamentocontabil_contrato_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planocontas',
+            name='caminho',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1000, verbose_name='Caminho'),
+        ),
+        migrations.AddField(
+            model_name='planocontas',
+            name='profundidade',
+            field=models.IntegerField(default=0, editable=False, help_text='Número de ancestrais da conta (0 = raiz)', verbose_name='Profundidade'),
+        ),
+    ]
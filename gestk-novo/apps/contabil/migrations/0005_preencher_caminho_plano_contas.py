@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+# Caminho/profundidade das contas já existentes, descendo a partir das raízes
+PREENCHER_CAMINHOS = """
+WITH RECURSIVE arvore (id, caminho, profundidade) AS (
+    SELECT id, replace(id::text, '-', '') || '/', 0
+    FROM contabil_plano_contas
+    WHERE conta_pai_id IS NULL
+    UNION ALL
+    SELECT c.id, a.caminho || replace(c.id::text, '-', '') || '/', a.profundidade + 1
+    FROM contabil_plano_contas c
+    INNER JOIN arvore a ON c.conta_pai_id = a.id
+)
+UPDATE contabil_plano_contas p
+SET caminho = a.caminho, profundidade = a.profundidade
+FROM arvore a
+WHERE p.id = a.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contabil', '0004_planocontas_caminho_profundidade'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PREENCHER_CAMINHOS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -1,8 +1,49 @@
 import uuid
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from simple_history.models import HistoricalRecords
 
+
+class PlanoContasQuerySet(models.QuerySet):
+    """
+    Consultas hierárquicas pelo caminho materializado (PlanoContas.caminho),
+    cada uma em uma única query indexada, sem CTE recursiva.
+    """
+
+    def descendentes(self, conta, incluir_propria=False):
+        """Todas as contas abaixo de `conta` (LIKE 'caminho%' no índice do caminho)."""
+        if not conta.caminho:
+            raise ValueError(f"Conta {conta.pk} sem caminho calculado; execute o etl_05_plano_contas.")
+        contas = self.filter(contabilidade_id=conta.contabilidade_id, caminho__startswith=conta.caminho)
+        return contas if incluir_propria else contas.exclude(pk=conta.pk)
+
+    def ancestrais(self, conta, incluir_propria=False):
+        """Contas acima de `conta`, da raiz para a conta (ids lidos do caminho; busca pela PK)."""
+        if not conta.caminho:
+            raise ValueError(f"Conta {conta.pk} sem caminho calculado; execute o etl_05_plano_contas.")
+        ids = [uuid.UUID(parte) for parte in conta.caminho.split('/') if parte]
+        if not incluir_propria:
+            ids = ids[:-1]
+        return self.filter(pk__in=ids).order_by('profundidade')
+
+    def mover_subarvore(self, contabilidade_id, caminho_anterior, caminho_novo):
+        """
+        Troca o prefixo caminho_anterior por caminho_novo em todas as contas
+        abaixo dele (e ajusta a profundidade), em um único UPDATE.
+        """
+        delta = caminho_novo.count('/') - caminho_anterior.count('/')
+        return self.filter(
+            contabilidade_id=contabilidade_id, caminho__startswith=caminho_anterior,
+        ).exclude(caminho=caminho_anterior).update(
+            caminho=Concat(Value(caminho_novo), Substr('caminho', len(caminho_anterior) + 1), output_field=models.CharField()),
+            profundidade=F('profundidade') + delta,
+        )
+
+
 class PlanoContas(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     contabilidade = models.ForeignKey('core.Contabilidade', on_delete=models.PROTECT, related_name='planos_contas')
@@ -15,7 +56,13 @@ class PlanoContas(models.Model):
     tipo_conta = models.CharField(_('Tipo de Conta'), max_length=20) # ANALITICA, SINTETICA
     natureza = models.CharField(_('Natureza'), max_length=10) # DEVEDORA, CREDORA
     ativo = models.BooleanField(_('Ativo'), default=True)
-    history = HistoricalRecords()
+    # Caminho materializado: ids (hex) dos ancestrais e da própria conta, da
+    # raiz para a conta, cada um seguido de '/'. Descendentes = prefixo.
+    caminho = models.CharField(_('Caminho'), max_length=1000, blank=True, default='', db_index=True, editable=False)
+    profundidade = models.IntegerField(_('Profundidade'), default=0, editable=False, help_text="Número de ancestrais da conta (0 = raiz)")
+    history = HistoricalRecords(excluded_fields=['caminho', 'profundidade'])
+
+    objects = PlanoContasQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('Plano de Conta')
@@ -23,6 +70,39 @@ class PlanoContas(models.Model):
         db_table = 'contabil_plano_contas'
         unique_together = ('contabilidade', 'codigo')
 
+    def save(self, *args, **kwargs):
+        """
+        Mantém caminho/profundidade: recalculados a partir do pai quando a
+        conta é criada ou quando conta_pai é gravado; se o caminho mudou, a
+        subárvore é movida junto. Cargas em bulk calculam o caminho por conta
+        própria (ver etl_05_plano_contas).
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'conta_pai', 'conta_pai_id'} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        caminho_anterior = self.caminho
+        caminho_pai = ''
+        if self.conta_pai_id:
+            caminho_pai = PlanoContas.objects.filter(pk=self.conta_pai_id).values_list('caminho', flat=True).first() or ''
+            if caminho_anterior and caminho_pai.startswith(caminho_anterior):
+                raise ValueError("A conta-pai não pode ser a própria conta nem uma de suas descendentes.")
+        self.caminho = f"{caminho_pai}{self.id.hex}/"
+        self.profundidade = self.caminho.count('/') - 1
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'caminho', 'profundidade'}
+
+        super().save(*args, **kwargs)
+        if caminho_anterior and caminho_anterior != self.caminho:
+            PlanoContas.objects.mover_subarvore(self.contabilidade_id, caminho_anterior, self.caminho)
+
+@receiver(post_delete, sender=PlanoContas)
+def reenraizar_contas_filhas(sender, instance, **kwargs):
+    """As filhas de uma conta excluída ficam sem pai (SET_NULL): a subárvore vira raiz."""
+    if instance.caminho:
+        PlanoContas.objects.mover_subarvore(instance.contabilidade_id, instance.caminho, '')
+
+
 class LancamentoContabil(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     contabilidade = models.ForeignKey('core.Contabilidade', on_delete=models.PROTECT, related_name='lancamentos_contabeis')
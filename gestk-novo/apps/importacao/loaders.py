@@ -0,0 +1,200 @@
+"""
+Carregamento em massa para os ETLs via COPY do PostgreSQL.
+
+O CopyLoader grava as linhas já transformadas em uma tabela temporária de
+staging com COPY (psycopg2 copy_expert) e faz o merge na tabela do model
+com um único INSERT ... ON CONFLICT DO UPDATE pela chave natural do model
+(ex.: chave_acesso, (contabilidade, id_legado)).
+
+Uso:
+    loader = CopyLoader(PlanoContas, chave=('contabilidade', 'codigo'),
+                        campos=('id_legado', 'nome', 'nivel', 'natureza'))
+    resultado = loader.carregar(linhas)  # iterável de dicts
+    stats['criados'] += resultado.criados
+    stats['atualizados'] += resultado.atualizados
+
+Como todo carregamento em massa, não passa por save() nem por sinais, então
+não gera registros do simple_history.
+"""
+
+import io
+import json
+from datetime import date, datetime
+from typing import NamedTuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+
+
+class ResultadoCarga(NamedTuple):
+    criados: int
+    atualizados: int
+    inalterados: int
+
+
+def _formatar(valor):
+    """Converte um valor Python no texto aceito pelo COPY (formato text)."""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        texto = 't' if valor else 'f'
+    elif isinstance(valor, (dict, list)):
+        texto = json.dumps(valor, cls=DjangoJSONEncoder)
+    elif isinstance(valor, (date, datetime)):
+        texto = valor.isoformat()
+    else:
+        texto = str(valor)
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyLoader:
+    """
+    Upsert em massa de um model via COPY + INSERT ... ON CONFLICT.
+
+    - chave: campos da chave natural; precisam corresponder a um unique
+      (unique=True, unique_together ou UniqueConstraint sem condição).
+    - campos: demais campos informados nas linhas; são os atualizados
+      quando a linha já existe (além dos campos auto_now).
+    - somente_insercao: campos informados nas linhas gravados só na
+      inserção; nunca são regravados nem comparados (ex.: data_inicio).
+    - Campos fora de chave/campos recebem o default do model apenas na
+      inserção (ex.: a PK UUID); PKs sem default ficam com a sequence.
+    - Linhas com a mesma chave no mesmo lote: vale a última.
+    - Linhas cujo conteúdo não mudou não são regravadas (contadas em
+      'inalterados').
+
+    As linhas são dicts com o nome do campo ('contabilidade') ou o attname
+    ('contabilidade_id') como chave.
+    """
+
+    BUFFER_LINHAS = 10000
+
+    def __init__(self, model, chave, campos=(), somente_insercao=(), using='default'):
+        self.model = model
+        self.using = using
+        opts = model._meta
+
+        self.campos_chave = [opts.get_field(nome) for nome in chave]
+        self.campos_dados = [opts.get_field(nome) for nome in campos if nome not in chave]
+        self.campos_insercao = [
+            opts.get_field(nome) for nome in somente_insercao if nome not in chave and nome not in campos
+        ]
+        self._validar_chave()
+
+        informados = {campo.name for campo in self.campos_chave + self.campos_dados + self.campos_insercao}
+        self.campos_auto_now = [
+            campo for campo in opts.concrete_fields
+            if getattr(campo, 'auto_now', False) and campo.name not in informados
+        ]
+        self.campos_auto_now_add = [
+            campo for campo in opts.concrete_fields
+            if getattr(campo, 'auto_now_add', False) and campo.name not in informados
+        ]
+        self.campos_default = [
+            campo for campo in opts.concrete_fields
+            if campo.name not in informados
+            and campo not in self.campos_auto_now and campo not in self.campos_auto_now_add
+            and campo.has_default()
+        ]
+
+        self.colunas = (
+            self.campos_chave + self.campos_dados + self.campos_insercao + self.campos_auto_now
+            + self.campos_auto_now_add + self.campos_default
+        )
+        self.colunas_update = self.campos_dados + self.campos_auto_now
+
+    def _validar_chave(self):
+        opts = self.model._meta
+        nomes = {campo.name for campo in self.campos_chave}
+        unicos = [{campo.name} for campo in opts.concrete_fields if campo.unique]
+        unicos += [set(grupo) for grupo in opts.unique_together]
+        unicos += [
+            set(constraint.fields) for constraint in opts.constraints
+            if getattr(constraint, 'fields', None) and getattr(constraint, 'condition', None) is None
+            and type(constraint).__name__ == 'UniqueConstraint'
+        ]
+        if nomes not in unicos:
+            raise ValueError(
+                f"{opts.label}: a chave {sorted(nomes)} não corresponde a nenhuma restrição unique; "
+                f"ON CONFLICT exige uma."
+            )
+
+    def _valor(self, linha, campo):
+        if campo.attname in linha:
+            return linha[campo.attname]
+        valor = linha.get(campo.name)
+        # Aceita instâncias em campos ForeignKey
+        if campo.is_relation and valor is not None and hasattr(valor, 'pk'):
+            return valor.pk
+        return valor
+
+    def _linhas_copy(self, linhas):
+        """Gera blocos de texto no formato do COPY a partir das linhas."""
+        agora = timezone.now()
+        buffer = []
+        for linha in linhas:
+            valores = [
+                self._valor(linha, campo) for campo in self.campos_chave + self.campos_dados + self.campos_insercao
+            ]
+            valores += [agora] * (len(self.campos_auto_now) + len(self.campos_auto_now_add))
+            valores += [campo.get_default() for campo in self.campos_default]
+            buffer.append('\t'.join(_formatar(valor) for valor in valores))
+            if len(buffer) >= self.BUFFER_LINHAS:
+                yield '\n'.join(buffer) + '\n'
+                buffer = []
+        if buffer:
+            yield '\n'.join(buffer) + '\n'
+
+    def carregar(self, linhas):
+        """Carrega as linhas e retorna ResultadoCarga(criados, atualizados, inalterados)."""
+        connection = connections[self.using]
+        tabela = connection.ops.quote_name(self.model._meta.db_table)
+        staging = connection.ops.quote_name(f"staging_{self.model._meta.db_table}")
+        colunas = [connection.ops.quote_name(campo.column) for campo in self.colunas]
+        chave = [connection.ops.quote_name(campo.column) for campo in self.campos_chave]
+        dados = [connection.ops.quote_name(campo.column) for campo in self.campos_dados]
+        update = [connection.ops.quote_name(campo.column) for campo in self.colunas_update]
+        lista_colunas = ', '.join(colunas)
+
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {lista_colunas} FROM {tabela} WITH NO DATA"
+            )
+            cursor.execute(f"ALTER TABLE {staging} ADD COLUMN _ordem BIGSERIAL")
+
+            total = 0
+            for bloco in self._linhas_copy(linhas):
+                total += bloco.count('\n')
+                cursor.copy_expert(f"COPY {staging} ({lista_colunas}) FROM STDIN", io.StringIO(bloco))
+
+            if not total:
+                cursor.execute(f"DROP TABLE {staging}")
+                return ResultadoCarga(0, 0, 0)
+
+            if dados:
+                # Só regrava (e atualiza os auto_now) se algum campo de dados mudou
+                acao = (
+                    f"DO UPDATE SET {', '.join(f'{coluna} = EXCLUDED.{coluna}' for coluna in update)} "
+                    f"WHERE ({', '.join(f'{tabela}.{coluna}' for coluna in dados)}) "
+                    f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{coluna}' for coluna in dados)})"
+                )
+            else:
+                acao = "DO NOTHING"
+
+            cursor.execute(
+                f"WITH upsert AS ("
+                f"  INSERT INTO {tabela} ({lista_colunas}) "
+                f"  SELECT DISTINCT ON ({', '.join(chave)}) {lista_colunas} FROM {staging} "
+                f"  ORDER BY {', '.join(chave)}, _ordem DESC "
+                f"  ON CONFLICT ({', '.join(chave)}) {acao} "
+                f"  RETURNING (xmax = 0) AS inserido"
+                f") "
+                f"SELECT COUNT(*) FILTER (WHERE inserido), COUNT(*) FILTER (WHERE NOT inserido), "
+                f"(SELECT COUNT(DISTINCT ({', '.join(chave)})) FROM {staging}) FROM upsert"
+            )
+            criados, atualizados, distintos = cursor.fetchone()
+            cursor.execute(f"DROP TABLE {staging}")
+
+        return ResultadoCarga(criados, atualizados, distintos - criados - atualizados)
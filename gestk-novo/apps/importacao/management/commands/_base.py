@@ -1,20 +1,866 @@
+import hashlib
+import json
+import mmap
+import os
 import pyodbc
+import queue
 import re
+import struct
+import sys
+import threading
 import time
+import zlib
+from bisect import bisect_right
+from contextlib import contextmanager
 from datetime import date, datetime
+from decimal import Decimal
+from typing import NamedTuple
+from uuid import UUID, uuid4
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection as pg_connection, connections, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from apps.core.models import Contabilidade
+from apps.importacao.models import ETLCheckpoint, ETLLoteAuditoria, ETLWatermark
 from apps.pessoas.models import Contrato, PessoaJuridica, PessoaFisica
 from functools import lru_cache
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class PeriodoContrato(NamedTuple):
+    """Entrada compacta do mapa histórico: apenas datas e IDs, sem objetos ORM."""
+    data_inicio: date
+    data_termino: date
+    contabilidade_id: UUID
+    contrato_id: UUID
+
+
+class HistoricalContabilidadeMap(dict):
+    """
+    Mapa {documento_limpo: [PeriodoContrato, ...]} da Regra de Ouro.
+
+    Guarda somente IDs; os objetos Contabilidade e Contrato são carregados sob
+    demanda (get_contabilidade / get_contrato) e mantidos em cache.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._contabilidades = None
+        self._contratos = {}
+
+    def get_contabilidade(self, contabilidade_id):
+        """Retorna o objeto Contabilidade, carregando todas as referenciadas no primeiro acesso."""
+        if contabilidade_id is None:
+            return None
+        if self._contabilidades is None:
+            ids = {p.contabilidade_id for periodos in self.values() for p in periodos}
+            self._contabilidades = Contabilidade.objects.in_bulk(ids)
+        contabilidade = self._contabilidades.get(contabilidade_id)
+        if contabilidade is None:
+            contabilidade = Contabilidade.objects.filter(id=contabilidade_id).first()
+            self._contabilidades[contabilidade_id] = contabilidade
+        return contabilidade
+
+    def get_contrato(self, contrato_id):
+        """Retorna o objeto Contrato (com cache por ID)."""
+        if contrato_id is None:
+            return None
+        if contrato_id not in self._contratos:
+            self._contratos[contrato_id] = Contrato.objects.filter(id=contrato_id).first()
+        return self._contratos[contrato_id]
+
+
+class HistoricalMapSnapshot:
+    """
+    Snapshot em disco do mapa histórico, compartilhado entre os subprocessos
+    de ETL de uma mesma sequência (cada ETL roda em um manage.py próprio).
+
+    Formato binário little-endian, lido via mmap:
+        cabeçalho: MAGIC | tamanho da versão (H) | versão utf-8 | total de registros (I)
+        registros: documento (14s) | data_inicio (i) | data_termino (i) |
+                   contabilidade_id (16s) | contrato_id (16s)
+
+    Datas são gravadas como ordinal (0 = nula) e os registros de cada
+    documento seguem a ordem do mapa (data de início). A versão é derivada de
+    max(updated_at) e do total de Contrato, PessoaJuridica e PessoaFisica,
+    portanto qualquer gravação em contratos ou nos documentos das pessoas
+    torna o snapshot obsoleto. Documentos com mais de 14 bytes não cabem no
+    registro: nesse caso o snapshot não é gravado (save levanta ValueError).
+    """
+    MAGIC = b'GKRO0002'
+    RECORD = struct.Struct('<14sii16s16s')
+    VERSION_SIZE = struct.Struct('<H')
+    COUNT = struct.Struct('<I')
+
+    def __init__(self, path=None):
+        if path is None:
+            banco = settings.DATABASES['default'].get('NAME') or 'default'
+            cache_dir = getattr(settings, 'ETL_CACHE_DIR', os.path.join(settings.BASE_DIR, '.etl_cache'))
+            path = os.path.join(str(cache_dir), f'regra_de_ouro_{banco}.bin')
+        self.path = path
+
+    DOCUMENTO_MAX = 14
+
+    @staticmethod
+    def current_version():
+        """Versão atual: 'max(updated_at)|total' de Contrato, PessoaJuridica e PessoaFisica."""
+        partes = []
+        for model in (Contrato, PessoaJuridica, PessoaFisica):
+            resumo = model.objects.aggregate(ultima=Max('updated_at'), total=Count('id'))
+            ultima = resumo['ultima'].isoformat() if resumo['ultima'] else '-'
+            partes.append(f"{ultima}|{resumo['total']}")
+        return '|'.join(partes)
+
+    def load(self, version):
+        """
+        Carrega o mapa do disco se o snapshot existir e estiver na versão
+        informada. Retorna None caso contrário.
+        """
+        try:
+            with open(self.path, 'rb') as arquivo, \
+                    mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                offset = len(self.MAGIC)
+                if buffer[:offset] != self.MAGIC:
+                    return None
+
+                (tamanho_versao,) = self.VERSION_SIZE.unpack_from(buffer, offset)
+                offset += self.VERSION_SIZE.size
+                versao_arquivo = buffer[offset:offset + tamanho_versao].decode('utf-8')
+                offset += tamanho_versao
+                if versao_arquivo != version:
+                    return None
+
+                (total,) = self.COUNT.unpack_from(buffer, offset)
+                offset += self.COUNT.size
+                registros = buffer[offset:offset + total * self.RECORD.size]
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+
+        if len(registros) != total * self.RECORD.size:
+            return None
+
+        historical_map = HistoricalContabilidadeMap()
+        uuids = {}
+        datas = {0: None}
+        for documento, inicio, termino, contabilidade_id, contrato_id in self.RECORD.iter_unpack(registros):
+            for ordinal in (inicio, termino):
+                if ordinal not in datas:
+                    datas[ordinal] = date.fromordinal(ordinal)
+            if contabilidade_id not in uuids:
+                uuids[contabilidade_id] = UUID(bytes=contabilidade_id)
+            historical_map.setdefault(documento.rstrip(b'\0').decode('ascii'), []).append(
+                PeriodoContrato(datas[inicio], datas[termino], uuids[contabilidade_id], UUID(bytes=contrato_id))
+            )
+        return historical_map
+
+    def save(self, historical_map, version):
+        """Grava o mapa de forma atômica (arquivo temporário + os.replace)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        versao = version.encode('utf-8')
+        registros = [
+            (documento, periodo)
+            for documento, periodos in historical_map.items()
+            for periodo in periodos
+        ]
+        # struct '14s' truncaria em silêncio e duas chaves poderiam colidir
+        longos = [documento for documento in historical_map if len(documento.encode('ascii')) > self.DOCUMENTO_MAX]
+        if longos:
+            raise ValueError(
+                f"{len(longos)} documento(s) com mais de {self.DOCUMENTO_MAX} caracteres "
+                f"(ex.: {longos[0]!r}); snapshot não gravado"
+            )
+
+        temporario = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(self.MAGIC)
+            arquivo.write(self.VERSION_SIZE.pack(len(versao)))
+            arquivo.write(versao)
+            arquivo.write(self.COUNT.pack(len(registros)))
+            for documento, periodo in registros:
+                arquivo.write(self.RECORD.pack(
+                    documento.encode('ascii'),
+                    periodo.data_inicio.toordinal() if periodo.data_inicio else 0,
+                    periodo.data_termino.toordinal() if periodo.data_termino else 0,
+                    periodo.contabilidade_id.bytes,
+                    periodo.contrato_id.bytes,
+                ))
+        os.replace(temporario, self.path)
+
+    def invalidate(self):
+        """Remove o snapshot do disco."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ContabilidadeResolver:
+    """
+    Resolve a Regra de Ouro (CODI_EMP + data -> Contabilidade) inteiramente em memória.
+
+    É construído uma única vez por execução a partir do mapa histórico e de uma
+    carga completa da GEEMPRE (codi_emp -> CNPJ/CPF). Os contratos de cada
+    documento ficam ordenados por data de início em arrays paralelos, de modo
+    que cada resolução é uma busca binária (O(log n)) sem ida ao Sybase.
+    """
+
+    def __init__(self, historical_map, documentos_por_codi_emp, stats=None):
+        self.historical_map = historical_map
+        self.documentos_por_codi_emp = documentos_por_codi_emp
+        self.stats = stats if stats is not None else {}
+        self._indice = {}
+
+        for documento, contratos in historical_map.items():
+            ordenados = sorted((p for p in contratos if p.data_inicio), key=lambda p: p.data_inicio)
+            if not ordenados:
+                continue
+            self._indice[documento] = (
+                [p.data_inicio for p in ordenados],
+                [p.data_termino or date.max for p in ordenados],
+                ordenados,
+            )
+
+    def _contar(self, chave):
+        self.stats[chave] = self.stats.get(chave, 0) + 1
+
+    def get_documento(self, codi_emp):
+        """Retorna o CNPJ/CPF limpo da empresa ou None."""
+        return self.documentos_por_codi_emp.get(codi_emp)
+
+    def get_contrato_por_documento(self, documento, event_date):
+        """
+        Retorna o PeriodoContrato vigente para o documento na data.
+
+        Havendo sobreposição de contratos, prevalece o de início mais antigo,
+        como no get_contabilidade_for_date original e nos ETLs que percorrem
+        o mapa histórico (06, 17). Contratos sem término valem até date.max.
+        """
+        indice = self._indice.get(documento)
+        if not indice or not event_date:
+            return None
+
+        inicios, terminos, contratos = indice
+        # Candidatos: contratos iniciados até a data; o primeiro que a cobre vence
+        for i in range(bisect_right(inicios, event_date)):
+            if event_date <= terminos[i]:
+                return contratos[i]
+        return None
+
+    def get_contrato(self, codi_emp, event_date):
+        """Retorna o PeriodoContrato vigente para o CODI_EMP na data."""
+        if not codi_emp or not event_date:
+            self._contar('contabilidade_not_found')
+            return None
+
+        documento = self.get_documento(codi_emp)
+        if not documento:
+            self._contar('codi_emp_sem_documento')
+            self._contar('contabilidade_not_found')
+            return None
+
+        contrato = self.get_contrato_por_documento(documento, event_date)
+        self._contar('contabilidade_found' if contrato else 'contabilidade_not_found')
+        return contrato
+
+    def get_contabilidade(self, codi_emp, event_date):
+        """Retorna a Contabilidade responsável pelo CODI_EMP na data ou None."""
+        contrato = self.get_contrato(codi_emp, event_date)
+        return self.historical_map.get_contabilidade(contrato.contabilidade_id) if contrato else None
+
+    def get_contabilidade_por_documento(self, documento, event_date):
+        """Retorna a Contabilidade responsável pelo CNPJ/CPF na data ou None."""
+        contrato = self.get_contrato_por_documento(documento, event_date)
+        self._contar('contabilidade_found' if contrato else 'contabilidade_not_found')
+        return self.historical_map.get_contabilidade(contrato.contabilidade_id) if contrato else None
+
+
+class QueryRow(tuple):
+    """
+    Linha de resultado do Sybase: uma tupla com acesso por índice, pelo
+    nome da coluna ou por atributo (row[0], row['codi_emp'], row.codi_emp).
+
+    Os nomes das colunas ficam na subclasse criada para cada query
+    (para_colunas), e não em cada linha como acontecia com dict(zip(...)).
+    """
+    __slots__ = ()
+    _indices = {}
+    _colunas = ()
+
+    @classmethod
+    def para_colunas(cls, colunas):
+        """Cria o tipo de linha para uma query com as colunas informadas."""
+        colunas = tuple(colunas)
+        return type('QueryRow', (cls,), {
+            '__slots__': (),
+            '_indices': {nome: indice for indice, nome in enumerate(colunas)},
+            '_colunas': colunas,
+        })
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            return tuple.__getitem__(self, self._indices[chave])
+        return tuple.__getitem__(self, chave)
+
+    def __getattr__(self, nome):
+        # Compatível com o acesso por atributo das linhas do pyodbc (row.CODI_EMP)
+        try:
+            return tuple.__getitem__(self, self._indices[nome])
+        except KeyError:
+            raise AttributeError(nome) from None
+
+    def get(self, chave, default=None):
+        indice = self._indices.get(chave)
+        return default if indice is None else tuple.__getitem__(self, indice)
+
+    def keys(self):
+        return self._colunas
+
+    def as_dict(self):
+        return dict(zip(self._colunas, self))
+
+
+def _codificar_chave(chave):
+    """Converte uma chave do Sybase em valores JSON (datas e decimais marcados por tipo)."""
+    valores = []
+    for valor in chave:
+        if isinstance(valor, datetime):
+            valor = {'datetime': valor.isoformat()}
+        elif isinstance(valor, date):
+            valor = {'date': valor.isoformat()}
+        elif isinstance(valor, Decimal):
+            valor = {'decimal': str(valor)}
+        valores.append(valor)
+    return valores
+
+
+def _decodificar_chave(valores):
+    """Inverso de _codificar_chave."""
+    chave = []
+    for valor in valores:
+        if isinstance(valor, dict):
+            if 'datetime' in valor:
+                valor = datetime.fromisoformat(valor['datetime'])
+            elif 'date' in valor:
+                valor = date.fromisoformat(valor['date'])
+            elif 'decimal' in valor:
+                valor = Decimal(valor['decimal'])
+        chave.append(valor)
+    return tuple(chave)
+
+
+class KeysetExtractor:
+    """
+    Extração paginada por chave (keyset) com checkpoint no Postgres.
+
+    Cada página é um SELECT TOP n ... ORDER BY <chave> que começa depois da
+    última chave lida, de modo que nenhuma query fica aberta (e segurando
+    locks) por muito tempo no Sybase. Após carregar uma página o ETL chama
+    confirmar(): a última chave vai para ETLCheckpoint e uma nova execução
+    retoma exatamente dali. Ao chegar ao fim o checkpoint é marcado como
+    concluído e a próxima execução recomeça do início.
+
+    As colunas da chave precisam estar no SELECT, não podem ser nulas e,
+    juntas, devem identificar a linha (ex.: codi_emp, data_lan, nume_lan).
+
+    Uso:
+        extrator = KeysetExtractor(self, connection, 'ctlancto', select, from_, where,
+                                   chave=('l.codi_emp', 'l.data_lan', 'l.nume_lan'))
+        for pagina in extrator.paginas():
+            with transaction.atomic():
+                ...carregar pagina...
+                extrator.confirmar(pagina)
+    """
+
+    def __init__(self, command, connection, extracao, select, from_, where='', chave=(),
+                 params=(), page_size=10000, limite=None, reiniciar=False, persistir=True):
+        self.command = command
+        self.connection = connection
+        self.etl = command.nome_etl
+        self.extracao = extracao
+        self.select = select
+        self.from_ = from_
+        self.where = where
+        self.chave = tuple(chave)
+        # Nome da coluna no resultado: 'l.data_lan' -> 'data_lan'
+        self.colunas_chave = tuple(expressao.rsplit('.', 1)[-1] for expressao in self.chave)
+        self.params = tuple(params)
+        self.page_size = page_size
+        self.limite = limite
+        self.reiniciar = reiniciar
+        self.persistir = persistir
+        self.linhas_processadas = 0
+        self.esgotado = False
+        self.assinatura = hashlib.sha256(
+            repr((select, from_, where, self.chave, self.params, limite)).encode('utf-8')
+        ).hexdigest()
+
+    def _carregar_checkpoint(self):
+        """Retorna a chave de retomada ou None para começar do início."""
+        if self.reiniciar:
+            return None
+        checkpoint = ETLCheckpoint.objects.filter(etl=self.etl, extracao=self.extracao).first()
+        if checkpoint is None or checkpoint.concluido or not checkpoint.ultima_chave:
+            return None
+        if checkpoint.assinatura != self.assinatura:
+            self.command.stdout.write(self.command.style.WARNING(
+                f'Checkpoint de {self.etl}/{self.extracao} é de outra consulta (filtros mudaram). Recomeçando do início.'
+            ))
+            return None
+        self.linhas_processadas = checkpoint.linhas_processadas
+        return _decodificar_chave(checkpoint.ultima_chave)
+
+    def _montar_query(self, apos, top):
+        condicoes = [f"({self.where})"] if self.where else []
+        params = list(self.params)
+        if apos is not None:
+            # (a, b, c) > (?, ?, ?) expandido, pois o Sybase não compara tuplas
+            alternativas = []
+            for i, expressao in enumerate(self.chave):
+                partes = [f"{anterior} = ?" for anterior in self.chave[:i]] + [f"{expressao} > ?"]
+                alternativas.append(f"({' AND '.join(partes)})")
+                params.extend(apos[:i + 1])
+            condicoes.append(f"({' OR '.join(alternativas)})")
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        query = f"SELECT TOP {top} {self.select} {self.from_} {where} ORDER BY {', '.join(self.chave)}"
+        return query, params
+
+    def chave_da_linha(self, row):
+        return tuple(row[coluna] for coluna in self.colunas_chave)
+
+    def paginas(self, concluir=True):
+        """
+        Gera as páginas (listas de QueryRow) a partir do checkpoint.
+        Com concluir=False quem consome chama concluir() depois de gravar a
+        última página (ex.: leitura antecipada pelo ETLPipeline), se
+        `esgotado` (a extração não parou no limite).
+        """
+        self.esgotado = False
+        apos = self._carregar_checkpoint()
+        if apos is not None:
+            self.command.stdout.write(self.command.style.WARNING(
+                f'Retomando {self.extracao} após {self.linhas_processadas:,} linhas (chave {apos}).'
+            ))
+        lidas = 0
+        while True:
+            top = self.page_size
+            if self.limite is not None:
+                top = min(top, self.limite - lidas)
+                if top <= 0:
+                    return
+            query, params = self._montar_query(apos, top)
+            pagina = list(self.command.stream_query(self.connection, query, params, fetch_size=top))
+            if not pagina:
+                break
+            lidas += len(pagina)
+            yield pagina
+            apos = self.chave_da_linha(pagina[-1])
+            if len(pagina) < top:
+                break
+        self.esgotado = True
+        if concluir:
+            self.concluir()
+
+    def confirmar(self, pagina):
+        """Registra a página como carregada; chame dentro da transação do lote."""
+        self.linhas_processadas += len(pagina)
+        if not self.persistir or not pagina:
+            return
+        ETLCheckpoint.objects.update_or_create(
+            etl=self.etl,
+            extracao=self.extracao,
+            defaults={
+                'assinatura': self.assinatura,
+                'ultima_chave': _codificar_chave(self.chave_da_linha(pagina[-1])),
+                'linhas_processadas': self.linhas_processadas,
+                'concluido': False,
+            }
+        )
+
+    def concluir(self):
+        """Marca a extração como concluída; a próxima execução começa do início."""
+        if self.persistir:
+            ETLCheckpoint.objects.filter(etl=self.etl, extracao=self.extracao).update(concluido=True)
+
+
+class _RelatorioEncoder(DjangoJSONEncoder):
+    """Serializa o relatório da execução; valores desconhecidos viram texto."""
+
+    def default(self, o):
+        if isinstance(o, (set, frozenset)):
+            return sorted(o, key=str)
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def _pico_rss_mb():
+    """Pico de memória residente do processo em MB (None onde não há 'resource')."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB no Linux
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class ETLMetrics:
+    """
+    Instrumentação de uma execução de ETL.
+
+    Acumula segundos e linhas por etapa (as etapas podem se sobrepor, ex.:
+    'gravacao' inclui as queries do PostgreSQL):
+    - sybase_query: execução das queries no Sybase (stream_query)
+    - sybase_fetch: fetchmany das linhas do Sybase
+    - transformacao / gravacao: estágios do ETLPipeline
+    - commit: commit das transações abertas com BaseETLCommand.transacao()
+    - postgres: queries do ORM (via execute_wrapper), com a contagem em
+      orm_queries
+
+    Seguro para uso pelas threads do ETLPipeline.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+        self.orm_queries = 0
+        self.pico_rss_mb = None
+        self.inicio = None
+        self.fim = None
+        self._lock = threading.Lock()
+
+    def adicionar(self, etapa, segundos, linhas=0):
+        with self._lock:
+            atual = self.etapas.setdefault(etapa, {'segundos': 0.0, 'linhas': 0, 'chamadas': 0})
+            atual['segundos'] += segundos
+            atual['linhas'] += linhas
+            atual['chamadas'] += 1
+
+    @contextmanager
+    def medir(self, etapa, linhas=0):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar(etapa, time.perf_counter() - inicio, linhas)
+
+    def registrar_query(self, execute, sql, params, many, context):
+        """execute_wrapper do Django: conta e cronometra as queries do ORM."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.orm_queries += 1
+            self.adicionar('postgres', time.perf_counter() - inicio)
+
+    def mesclar(self, exportado):
+        """Soma as métricas exportadas por outro processo (ex.: workers do etl_06)."""
+        for etapa, valores in exportado.get('etapas', {}).items():
+            with self._lock:
+                atual = self.etapas.setdefault(etapa, {'segundos': 0.0, 'linhas': 0, 'chamadas': 0})
+                for chave in ('segundos', 'linhas', 'chamadas'):
+                    atual[chave] += valores[chave]
+        self.orm_queries += exportado.get('orm_queries', 0)
+        if exportado.get('pico_rss_mb') is not None:
+            self.pico_rss_mb = max(self.pico_rss_mb or 0, exportado['pico_rss_mb'])
+
+    def exportar(self):
+        """Dicionário serializável com as etapas (e linhas/s), queries do ORM e pico de memória."""
+        pico = _pico_rss_mb()
+        if self.pico_rss_mb is not None:
+            pico = max(pico or 0, self.pico_rss_mb)
+        etapas = {}
+        for etapa, valores in sorted(self.etapas.items()):
+            etapas[etapa] = dict(valores, segundos=round(valores['segundos'], 3))
+            if valores['linhas'] and valores['segundos'] > 0:
+                etapas[etapa]['linhas_por_segundo'] = round(valores['linhas'] / valores['segundos'], 1)
+        return {
+            'inicio': self.inicio,
+            'fim': self.fim,
+            'duracao_segundos': round((self.fim - self.inicio).total_seconds(), 3) if self.inicio and self.fim else None,
+            'etapas': etapas,
+            'orm_queries': self.orm_queries,
+            'pico_rss_mb': pico,
+        }
+
+
+class _FalhaEstagio:
+    """Exceção de um estágio do ETLPipeline repassada pela fila."""
+
+    def __init__(self, erro):
+        self.erro = erro
+
+
+_FIM_PIPELINE = object()
+
+
+class ETLPipeline:
+    """
+    Leitura, transformação e gravação de lotes em estágios sobrepostos.
+
+    - leitura: thread que consome o iterável de lotes (ex.: extrator.paginas()),
+      ou seja, faz os fetchmany no Sybase;
+    - transformação: thread que aplica `transformar(lote)` (limpeza de
+      documentos, Regra de Ouro, Decimal...); opcional;
+    - gravação: roda na thread de quem chama `executar`, que é a dona da
+      conexão do Django e das transações: `gravar(lote, resultado)`.
+
+    As filas entre os estágios são limitadas (tamanho_fila): se a gravação
+    atrasar, a leitura para de buscar páginas (back-pressure) e a memória
+    fica limitada a poucos lotes em trânsito.
+
+    Erros em transformar/gravar vão para `ao_erro(lote, erro)` quando
+    informado (o pipeline segue); sem ele, e em qualquer erro da leitura, o
+    pipeline para e a exceção é relançada em `executar`.
+
+    Após `executar`, `tempos` tem os segundos gastos em cada estágio
+    (trabalho, sem contar esperas) e `espera_gravacao` o tempo que a
+    gravação ficou parada aguardando lotes.
+    """
+
+    def __init__(self, command, tamanho_fila=2):
+        self.command = command
+        self.metricas = getattr(command, 'metricas', None) or ETLMetrics()
+        self.tamanho_fila = tamanho_fila
+        self.tempos = {'leitura': 0.0, 'transformacao': 0.0, 'gravacao': 0.0, 'espera_gravacao': 0.0}
+        self.lotes = 0
+        self._parar = threading.Event()
+
+    def _enviar(self, fila, item):
+        """put com back-pressure; desiste se o pipeline foi interrompido."""
+        while not self._parar.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _receber(self, fila):
+        while True:
+            try:
+                return fila.get(timeout=0.5)
+            except queue.Empty:
+                if self._parar.is_set():
+                    return _FIM_PIPELINE
+
+    def _ler(self, lotes, saida):
+        try:
+            iterador = iter(lotes)
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    lote = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    self.tempos['leitura'] += time.perf_counter() - inicio
+                if not self._enviar(saida, lote):
+                    return
+            self._enviar(saida, _FIM_PIPELINE)
+        except Exception as e:
+            self._enviar(saida, _FalhaEstagio(e))
+        finally:
+            # Conexões do Django abertas nesta thread (ex.: leitura de checkpoint)
+            connections.close_all()
+
+    def _transformar(self, transformar, entrada, saida):
+        try:
+            while True:
+                lote = self._receber(entrada)
+                if lote is _FIM_PIPELINE or isinstance(lote, _FalhaEstagio):
+                    self._enviar(saida, lote)
+                    return
+                inicio = time.perf_counter()
+                try:
+                    resultado = transformar(lote)
+                except Exception as e:
+                    resultado = _FalhaEstagio(e)
+                duracao = time.perf_counter() - inicio
+                self.tempos['transformacao'] += duracao
+                self.metricas.adicionar('transformacao', duracao, self._linhas_do_lote(lote))
+                if not self._enviar(saida, (lote, resultado)):
+                    return
+        finally:
+            connections.close_all()
+
+    def executar(self, lotes, gravar, transformar=None, ao_erro=None, linhas_do_lote=len):
+        """
+        Roda o pipeline até o fim dos lotes. Retorna o número de lotes
+        gravados ou com erro. `linhas_do_lote(lote)` conta as linhas para as
+        taxas por etapa das métricas.
+        """
+        self._linhas_do_lote = linhas_do_lote
+        lidos = queue.Queue(maxsize=self.tamanho_fila)
+        threads = [threading.Thread(target=self._ler, args=(lotes, lidos), name='etl-leitura', daemon=True)]
+        if transformar is not None:
+            transformados = queue.Queue(maxsize=self.tamanho_fila)
+            threads.append(threading.Thread(
+                target=self._transformar, args=(transformar, lidos, transformados), name='etl-transformacao', daemon=True
+            ))
+        else:
+            transformados = lidos
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                inicio = time.perf_counter()
+                item = self._receber(transformados)
+                self.tempos['espera_gravacao'] += time.perf_counter() - inicio
+                if item is _FIM_PIPELINE:
+                    break
+                if isinstance(item, _FalhaEstagio):
+                    raise item.erro
+                lote, resultado = item if transformar is not None else (item, None)
+
+                inicio = time.perf_counter()
+                try:
+                    if isinstance(resultado, _FalhaEstagio):
+                        raise resultado.erro
+                    gravar(lote, resultado)
+                except Exception as e:
+                    if ao_erro is None:
+                        raise
+                    ao_erro(lote, e)
+                finally:
+                    duracao = time.perf_counter() - inicio
+                    self.tempos['gravacao'] += duracao
+                    self.metricas.adicionar('gravacao', duracao, self._linhas_do_lote(lote))
+                    self.lotes += 1
+        finally:
+            self._parar.set()
+            for thread in threads:
+                thread.join()
+        return self.lotes
+
+    def resumo(self):
+        """Linha com os tempos por estágio, para o relatório do ETL."""
+        return (
+            f"Pipeline: {self.lotes} lotes | leitura {self.tempos['leitura']:.1f}s | "
+            f"transformação {self.tempos['transformacao']:.1f}s | gravação {self.tempos['gravacao']:.1f}s | "
+            f"gravação aguardando leitura {self.tempos['espera_gravacao']:.1f}s"
+        )
+
+
+class SharedSybaseConnection:
+    """
+    Conexão Sybase compartilhada por vários ETLs no mesmo processo.
+
+    Delegação transparente para a conexão pyodbc; close() é ignorado para que
+    um ETL não derrube a conexão dos próximos. Apenas o ETLContext a fecha.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, nome):
+        return getattr(self._connection, nome)
+
+    @property
+    def closed(self):
+        return getattr(self._connection, 'closed', False)
+
+    def close(self):
+        pass
+
+    def close_shared(self):
+        self._connection.close()
+
+
+class ETLContext:
+    """
+    Contexto compartilhado entre ETLs executados em sequência no mesmo
+    processo (via call_command): conexão Sybase, mapa histórico, GEEMPRE e
+    caches de lookup (pessoas, contabilidades, ...).
+
+    Cada cache declara de quais grupos de tabelas depende; invalidar()
+    descarta os caches afetados quando um ETL grava nesses grupos.
+    Grupos usados: 'contabilidades', 'pessoas', 'contratos'.
+    """
+
+    HISTORICAL_MAP_DEPENDE_DE = frozenset({'pessoas', 'contratos'})
+
+    def __init__(self):
+        self.sybase_connection = None
+        self.historical_map = None
+        self.geempre_documentos = None
+        self._caches = {}
+        self._dependencias = {}
+
+    def get_cache(self, nome, depende_de=()):
+        """Retorna (criando se preciso) o dicionário de cache compartilhado 'nome'."""
+        if nome not in self._caches:
+            self._caches[nome] = {}
+            self._dependencias[nome] = frozenset(depende_de)
+        return self._caches[nome]
+
+    def invalidar(self, grupos):
+        """Descarta os caches que dependem de algum dos grupos de tabelas informados."""
+        grupos = set(grupos)
+        if not grupos:
+            return
+        if grupos & self.HISTORICAL_MAP_DEPENDE_DE:
+            self.historical_map = None
+        for nome, dependencias in list(self._dependencias.items()):
+            if dependencias & grupos:
+                del self._caches[nome]
+                del self._dependencias[nome]
+
+    def fechar(self):
+        """Fecha a conexão Sybase compartilhada."""
+        if self.sybase_connection is not None:
+            try:
+                self.sybase_connection.close_shared()
+            finally:
+                self.sybase_connection = None
+
+    @contextmanager
+    def ativar(self):
+        """Torna este contexto o contexto dos BaseETLCommand criados dentro do bloco."""
+        anterior = BaseETLCommand.contexto
+        BaseETLCommand.contexto = self
+        try:
+            yield self
+        finally:
+            BaseETLCommand.contexto = anterior
+
+
 class BaseETLCommand(BaseCommand):
     """
     Classe base para comandos de ETL que se conectam ao banco de dados Sybase.
     """
     help = 'Classe base para comandos de ETL.'
+
+    # ETLContext ativo (execução em processo); None quando o ETL roda isolado
+    contexto = None
+
+    # Linhas buscadas por fetchmany em stream_query()
+    FETCH_SIZE = 5000
+
+    # True: o ETL não grava o histórico por linha do simple_history; registra
+    # um ETLLoteAuditoria por lote (ver update_or_create e registrar_lote)
+    HISTORICO_POR_LOTE = False
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.contexto = BaseETLCommand.contexto
+        self._caches_locais = {}
+
+        # Instrumentação da execução e relatório JSON gravado ao final (ver execute)
+        self.metricas = ETLMetrics()
+        self.caminho_relatorio = None
+        self.relatorio = None
+
+        # Identifica a execução nos registros de ETLLoteAuditoria e no relatório
+        self.execucao_id = uuid4()
+
         # Cache para mapa histórico
         self._historical_map_cache = None
         self._cache_timestamp = None
@@ -22,6 +868,10 @@ class BaseETLCommand(BaseCommand):
         
         # Cache para conexão Sybase
         self._sybase_connection = None
+
+        # Resolvedor da Regra de Ouro (construído uma vez por execução)
+        self._geempre_documentos = None
+        self._contabilidade_resolver = None
         
         # Estatísticas de performance
         self.stats = {
@@ -30,6 +880,9 @@ class BaseETLCommand(BaseCommand):
             'sybase_queries': 0,
             'contabilidade_found': 0,
             'contabilidade_not_found': 0,
+            'codi_emp_sem_documento': 0,
+            'snapshot_hits': 0,
+            'snapshot_misses': 0,
             'errors': 0
         }
 
@@ -37,12 +890,39 @@ class BaseETLCommand(BaseCommand):
         """
         Cria e retorna uma conexão com o banco de dados Sybase usando as
         configurações definidas em SYBASE_CONFIG no settings.py.
-        Reutiliza conexão existente se disponível.
+        Reutiliza conexão existente se disponível (inclusive a do ETLContext).
         """
-        if self._sybase_connection is not None:
+        if self.contexto is not None:
+            conexao = self.contexto.sybase_connection
+            if conexao is None or conexao.closed:
+                conexao = self._connect_sybase()
+                self.contexto.sybase_connection = SharedSybaseConnection(conexao) if conexao else None
+            self._sybase_connection = self.contexto.sybase_connection
             return self._sybase_connection
-            
+
+        if self._sybase_connection is not None and not getattr(self._sybase_connection, 'closed', False):
+            return self._sybase_connection
+
+        self._sybase_connection = self._connect_sybase()
+        return self._sybase_connection
+
+    def _connect_sybase(self):
+        """
+        Abre uma nova conexão ODBC com o Sybase (ou None em caso de falha).
+        Com SYBASE_CONNECTION_FACTORY (caminho pontilhado de uma função que
+        recebe o SYBASE_CONFIG), a conexão vem da fábrica, ex.: o substituto
+        local apps.importacao.standin.conectar usado nos benchmarks.
+        """
         sybase_config = settings.SYBASE_CONFIG
+        fabrica = getattr(settings, 'SYBASE_CONNECTION_FACTORY', '')
+        if fabrica:
+            try:
+                connection = import_string(fabrica)(sybase_config)
+                self.stdout.write(self.style.SUCCESS(f'Conexão com o Sybase estabelecida via {fabrica}.'))
+                return connection
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Falha ao conectar ao Sybase via {fabrica}: {e}'))
+                return None
         try:
             conn_str = (
                 f"DRIVER={{{sybase_config['DRIVER']}}};"
@@ -51,82 +931,339 @@ class BaseETLCommand(BaseCommand):
                 f"UID={sybase_config['UID']};"
                 f"PWD={sybase_config['PWD']}"
             )
-            self._sybase_connection = pyodbc.connect(conn_str)
+            connection = pyodbc.connect(conn_str)
             self.stdout.write(self.style.SUCCESS('Conexão com o Sybase (ODBC) estabelecida com sucesso.'))
-            return self._sybase_connection
+            return connection
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Falha ao conectar ao Sybase: {e}'))
             return None
     
     def close_sybase_connection(self):
-        """Fechar conexão Sybase"""
+        """Fechar conexão Sybase (a conexão de um ETLContext permanece aberta)"""
         if self._sybase_connection:
             self._sybase_connection.close()
             self._sybase_connection = None
             self.stdout.write(self.style.SUCCESS('Conexão Sybase fechada.'))
 
-    def execute_query(self, connection, query):
+    @property
+    def nome_etl(self):
+        """Nome do comando (ex.: 'etl_06_lancamentos'), usado em checkpoints e marcas d'água."""
+        return self.__class__.__module__.rsplit('.', 1)[-1]
+
+    def get_watermarks(self):
+        """Marcas d'água do modo incremental deste ETL: {escopo: data}."""
+        return dict(ETLWatermark.objects.filter(etl=self.nome_etl).values_list('escopo', 'valor'))
+
+    def update_watermarks(self, valores):
+        """
+        Grava as marcas d'água {escopo: data} deste ETL (upsert em uma query).
+        Chame dentro da transação do lote que carregou os dados.
+        """
+        if not valores:
+            return
+        ETLWatermark.objects.bulk_create(
+            [ETLWatermark(etl=self.nome_etl, escopo=str(escopo), valor=valor) for escopo, valor in valores.items()],
+            update_conflicts=True,
+            unique_fields=['etl', 'escopo'],
+            update_fields=['valor', 'updated_at'],
+        )
+
+    def lock_escopos(self, escopos):
+        """
+        Advisory locks de transação do PostgreSQL para os escopos inteiros
+        informados (ex.: codi_emp), no namespace deste ETL. Bloqueia até que
+        nenhuma outra transação segure os mesmos escopos; os locks são
+        liberados no commit/rollback, então serializam lotes, não execuções
+        inteiras. Chame dentro de transaction.atomic().
+        """
+        if not escopos:
+            return
+        namespace = zlib.crc32(self.nome_etl.encode()) & 0x7FFFFFFF
+        with pg_connection.cursor() as cursor:
+            # Ordem fixa evita deadlock entre processos que travam escopos em comum
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, escopo) FROM unnest(%s::int[]) AS escopo ORDER BY escopo",
+                [namespace, sorted({int(escopo) for escopo in escopos})],
+            )
+
+    def get_shared_cache(self, nome, depende_de=()):
         """
-        Executa uma query no banco de dados Sybase e retorna os resultados.
+        Dicionário de cache de lookup. Em execução com ETLContext é
+        compartilhado entre os ETLs e invalidado quando algum grava nos
+        grupos de tabelas em 'depende_de'; caso contrário é local ao comando.
+        """
+        if self.contexto is not None:
+            return self.contexto.get_cache(nome, depende_de)
+        return self._caches_locais.setdefault(nome, {})
+
+    def execute_query(self, connection, query, params=None):
+        """
+        Executa uma query no banco de dados Sybase e retorna todas as linhas
+        (QueryRow). Para resultados grandes prefira stream_query().
         """
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [column[0] for column in cursor.description]
-                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-                return results
+            return list(self.stream_query(connection, query, params))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Erro ao executar a query: {e}'))
             return []
 
+    def stream_query(self, connection, query, params=None, fetch_size=None):
+        """
+        Executa uma query no Sybase e gera as linhas (QueryRow) sob demanda.
+
+        As linhas são buscadas com fetchmany em lotes de fetch_size, então
+        apenas um lote fica em memória; o próximo só é lido quando o
+        consumidor pede mais linhas. O cursor é fechado ao fim da iteração
+        (ou quando o generator é descartado). Erros são propagados.
+        """
+        fetch_size = fetch_size or self.FETCH_SIZE
+        cursor = connection.cursor()
+        try:
+            cursor.arraysize = fetch_size
+            with self.metricas.medir('sybase_query'):
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+            self.stats['sybase_queries'] += 1
+
+            tipo_linha = QueryRow.para_colunas(column[0] for column in cursor.description)
+            while True:
+                inicio = time.perf_counter()
+                lote = cursor.fetchmany(fetch_size)
+                self.metricas.adicionar('sybase_fetch', time.perf_counter() - inicio, len(lote))
+                if not lote:
+                    break
+                for row in lote:
+                    yield tipo_linha(row)
+        finally:
+            cursor.close()
+
+    def execute(self, *args, **options):
+        """
+        Executa o comando medindo as queries do ORM e monta o relatório da
+        execução (também em caso de erro; ver salvar_relatorio).
+        """
+        self.metricas.inicio = timezone.now()
+        erro = None
+        try:
+            with self.instrumentar_orm():
+                return super().execute(*args, **options)
+        except BaseException as e:
+            erro = e
+            raise
+        finally:
+            self.metricas.fim = timezone.now()
+            self.salvar_relatorio(erro)
+
+    def instrumentar_orm(self):
+        """Context manager que conta e cronometra as queries do ORM desta thread nas métricas."""
+        return pg_connection.execute_wrapper(self.metricas.registrar_query)
+
+    def update_or_create(self, model, defaults=None, **lookup):
+        """
+        Como model.objects.update_or_create(). Com HISTORICO_POR_LOTE, não
+        grava o histórico por linha do simple_history, só para esta chamada
+        (seguro nas threads do ETLPipeline): o registro novo entra por
+        bulk_create, que não passa por save() nem por sinais, e o existente
+        é salvo com skip_history_when_saving. O ETL registra a auditoria com
+        registrar_lote() e, se quiser histórico real, gera-o só para o que
+        mudou com gravar_historico(). Retorna (instância, criado).
+        """
+        if not self.HISTORICO_POR_LOTE:
+            return model.objects.update_or_create(defaults=defaults, **lookup)
+
+        defaults = defaults or {}
+        with transaction.atomic():
+            instancia = model.objects.select_for_update().filter(**lookup).first()
+            if instancia is None:
+                instancia = model(**{**lookup, **defaults})
+                model.objects.bulk_create([instancia])
+                return instancia, True
+
+            for campo, valor in defaults.items():
+                setattr(instancia, campo, valor)
+            instancia.skip_history_when_saving = True
+            try:
+                instancia.save()
+            finally:
+                del instancia.skip_history_when_saving
+        return instancia, False
+
+    def registrar_lote(self, model, chave_inicial=None, chave_final=None, criados=0, atualizados=0, inalterados=0):
+        """
+        Grava um ETLLoteAuditoria do lote: ETL, execução, model, faixa de
+        chaves da origem (escalar ou tupla) e contadores. Chame dentro da
+        transação do lote.
+        """
+        def codificar(chave):
+            if chave is None:
+                return None
+            return _codificar_chave(chave if isinstance(chave, (tuple, list)) else (chave,))
+
+        return ETLLoteAuditoria.objects.create(
+            etl=self.nome_etl,
+            execucao=self.execucao_id,
+            modelo=model._meta.label,
+            chave_inicial=codificar(chave_inicial),
+            chave_final=codificar(chave_final),
+            criados=criados,
+            atualizados=atualizados,
+            inalterados=inalterados,
+        )
+
+    def gravar_historico(self, model, criados=(), alterados=()):
+        """
+        Gera os registros do simple_history ('+' para criados, '~' para
+        alterados) em bulk para as instâncias informadas, que já precisam
+        estar gravadas com os valores finais. Models sem HistoricalRecords
+        são ignorados. Retorna o número de registros históricos gravados.
+        """
+        atributo = getattr(model._meta, 'simple_history_manager_attribute', None)
+        if not atributo:
+            return 0
+        manager = getattr(model, atributo)
+        motivo = f"ETL {self.nome_etl} ({self.execucao_id})"
+        agora = timezone.now()
+        total = 0
+        for instancias, update in ((criados, False), (alterados, True)):
+            if instancias:
+                total += len(manager.bulk_history_create(
+                    list(instancias), batch_size=1000, update=update,
+                    default_change_reason=motivo, default_date=agora,
+                ))
+        return total
+
+    @contextmanager
+    def transacao(self):
+        """transaction.atomic() que registra o tempo do commit nas métricas."""
+        bloco = transaction.atomic()
+        bloco.__enter__()
+        try:
+            yield
+        except BaseException:
+            bloco.__exit__(*sys.exc_info())
+            raise
+        with self.metricas.medir('commit'):
+            bloco.__exit__(None, None, None)
+
+    def salvar_relatorio(self, erro=None):
+        """
+        Monta o relatório da execução (self.relatorio) e, só se pedido, grava
+        o JSON em caminho_relatorio (executar_etls_sequencial.py em processo,
+        benchmark_etls) ou no arquivo da variável de ambiente ETL_RELATORIO_JSON
+        (subprocessos do executar_etls_sequencial.py). Falhas ao gravar não
+        interrompem o ETL.
+        """
+        self.relatorio = {
+            'etl': self.nome_etl,
+            'execucao': self.execucao_id,
+            'status': 'erro' if erro is not None else 'sucesso',
+            'erro': str(erro) if erro is not None else None,
+            **self.metricas.exportar(),
+            'stats': self.stats,
+        }
+        caminho = self.caminho_relatorio or os.environ.get('ETL_RELATORIO_JSON')
+        if not caminho:
+            return
+        try:
+            os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                json.dump(self.relatorio, arquivo, cls=_RelatorioEncoder, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Relatório da execução: {caminho}')
+        except (OSError, ValueError) as e:
+            self.stdout.write(self.style.WARNING(f'Não foi possível gravar o relatório da execução: {e}'))
+
     def handle(self, *args, **options):
         # Este método deve ser sobrescrito pelas classes filhas.
         raise NotImplementedError('Subclasses de BaseETLCommand devem implementar o método handle().')
 
     def build_historical_contabilidade_map(self):
+        """
+        Retorna o mapa histórico de contabilidades por CNPJ/CPF.
+
+        Com um ETLContext ativo, reutiliza o mapa já carregado no processo.
+        Senão, usa o snapshot em disco (HistoricalMapSnapshot) quando ele está
+        na versão atual dos contratos; caso contrário, consulta o banco e grava
+        um novo snapshot para os próximos ETLs da sequência.
+        """
+        if self.contexto is not None and self.contexto.historical_map is not None:
+            self.stats['cache_hits'] += 1
+            return self.contexto.historical_map
+
+        historical_map = self._load_or_query_historical_contabilidade_map()
+        if self.contexto is not None:
+            self.contexto.historical_map = historical_map
+        return historical_map
+
+    def _load_or_query_historical_contabilidade_map(self):
+        """Carrega o mapa do snapshot em disco ou o reconstrói a partir do banco."""
+        snapshot = HistoricalMapSnapshot()
+        versao = snapshot.current_version()
+
+        historical_map = snapshot.load(versao)
+        if historical_map is not None:
+            self.stats['snapshot_hits'] += 1
+            self.stdout.write(self.style.SUCCESS(f'Mapa histórico carregado do snapshot ({len(historical_map)} empresas únicas).'))
+            return historical_map
+
+        self.stats['snapshot_misses'] += 1
+        historical_map = self.query_historical_contabilidade_map()
+        try:
+            snapshot.save(historical_map, versao)
+        except (OSError, UnicodeEncodeError, ValueError) as e:
+            self.stdout.write(self.style.WARNING(f'Não foi possível gravar o snapshot do mapa histórico: {e}'))
+        return historical_map
+
+    def query_historical_contabilidade_map(self):
         """
         Cria um mapa que associa o CNPJ/CPF de um cliente a uma
         lista de seus contratos ao longo do tempo.
 
+        O mapa é montado com duas consultas values() (uma por tabela de pessoa),
+        trazendo o documento via subconsulta em object_id. Nenhum objeto ORM é
+        instanciado: Contabilidade e Contrato são resolvidos sob demanda pelo
+        próprio mapa.
+
         Retorna:
-            dict: {
+            HistoricalContabilidadeMap: {
                 'cnpj_ou_cpf_limpo': [
-                    (data_inicio, data_termino, contabilidade_obj, contrato_obj),
+                    PeriodoContrato(data_inicio, data_termino, contabilidade_id, contrato_id),
                     ...
                 ]
             }
         """
         self.stdout.write(self.style.SUCCESS('Construindo mapa histórico de contabilidades por CNPJ/CPF...'))
         
-        historical_map = {}
-        
-        # Buscar todos os contratos com suas pessoas relacionadas
-        contratos = Contrato.objects.select_related('contabilidade', 'content_type').all()
+        historical_map = HistoricalContabilidadeMap()
 
-        for contrato in contratos:
-            cliente = contrato.cliente
-            if not cliente:
-                continue
+        for pessoa_model, campo_documento in ((PessoaJuridica, 'cnpj'), (PessoaFisica, 'cpf')):
+            content_type = ContentType.objects.get_for_model(pessoa_model)
+            documento = Subquery(
+                pessoa_model.objects.filter(id=OuterRef('object_id')).values(campo_documento)[:1]
+            )
+            linhas = (
+                Contrato.objects
+                .filter(content_type=content_type)
+                .annotate(documento=documento)
+                .values_list('documento', 'data_inicio', 'data_termino', 'contabilidade_id', 'id')
+                .order_by()
+            )
 
-            # Determinar o documento único (CNPJ ou CPF)
-            documento_limpo = None
-            if hasattr(cliente, 'cnpj') and cliente.cnpj:
-                documento_limpo = self.limpar_documento(cliente.cnpj)
-            elif hasattr(cliente, 'cpf') and cliente.cpf:
-                documento_limpo = self.limpar_documento(cliente.cpf)
-            
-            if not documento_limpo:
-                continue
-            
-            if documento_limpo not in historical_map:
-                historical_map[documento_limpo] = []
+            for documento_bruto, data_inicio, data_termino, contabilidade_id, contrato_id in linhas.iterator(chunk_size=5000):
+                documento_limpo = self.limpar_documento(documento_bruto)
+                if not documento_limpo:
+                    continue
 
-            # Define um "infinito" para data de término nula
-            data_termino = contrato.data_termino if contrato.data_termino else date.max
-            
-            historical_map[documento_limpo].append(
-                (contrato.data_inicio, data_termino, contrato.contabilidade, contrato)
-            )
+                # Define um "infinito" para data de término nula
+                historical_map.setdefault(documento_limpo, []).append(
+                    PeriodoContrato(data_inicio, data_termino or date.max, contabilidade_id, contrato_id)
+                )
+
+        # Períodos por data de início: quem percorre a lista e para no primeiro
+        # contrato que cobre a data fica com o de início mais antigo
+        for periodos in historical_map.values():
+            periodos.sort(key=lambda periodo: periodo.data_inicio or date.min)
         
         self.stdout.write(self.style.SUCCESS(f'Mapa histórico construído com {len(historical_map)} empresas únicas.'))
         return historical_map
@@ -156,17 +1293,73 @@ class BaseETLCommand(BaseCommand):
         return self._historical_map_cache
     
     def invalidate_cache(self):
-        """Invalidar cache manualmente"""
+        """Invalidar cache manualmente (memória e snapshot em disco)"""
         self._historical_map_cache = None
         self._cache_timestamp = None
+        self._contabilidade_resolver = None
+        if self.contexto is not None:
+            self.contexto.invalidar({'contratos'})
+        HistoricalMapSnapshot().invalidate()
         self.stdout.write(self.style.SUCCESS('Cache invalidado com sucesso'))
 
+    def load_geempre_documentos(self):
+        """
+        Carrega a GEEMPRE inteira em um dicionário {codi_emp: documento_limpo}.
+
+        Substitui a consulta individual por CODI_EMP que era feita a cada linha.
+        O resultado é mantido em cache durante toda a execução do comando.
+        """
+        if self._geempre_documentos is not None:
+            return self._geempre_documentos
+        if self.contexto is not None and self.contexto.geempre_documentos is not None:
+            self._geempre_documentos = self.contexto.geempre_documentos
+            return self._geempre_documentos
+
+        connection = self.get_sybase_connection()
+        if not connection:
+            return {}
+
+        documentos = {}
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT codi_emp, cgce_emp FROM bethadba.geempre")
+                self.stats['sybase_queries'] += 1
+                for codi_emp, cgce_emp in cursor.fetchall():
+                    documento_limpo = self.limpar_documento(cgce_emp)
+                    if documento_limpo:
+                        documentos[codi_emp] = documento_limpo
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.stdout.write(self.style.ERROR(f'Erro ao carregar documentos da GEEMPRE: {e}'))
+            return {}
+
+        self._geempre_documentos = documentos
+        if self.contexto is not None:
+            self.contexto.geempre_documentos = documentos
+        self.stdout.write(self.style.SUCCESS(f'GEEMPRE carregada: {len(documentos):,} empresas com CNPJ/CPF.'))
+        return documentos
+
+    def get_contabilidade_resolver(self, historical_map):
+        """
+        Retorna o ContabilidadeResolver para o mapa histórico informado,
+        construindo-o apenas na primeira chamada (ou se o mapa mudar).
+        """
+        resolver = self._contabilidade_resolver
+        if resolver is not None and resolver.historical_map is historical_map:
+            return resolver
+
+        self._contabilidade_resolver = ContabilidadeResolver(
+            historical_map, self.load_geempre_documentos(), stats=self.stats
+        )
+        return self._contabilidade_resolver
+
     def get_contabilidade_for_date(self, historical_map, codi_emp, event_date):
         """
         Encontra a contabilidade correta para uma empresa em uma data específica.
         
-        Primeiro busca o CNPJ/CPF da empresa no Sybase usando o CODI_EMP,
-        depois usa esse documento para encontrar a contabilidade correta na data.
+        O CNPJ/CPF da empresa (CODI_EMP) e o contrato vigente na data são
+        resolvidos em memória pelo ContabilidadeResolver, sem consultas ao
+        Sybase por linha.
 
         Args:
             historical_map (dict): O mapa gerado por build_historical_contabilidade_map.
@@ -176,106 +1369,13 @@ class BaseETLCommand(BaseCommand):
         Returns:
             Contabilidade or None: O objeto Contabilidade correspondente ou None se não encontrado.
         """
-        if not event_date or not codi_emp:
-            return None
-        
-        # Primeiro, buscar o CNPJ/CPF da empresa no Sybase
-        connection = self.get_sybase_connection()
-        if not connection:
-            return None
-            
-        try:
-            query = """
-            SELECT cgce_emp 
-            FROM bethadba.geempre 
-            WHERE codi_emp = ?
-            """
-            with connection.cursor() as cursor:
-                cursor.execute(query, (codi_emp,))
-                result = cursor.fetchone()
-                
-            if not result:
-                return None
-                
-            cgce_emp = result[0]
-            documento_limpo = self.limpar_documento(cgce_emp)
-            
-            if not documento_limpo:
-                return None
-                
-            # Agora buscar a contabilidade correta para essa empresa na data
-            contratos_empresa = historical_map.get(documento_limpo)
-            if not contratos_empresa:
-                return None
-
-            for data_inicio, data_termino, contabilidade in contratos_empresa:
-                if data_inicio and data_inicio <= event_date <= data_termino:
-                    return contabilidade
-            
-            return None
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao buscar CNPJ/CPF para CODI_EMP {codi_emp}: {e}'))
-            return None
-        finally:
-            connection.close()
+        return self.get_contabilidade_resolver(historical_map).get_contabilidade(codi_emp, event_date)
     
     def get_contabilidade_for_date_optimized(self, historical_map, codi_emp, event_date):
         """
-        Versão otimizada do get_contabilidade_for_date com cache de conexão e logs.
+        Mantido por compatibilidade: equivalente a get_contabilidade_for_date().
         """
-        self.stats['sybase_queries'] += 1
-        
-        if not event_date or not codi_emp:
-            return None
-        
-        # Usar conexão em cache
-        connection = self.get_sybase_connection()
-        if not connection:
-            return None
-            
-        try:
-            query = """
-            SELECT cgce_emp 
-            FROM bethadba.geempre 
-            WHERE codi_emp = ?
-            """
-            with connection.cursor() as cursor:
-                cursor.execute(query, (codi_emp,))
-                result = cursor.fetchone()
-                
-            if not result:
-                self.stats['contabilidade_not_found'] += 1
-                return None
-                
-            cgce_emp = result[0]
-            documento_limpo = self.limpar_documento(cgce_emp)
-            
-            if not documento_limpo:
-                self.stats['contabilidade_not_found'] += 1
-                return None
-                
-            # Buscar contabilidade correta para essa empresa na data
-            contratos_empresa = historical_map.get(documento_limpo)
-            if not contratos_empresa:
-                self.stats['contabilidade_not_found'] += 1
-                return None
-
-            # Ordenar contratos por data de início para busca mais eficiente
-            contratos_ordenados = sorted(contratos_empresa, key=lambda x: x[0])
-            
-            for data_inicio, data_termino, contabilidade in contratos_ordenados:
-                if data_inicio and data_inicio <= event_date <= data_termino:
-                    self.stats['contabilidade_found'] += 1
-                    return contabilidade
-            
-            self.stats['contabilidade_not_found'] += 1
-            return None
-            
-        except Exception as e:
-            self.stats['errors'] += 1
-            self.stdout.write(self.style.ERROR(f'Erro ao buscar CNPJ/CPF para CODI_EMP {codi_emp}: {e}'))
-            return None
+        return self.get_contabilidade_for_date(historical_map, codi_emp, event_date)
 
     def limpar_documento(self, documento):
         """Remove caracteres não numéricos de uma string de documento."""
@@ -291,6 +1391,8 @@ class BaseETLCommand(BaseCommand):
         print(f"Consultas Sybase: {self.stats['sybase_queries']}")
         print(f"Contabilidades encontradas: {self.stats['contabilidade_found']}")
         print(f"Contabilidades não encontradas: {self.stats['contabilidade_not_found']}")
+        print(f"CODI_EMP sem CNPJ/CPF na GEEMPRE: {self.stats['codi_emp_sem_documento']}")
+        print(f"Snapshot do mapa histórico (hits/misses): {self.stats['snapshot_hits']}/{self.stats['snapshot_misses']}")
         print(f"Erros: {self.stats['errors']}")
         
         if self.stats['cache_hits'] + self.stats['cache_misses'] > 0:
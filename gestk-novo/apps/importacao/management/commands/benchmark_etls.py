@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from apps.importacao.sinteticos import gerar_base_sintetica
+
+FABRICA_STANDIN = 'apps.importacao.standin.conectar'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark dos ETLs contra o substituto local do Sybase (SQLite com dados sintéticos). '
+        'ATENÇÃO: os ETLs gravam no banco configurado em DATABASES; use um banco de testes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--etls',
+            default='etl_06_lancamentos',
+            help='Comandos de ETL separados por vírgula, executados em ordem (padrão: etl_06_lancamentos)',
+        )
+        parser.add_argument(
+            '--base',
+            help='Arquivo SQLite do substituto do Sybase (padrão: SYBASE_STANDIN_PATH)',
+        )
+        parser.add_argument(
+            '--gerar',
+            action='store_true',
+            help='(Re)gera a base sintética antes do benchmark (gerada também se não existir)',
+        )
+        parser.add_argument('--empresas', type=int, default=50, help='Empresas clientes na base sintética (padrão: 50)')
+        parser.add_argument('--anos', type=int, default=2, help='Anos de movimento na base sintética (padrão: 2)')
+        parser.add_argument(
+            '--lancamentos-dia',
+            type=int,
+            default=20,
+            help='Lançamentos por empresa por dia na base sintética (padrão: 20)',
+        )
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador (padrão: 42)')
+        parser.add_argument('--repeticoes', type=int, default=1, help='Execuções de cada ETL (padrão: 1)')
+        parser.add_argument('--saida', help='Arquivo JSON com os resultados (padrão: ETL_RELATORIOS_DIR/benchmark_<data>/benchmark.json)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Benchmark de ETLs (substituto local do Sybase) ---'))
+
+        etls = [nome.strip() for nome in options['etls'].split(',') if nome.strip()]
+        comandos = get_commands()
+        desconhecidos = [nome for nome in etls if nome not in comandos]
+        if desconhecidos:
+            raise CommandError(f"ETL(s) não encontrado(s): {', '.join(desconhecidos)}")
+
+        base = options['base'] or settings.SYBASE_STANDIN_PATH
+        if options['gerar'] or not os.path.exists(base):
+            self.stdout.write(f"\n[1/2] Gerando base sintética em {base}...")
+            os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+            inicio = time.perf_counter()
+            totais = gerar_base_sintetica(
+                base,
+                empresas=options['empresas'],
+                anos=options['anos'],
+                lancamentos_dia=options['lancamentos_dia'],
+                semente=options['semente'],
+            )
+            self.stdout.write(self.style.SUCCESS(f"✓ Base gerada em {time.perf_counter() - inicio:.1f}s"))
+            for tabela, linhas in totais.items():
+                self.stdout.write(f"  - {tabela}: {linhas:,}")
+        else:
+            self.stdout.write(f"\n[1/2] Usando a base existente {base}")
+
+        parametros = {}
+        if os.path.exists(f'{base}.json'):
+            with open(f'{base}.json', encoding='utf-8') as arquivo:
+                parametros = json.load(arquivo)
+
+        inicio_benchmark = datetime.now()
+        diretorio = os.path.join(settings.ETL_RELATORIOS_DIR, f"benchmark_{inicio_benchmark:%Y%m%d_%H%M%S}")
+        os.makedirs(diretorio, exist_ok=True)
+
+        # Processos filhos (ex.: etl_06 --workers) leem a configuração do ambiente
+        os.environ['SYBASE_CONNECTION_FACTORY'] = FABRICA_STANDIN
+        os.environ['SYBASE_STANDIN_PATH'] = base
+
+        self.stdout.write(f"\n[2/2] Executando {len(etls)} ETL(s) x {options['repeticoes']} repetição(ões)...")
+        resultados = []
+        with override_settings(SYBASE_CONNECTION_FACTORY=FABRICA_STANDIN, SYBASE_STANDIN_PATH=base):
+            for nome in etls:
+                for repeticao in range(1, options['repeticoes'] + 1):
+                    resultado = self.executar_etl(nome, repeticao, diretorio)
+                    resultados.append(resultado)
+                    estilo = self.style.SUCCESS if resultado['status'] == 'sucesso' else self.style.ERROR
+                    self.stdout.write(estilo(
+                        f"  {nome} #{repeticao}: {resultado['duracao_segundos']:.1f}s | "
+                        f"{resultado['linhas_sybase']:,} linhas | {resultado['linhas_por_segundo']:,.0f} linhas/s | "
+                        f"{resultado['orm_queries']:,} queries ORM"
+                        + (f" | erro: {resultado['erro']}" if resultado['erro'] else '')
+                    ))
+
+        caminho = options['saida'] or os.path.join(diretorio, 'benchmark.json')
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'inicio': inicio_benchmark.isoformat(),
+                'base': base,
+                'parametros_base': parametros,
+                'resultados': resultados,
+            }, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"\nResultados gravados em {caminho}"))
+
+    def executar_etl(self, nome, repeticao, diretorio):
+        """Executa um ETL em processo e extrai do relatório JSON dele as taxas do benchmark."""
+        comando = load_command_class(get_commands()[nome], nome)
+        comando.caminho_relatorio = os.path.join(diretorio, f"{nome}_{repeticao}.json")
+
+        # Checkpoints de execuções anteriores fariam o ETL pular dados
+        suportadas = {acao.dest for acao in comando.create_parser('manage.py', nome)._actions}
+        opcoes = {'reiniciar': True} if 'reiniciar' in suportadas else {}
+
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            call_command(comando, stdout=io.StringIO(), **opcoes)
+        except Exception as e:
+            erro = str(e)
+        duracao = time.perf_counter() - inicio
+
+        relatorio = getattr(comando, 'relatorio', None) or {}
+        linhas = relatorio.get('etapas', {}).get('sybase_fetch', {}).get('linhas', 0)
+        return {
+            'etl': nome,
+            'repeticao': repeticao,
+            'status': 'erro' if erro else relatorio.get('status', 'sucesso'),
+            'erro': erro,
+            'duracao_segundos': round(duracao, 3),
+            'linhas_sybase': linhas,
+            'linhas_por_segundo': round(linhas / duracao, 1) if duracao > 0 else 0,
+            'orm_queries': relatorio.get('orm_queries', 0),
+            'pico_rss_mb': relatorio.get('pico_rss_mb'),
+            'etapas': relatorio.get('etapas', {}),
+        }
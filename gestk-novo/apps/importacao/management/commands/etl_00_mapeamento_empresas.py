@@ -120,10 +120,7 @@ class Command(BaseETLCommand):
             return []
         
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [column[0] for column in cursor.description]
-                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            results = list(self.stream_query(connection, query))
             
             self.stdout.write(f'Encontradas {len(results)} empresas no Sybase')
             return results
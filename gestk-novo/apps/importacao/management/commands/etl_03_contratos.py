@@ -1,14 +1,35 @@
-from django.db import transaction
-from ._base import BaseETLCommand
+from ._base import BaseETLCommand, ETLPipeline
 from apps.core.models import Contabilidade
 from apps.pessoas.models import PessoaJuridica, PessoaFisica, Contrato
 from django.contrib.contenttypes.models import ContentType
-import re
+from django.utils import timezone
+from collections import Counter
+from itertools import islice
 from datetime import date
 
+# Campos do contrato comparados/regravados quando ele já existe
+CAMPOS_CONTRATO = (
+    'contabilidade_id', 'content_type_id', 'object_id', 'data_inicio', 'data_termino',
+    'dia_vencimento', 'valor_honorario', 'ativo',
+)
+
+
+def batch_iterator(iterator, batch_size):
+    """Itera sobre os dados em lotes de tamanho 'batch_size'."""
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
 class Command(BaseETLCommand):
     help = 'ETL 03 - Importação de Contratos e Pessoas (Físicas/Jurídicas) com dados específicos'
 
+    # Sem simple_history por save(); o histórico dos registros gravados em
+    # bulk é gerado com gravar_historico e cada lote vai para ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
@@ -26,11 +47,18 @@ class Command(BaseETLCommand):
             action='store_true',
             help='Apenas atualizar contratos existentes (não criar novos)',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Contratos por lote/transação (padrão: 1000)',
+        )
 
     def handle(self, *args, **options):
         self.dry_run = options['dry_run']
         self.limit = options['limit']
         self.update_only = options['update_only']
+        self.batch_size = options['batch_size']
         
         if self.dry_run:
             self.stdout.write(self.style.WARNING('MODO DRY-RUN: Nenhum dado será salvo no banco'))
@@ -38,10 +66,6 @@ class Command(BaseETLCommand):
         self.stdout.write(self.style.SUCCESS('=== ETL 04 - CONTRATOS E PESSOAS ==='))
         self.stdout.write('NOTA: Execute ETL 00 primeiro para garantir cobertura completa!')
         
-        # Construir mapa histórico para validação
-        self.stdout.write('\n[1] Construindo mapa histórico de contabilidades...')
-        historical_map = self.build_historical_contabilidade_map_cached()
-
         connection = self.get_sybase_connection()
         if not connection:
             return
@@ -78,29 +102,46 @@ class Command(BaseETLCommand):
         if self.limit:
             query = f"SELECT TOP {self.limit} * FROM ({query}) AS contratos"
 
-        self.stdout.write("\n[2] Extraindo dados de Contratos do Sybase...")
-        data = self.execute_query(connection, query)
-        connection.close()
+        self.stdout.write("\n[1] Extraindo dados de Contratos do Sybase...")
+        # Linhas lidas sob demanda; a conexão fica aberta até o fim do carregamento
+        data = self.stream_query(connection, query)
 
-        if not data:
-            self.stdout.write(self.style.WARNING('Nenhum contrato encontrado.'))
-            return
+        self.stdout.write("\n[2] Pré-carregando contabilidades e tipos de cliente...")
+        self.contabilidades_por_id_legado = dict(
+            Contabilidade.objects.filter(id_legado__isnull=False).values_list('id_legado', 'id')
+        )
+        self.content_types = {
+            model: ContentType.objects.get_for_model(model) for model in (PessoaJuridica, PessoaFisica)
+        }
+        self.stdout.write(f"✓ {len(self.contabilidades_por_id_legado):,} contabilidades carregadas")
 
-        self.stdout.write(f"{len(data)} contratos extraídos. Iniciando o carregamento...")
-        
-        total_contratos_criados = 0
-        total_contratos_atualizados = 0
-        total_pj_criadas = 0
-        total_pf_criadas = 0
-        total_erros = 0
+        stats = {
+            'contratos': 0, 'contratos_criados': 0, 'contratos_atualizados': 0, 'contratos_inalterados': 0,
+            'pj_criadas': 0, 'pj_atualizadas': 0, 'pf_criadas': 0, 'ignorados_update_only': 0, 'erros': 0,
+        }
+        pipeline = ETLPipeline(self)
 
-        try:
-            if not self.dry_run:
-                with transaction.atomic():
-                    self.processar_contratos(data, historical_map, total_contratos_criados, total_contratos_atualizados, total_pj_criadas, total_pf_criadas, total_erros)
+        def gravar(lote, _resultado):
+            if self.dry_run:
+                contagem = self.processar_lote(lote)
             else:
-                self.processar_contratos(data, historical_map, total_contratos_criados, total_contratos_atualizados, total_pj_criadas, total_pf_criadas, total_erros)
-                
+                with self.transacao():
+                    contagem = self.processar_lote(lote)
+            # Contadores somados só após o commit; um lote desfeito conta apenas em 'erros'
+            for chave, valor in contagem.items():
+                stats[chave] += valor
+            stats['contratos'] += len(lote)
+            self.stdout.write(f"Processados {stats['contratos']:,} contratos...")
+
+        def ao_erro(lote, e):
+            stats['erros'] += len(lote)
+            self.stdout.write(self.style.ERROR(
+                f"Erro no lote de contratos {self.id_legado_contrato(lote[0])} a {self.id_legado_contrato(lote[-1])}: {e}"
+            ))
+
+        self.stdout.write("\n[3] Gravando pessoas e contratos em lotes...")
+        try:
+            pipeline.executar(batch_iterator(data, self.batch_size), gravar, ao_erro=ao_erro)
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Ocorreu um erro durante o carregamento: {e}'))
             raise
@@ -110,99 +151,26 @@ class Command(BaseETLCommand):
                     self.close_sybase_connection()
                 except:
                     pass  # Ignorar erro se conexão já estiver fechada
+        self.stdout.write(pipeline.resumo())
 
-    def processar_contratos(self, data, historical_map, total_contratos_criados, total_contratos_atualizados, total_pj_criadas, total_pf_criadas, total_erros):
-        """Processa os contratos extraídos"""
-        for i, item in enumerate(data, 1):
-            if i % 100 == 0:
-                self.stdout.write(f"Processando contrato {i}/{len(data)}...")
-            
-            try:
-                documento_bruto = str(item.get('documento') or '').strip()
-                documento_limpo = re.sub(r'\D', '', documento_bruto)
-                
-                # Buscar contabilidade usando o mapa histórico
-                contabilidade = Contabilidade.objects.filter(id_legado=item.get('id_legado_contabilidade')).first()
-                if not contabilidade:
-                    self.stdout.write(self.style.WARNING(f"Contabilidade com ID Legado {item.get('id_legado_contabilidade')} não encontrada. Pulando contrato."))
-                    total_erros += 1
-                    continue
-                
-                # Buscar ou criar pessoa
-                cliente_obj = self.buscar_ou_criar_pessoa(item, documento_limpo)
-                if not cliente_obj:
-                    total_erros += 1
-                    continue
-                
-                # Verificar se pessoa foi criada
-                if hasattr(cliente_obj, 'cnpj'):
-                    if not PessoaJuridica.objects.filter(cnpj=documento_limpo).exists():
-                        total_pj_criadas += 1
-                    else:
-                        # Atualizar campos da PJ existente
-                        pj_existente = PessoaJuridica.objects.get(cnpj=documento_limpo)
-                        simples_emp = item.get('simples_emp')
-                        regime_tributario = None
-                        if simples_emp == 1:
-                            regime_tributario = '1'  # Simples Nacional
-                        elif simples_emp == 0:
-                            regime_tributario = '2'  # Lucro Presumido
-                        
-                        pj_existente.regime_tributario = regime_tributario
-                        pj_existente.simples_nacional = bool(simples_emp == 1)
-                        if item.get('rleg_emp'):
-                            pj_existente.responsavel_legal = str(item.get('rleg_emp')).strip()
-                        if item.get('cpf_responsavel'):
-                            pj_existente.cpf_responsavel = str(item.get('cpf_responsavel')).strip()
-                        pj_existente.save()
-                elif hasattr(cliente_obj, 'cpf'):
-                    if not PessoaFisica.objects.filter(cpf=documento_limpo).exists():
-                        total_pf_criadas += 1
-                
-                # Criar ou atualizar contrato
-                contrato_id_legado = f"{item.get('id_legado_contabilidade')}-{item.get('id_legado_contrato')}"
-                content_type = ContentType.objects.get_for_model(cliente_obj)
-
-                if not self.dry_run:
-                    contrato, created = Contrato.objects.update_or_create(
-                        id_legado=contrato_id_legado,
-                        defaults={
-                            'contabilidade': contabilidade,
-                            'content_type': content_type,
-                            'object_id': cliente_obj.id,
-                            'data_inicio': item.get('data_inicio_faturamento'),
-                            'data_termino': item.get('data_termino'),
-                            'dia_vencimento': item.get('dia_vencimento'),
-                            'valor_honorario': item.get('valor_contrato') or 0,
-                            'ativo': True,
-                        }
-                    )
-                    
-                    if created:
-                        total_contratos_criados += 1
-                    else:
-                        total_contratos_atualizados += 1
-                else:
-                    # Modo dry-run
-                    if Contrato.objects.filter(id_legado=contrato_id_legado).exists():
-                        total_contratos_atualizados += 1
-                    else:
-                        total_contratos_criados += 1
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Erro ao processar contrato {i}: {e}'))
-                total_erros += 1
-                continue
+        if not stats['contratos']:
+            self.stdout.write(self.style.WARNING('Nenhum contrato encontrado.'))
+            return
 
         # Relatório final
+        self.stdout.write(f"{stats['contratos']} contratos extraídos e processados.")
         self.stdout.write('\n' + '='*60)
         self.stdout.write(self.style.SUCCESS('RELATÓRIO FINAL - ETL 04'))
         self.stdout.write('='*60)
-        self.stdout.write(f'Pessoas Jurídicas criadas: {total_pj_criadas}')
-        self.stdout.write(f'Pessoas Físicas criadas: {total_pf_criadas}')
-        self.stdout.write(f'Contratos criados: {total_contratos_criados}')
-        self.stdout.write(f'Contratos atualizados: {total_contratos_atualizados}')
-        self.stdout.write(f'Erros: {total_erros}')
+        self.stdout.write(f"Pessoas Jurídicas criadas: {stats['pj_criadas']}")
+        self.stdout.write(f"Pessoas Jurídicas atualizadas: {stats['pj_atualizadas']}")
+        self.stdout.write(f"Pessoas Físicas criadas: {stats['pf_criadas']}")
+        self.stdout.write(f"Contratos criados: {stats['contratos_criados']}")
+        self.stdout.write(f"Contratos atualizados: {stats['contratos_atualizados']}")
+        self.stdout.write(f"Contratos inalterados: {stats['contratos_inalterados']}")
+        if self.update_only:
+            self.stdout.write(f"Contratos novos ignorados (--update-only): {stats['ignorados_update_only']}")
+        self.stdout.write(f"Erros: {stats['erros']}")
         
         # Estatísticas de performance
         self.print_stats()
@@ -211,48 +179,168 @@ class Command(BaseETLCommand):
         self.stdout.write(self.style.SUCCESS('ETL 04 CONCLUÍDO COM SUCESSO!'))
         self.stdout.write('='*60)
 
-    def buscar_ou_criar_pessoa(self, item, documento_limpo):
-        """Busca ou cria pessoa baseada no documento"""
-        if len(documento_limpo) == 14:
-            # Pessoa Jurídica
-            # Determinar regime tributário baseado no simples_emp
-            simples_emp = item.get('simples_emp')
-            regime_tributario = None
-            if simples_emp == 1:
-                regime_tributario = '1'  # Simples Nacional
-            elif simples_emp == 0:
-                regime_tributario = '2'  # Lucro Presumido (assumindo)
-            
-            pj, created = PessoaJuridica.objects.get_or_create(
-                cnpj=documento_limpo,
-                defaults={
-                    'id_legado': item.get('id_legado_cliente'),
-                    'razao_social': str(item.get('nome_razao_social') or '').strip(),
-                    'nome_fantasia': str(item.get('fantasia_emp') or '').strip(),
-                }
-            )
-            
-            # Sempre atualizar os campos de regime tributário
-            pj.regime_tributario = regime_tributario
-            pj.simples_nacional = bool(simples_emp == 1)
-            if item.get('rleg_emp'):
-                pj.responsavel_legal = str(item.get('rleg_emp')).strip()
-            pj.save()
-            
-            return pj
-        
-        elif len(documento_limpo) == 11:
-            # Pessoa Física
-            pf, created = PessoaFisica.objects.get_or_create(
-                cpf=documento_limpo,
-                defaults={
-                    'id_legado': item.get('id_legado_cliente'),
-                    'nome_completo': str(item.get('nome_razao_social') or '').strip(),
-                }
-            )
-            return pf
-        
-        else:
-            self.stdout.write(self.style.WARNING(f"Documento inválido '{documento_limpo}' para o cliente {item.get('id_legado_cliente')}. Pulando contrato."))
-            return None
+    def id_legado_contrato(self, item):
+        return f"{item.get('id_legado_contabilidade')}-{item.get('id_legado_contrato')}"
+
+    def processar_lote(self, lote):
+        """
+        Processa um lote de contratos: pessoas do lote em uma consulta por
+        tipo (in_bulk pelo documento), bulk_create das que faltam,
+        bulk_update das PJs alteradas e upsert dos contratos pelo id_legado.
+        Só registros que mudaram recebem updated_at (a versão do snapshot
+        da Regra de Ouro muda apenas quando um contrato muda).
+        Não usa CopyLoader: gravar_historico precisa das instâncias criadas e
+        alteradas, e --update-only não pode inserir contratos novos.
+        Retorna os contadores do lote.
+        """
+        stats = Counter()
+        agora = timezone.now()
+        linhas = []
+        for item in lote:
+            documento_limpo = self.limpar_documento(item.get('documento'))
+            contabilidade_id = self.contabilidades_por_id_legado.get(item.get('id_legado_contabilidade'))
+            if not contabilidade_id:
+                self.stdout.write(self.style.WARNING(f"Contabilidade com ID Legado {item.get('id_legado_contabilidade')} não encontrada. Pulando contrato."))
+                stats['erros'] += 1
+                continue
+            if len(documento_limpo) not in (11, 14):
+                self.stdout.write(self.style.WARNING(f"Documento inválido '{documento_limpo}' para o cliente {item.get('id_legado_cliente')}. Pulando contrato."))
+                stats['erros'] += 1
+                continue
+            linhas.append((item, documento_limpo, contabilidade_id))
+
+        pessoas = self.resolver_pessoas(linhas, agora, stats)
+
+        contratos = {}
+        for item, documento_limpo, contabilidade_id in linhas:
+            cliente = pessoas[documento_limpo]
+            contratos[self.id_legado_contrato(item)] = {
+                'contabilidade_id': contabilidade_id,
+                'content_type_id': self.content_types[type(cliente)].id,
+                'object_id': cliente.id,
+                'data_inicio': item.get('data_inicio_faturamento'),
+                'data_termino': item.get('data_termino'),
+                'dia_vencimento': item.get('dia_vencimento'),
+                'valor_honorario': item.get('valor_contrato') or 0,
+                'ativo': True,
+            }
+
+        existentes = {
+            contrato.id_legado: contrato
+            for contrato in Contrato.objects.filter(id_legado__in=list(contratos))
+        }
+        novos, alterados = [], []
+        for id_legado, campos in contratos.items():
+            contrato = existentes.get(id_legado)
+            if contrato is None:
+                if self.update_only:
+                    stats['ignorados_update_only'] += 1
+                    continue
+                novos.append(Contrato(id_legado=id_legado, **campos))
+            elif any(getattr(contrato, campo) != valor for campo, valor in campos.items()):
+                for campo, valor in campos.items():
+                    setattr(contrato, campo, valor)
+                contrato.updated_at = agora
+                alterados.append(contrato)
+
+        stats['contratos_criados'] += len(novos)
+        stats['contratos_atualizados'] += len(alterados)
+        inalterados = len(existentes) - len(alterados)
+        stats['contratos_inalterados'] += inalterados
+
+        if self.dry_run:
+            return stats
+        if novos:
+            Contrato.objects.bulk_create(novos, batch_size=1000)
+        if alterados:
+            Contrato.objects.bulk_update(alterados, [*CAMPOS_CONTRATO, 'updated_at'], batch_size=500)
+        self.gravar_historico(Contrato, criados=novos, alterados=alterados)
+        self.registrar_lote(
+            Contrato, self.id_legado_contrato(lote[0]), self.id_legado_contrato(lote[-1]),
+            len(novos), len(alterados), inalterados,
+        )
+        return stats
+
+    def resolver_pessoas(self, linhas, agora, stats):
+        """
+        Retorna {documento: PessoaJuridica/PessoaFisica} para as linhas do lote.
+        Carrega as existentes com uma consulta por tipo, cria as ausentes com
+        bulk_create e regrava os dados tributários das PJs que mudaram.
+        """
+        dados_pj, dados_pf = {}, {}
+        for item, documento_limpo, _contabilidade_id in linhas:
+            # A última linha de cada documento prevalece, como nas gravações por linha
+            (dados_pj if len(documento_limpo) == 14 else dados_pf)[documento_limpo] = item
+
+        pessoas = {}
+        pj_existentes = PessoaJuridica.objects.in_bulk(list(dados_pj), field_name='cnpj')
+        pj_novas, pj_alteradas = [], []
+        for cnpj, item in dados_pj.items():
+            campos = self.campos_tributarios_pj(item)
+            pj = pj_existentes.get(cnpj)
+            if pj is None:
+                pj = PessoaJuridica(
+                    cnpj=cnpj,
+                    id_legado=item.get('id_legado_cliente'),
+                    razao_social=str(item.get('nome_razao_social') or '').strip(),
+                    nome_fantasia=str(item.get('fantasia_emp') or '').strip(),
+                    **campos,
+                )
+                pj_novas.append(pj)
+            elif any(getattr(pj, campo) != valor for campo, valor in campos.items()):
+                for campo, valor in campos.items():
+                    setattr(pj, campo, valor)
+                pj.updated_at = agora
+                pj_alteradas.append(pj)
+            pessoas[cnpj] = pj
+
+        pf_existentes = PessoaFisica.objects.in_bulk(list(dados_pf), field_name='cpf')
+        pf_novas = []
+        for cpf, item in dados_pf.items():
+            pf = pf_existentes.get(cpf)
+            if pf is None:
+                pf = PessoaFisica(
+                    cpf=cpf,
+                    id_legado=item.get('id_legado_cliente'),
+                    nome_completo=str(item.get('nome_razao_social') or '').strip(),
+                )
+                pf_novas.append(pf)
+            pessoas[cpf] = pf
+
+        stats['pj_criadas'] += len(pj_novas)
+        stats['pj_atualizadas'] += len(pj_alteradas)
+        stats['pf_criadas'] += len(pf_novas)
+
+        if not self.dry_run:
+            if pj_novas:
+                PessoaJuridica.objects.bulk_create(pj_novas, batch_size=1000)
+            if pj_alteradas:
+                PessoaJuridica.objects.bulk_update(
+                    pj_alteradas, ['regime_tributario', 'simples_nacional', 'responsavel_legal', 'cpf_responsavel', 'updated_at'],
+                    batch_size=500,
+                )
+            if pf_novas:
+                PessoaFisica.objects.bulk_create(pf_novas, batch_size=1000)
+            self.gravar_historico(PessoaJuridica, criados=pj_novas, alterados=pj_alteradas)
+            self.gravar_historico(PessoaFisica, criados=pf_novas)
+        return pessoas
+
+    def campos_tributarios_pj(self, item):
+        """Campos da PJ regravados a cada execução a partir da GEEMPRE."""
+        simples_emp = item.get('simples_emp')
+        regime_tributario = None
+        if simples_emp == 1:
+            regime_tributario = '1'  # Simples Nacional
+        elif simples_emp == 0:
+            regime_tributario = '2'  # Lucro Presumido (assumindo)
 
+        campos = {
+            'regime_tributario': regime_tributario,
+            'simples_nacional': bool(simples_emp == 1),
+        }
+        # Responsável só é sobrescrito quando informado no legado
+        if item.get('rleg_emp'):
+            campos['responsavel_legal'] = str(item.get('rleg_emp')).strip()
+        if item.get('cpf_responsavel'):
+            campos['cpf_responsavel'] = str(item.get('cpf_responsavel')).strip()
+        return campos
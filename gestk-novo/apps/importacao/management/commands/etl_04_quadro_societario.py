@@ -10,20 +10,48 @@ Importa informações do quadro societário das empresas incluindo:
 Aplicação da regra de ouro para mapeamento multitenant via CNPJ.
 """
 
-from django.db import transaction
-from ._base import BaseETLCommand
+from ._base import BaseETLCommand, ETLPipeline
 from apps.core.models import Contabilidade
 from apps.pessoas.models import PessoaJuridica, PessoaFisica
 from apps.pessoas.models_quadro_societario import QuadroSocietario, CapitalSocial
+from apps.importacao.loaders import CopyLoader
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 import re
+from collections import Counter
 from datetime import date
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from itertools import groupby, islice
+
+# Campos de endereço da empresa: (campo da PessoaJuridica, coluna da GEEMPRE);
+# só são preenchidos quando estão vazios no Gestk
+CAMPOS_ENDERECO = (
+    ('endereco', 'ende_emp'),
+    ('numero', 'nume_emp'),
+    ('bairro', 'bair_emp'),
+    ('cidade', 'geempre_cidade'),
+    ('uf', 'esta_emp'),
+    ('cep', 'cepe_emp'),
+    ('inscricao_municipal', 'imun_emp'),
+)
+
+
+def batch_iterator(iterator, batch_size):
+    """Itera sobre os dados em lotes de tamanho 'batch_size'."""
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        yield batch
 
 
 class Command(BaseETLCommand):
     help = 'ETL 21 - Importação do Quadro Societário das Empresas com Sócios e Participações'
 
+    # Sem simple_history por save(); o histórico das pessoas gravadas em bulk
+    # é gerado com gravar_historico e cada lote vai para ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
@@ -47,12 +75,19 @@ class Command(BaseETLCommand):
             default='2019-01-01',
             help='Data de início para importação (formato: YYYY-MM-DD)',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Empresas por lote/transação (padrão: 200)',
+        )
 
     def handle(self, *args, **options):
         self.dry_run = options['dry_run']
         self.limit = options['limit']
         self.update_only = options['update_only']
         self.data_inicio = options['data_inicio']
+        self.batch_size = options['batch_size']
         
         if self.dry_run:
             self.stdout.write(self.style.WARNING('MODO DRY-RUN: Nenhum dado será salvo no banco'))
@@ -112,33 +147,27 @@ class Command(BaseETLCommand):
             query = f"SELECT TOP {self.limit} * FROM ({query}) AS quadro_societario"
 
         self.stdout.write("\n[2] Extraindo dados do Quadro Societário do Sybase...")
-        data = self.execute_query(connection, query)
-        connection.close()
-
-        if not data:
-            self.stdout.write(self.style.WARNING('Nenhum registro de quadro societário encontrado.'))
-            return
-
-        self.stdout.write(f"{len(data)} registros de quadro societário extraídos. Iniciando o carregamento...")
+        # Linhas lidas sob demanda; a conexão fica aberta até o fim do carregamento
+        data = self.stream_query(connection, query)
         
         # Estatísticas
         stats = {
             'empresas_processadas': 0,
+            'socios_processados': 0,
             'socios_criados': 0,
             'socios_atualizados': 0,
+            'socios_inalterados': 0,
             'empresas_atualizadas': 0,
+            'capitais_gravados': 0,
             'erros': 0,
             'socios_pf_criados': 0,
             'socios_pj_criados': 0,
+            'ignorados_update_only': 0,
         }
 
         try:
-            if not self.dry_run:
-                with transaction.atomic():
-                    self.processar_quadro_societario(data, historical_map, stats)
-            else:
-                self.processar_quadro_societario(data, historical_map, stats)
-                
+            self.processar_quadro_societario(data, historical_map, stats)
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Ocorreu um erro durante o carregamento: {e}'))
             raise
@@ -153,197 +182,242 @@ class Command(BaseETLCommand):
         self.gerar_relatorio_final(stats)
 
     def processar_quadro_societario(self, data, historical_map, stats):
-        """Processa os dados do quadro societário"""
-        
-        # Agrupar dados por empresa (codi_emp)
-        empresas_data = {}
-        for item in data:
-            codi_emp = item.get('codi_emp')
-            if codi_emp not in empresas_data:
-                empresas_data[codi_emp] = {
-                    'dados_empresa': item,
-                    'socios': []
-                }
-            empresas_data[codi_emp]['socios'].append(item)
-        
-        self.stdout.write(f"Processando {len(empresas_data)} empresas com quadro societário...")
-        
-        for i, (codi_emp, empresa_data) in enumerate(empresas_data.items(), 1):
-            if i % 50 == 0:
-                self.stdout.write(f"Processando empresa {i}/{len(empresas_data)}...")
-            
-            try:
-                self.processar_empresa_quadro_societario(empresa_data, historical_map, stats)
-                stats['empresas_processadas'] += 1
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Erro ao processar empresa {codi_emp}: {e}'))
+        """
+        Agrupa a extração por empresa (a query é ordenada por codi_emp) e grava
+        lotes de --batch-size empresas, cada um em uma transação.
+        """
+        self.content_types = {
+            model: ContentType.objects.get_for_model(model) for model in (PessoaJuridica, PessoaFisica)
+        }
+        empresas = (
+            (codi_emp, list(socios))
+            for codi_emp, socios in groupby(data, key=lambda item: item.get('codi_emp'))
+        )
+        pipeline = ETLPipeline(self)
+
+        def gravar(lote, _resultado):
+            if self.dry_run:
+                contagem = self.processar_lote(lote)
+            else:
+                with self.transacao():
+                    contagem = self.processar_lote(lote)
+            # Contadores somados só após o commit; um lote desfeito conta apenas em 'erros'
+            for chave, valor in contagem.items():
+                stats[chave] += valor
+            stats['empresas_processadas'] += len(lote)
+            self.stdout.write(f"Processadas {stats['empresas_processadas']:,} empresas...")
+
+        def ao_erro(lote, e):
+            stats['erros'] += len(lote)
+            self.stdout.write(self.style.ERROR(f'Erro no lote de empresas {lote[0][0]} a {lote[-1][0]}: {e}'))
+
+        pipeline.executar(
+            batch_iterator(empresas, self.batch_size), gravar, ao_erro=ao_erro,
+            linhas_do_lote=lambda lote: sum(len(socios) for _, socios in lote),
+        )
+        self.stdout.write(pipeline.resumo())
+
+        if not pipeline.lotes:
+            self.stdout.write(self.style.WARNING('Nenhum registro de quadro societário encontrado.'))
+        else:
+            self.stdout.write(f"{stats['empresas_processadas']} empresas com quadro societário processadas.")
+
+    def processar_lote(self, lote):
+        """
+        Processa um lote de empresas [(codi_emp, linhas)]:
+        - empresas e sócios resolvidos com uma consulta por tipo de pessoa
+          (in_bulk por CNPJ/CPF); sócios ausentes criados com bulk_create
+        - endereço das empresas: bulk_update apenas das que mudaram
+        - QuadroSocietario e CapitalSocial: um upsert (CopyLoader) cada
+        Com --update-only nada é criado: sócios sem cadastro e linhas novas de
+        quadro/capital são ignorados. Retorna os contadores do lote.
+        """
+        stats = Counter()
+        empresas = []
+        for codi_emp, socios in lote:
+            cnpj_empresa = self.limpar_documento(socios[0].get('cgce_emp'))
+            if not cnpj_empresa:
+                self.stdout.write(self.style.WARNING(f"CNPJ inválido para empresa {codi_emp}. Pulando."))
                 stats['erros'] += 1
                 continue
+            empresas.append((cnpj_empresa, socios))
 
-    def processar_empresa_quadro_societario(self, empresa_data, historical_map, stats):
-        """Processa uma empresa específica e seu quadro societário"""
-        
-        dados_empresa = empresa_data['dados_empresa']
-        socios = empresa_data['socios']
-        
-        # 1. Buscar empresa no banco pelo CNPJ
-        cnpj_empresa = self.limpar_documento(dados_empresa.get('cgce_emp'))
-        if not cnpj_empresa:
-            self.stdout.write(self.style.WARNING(f"CNPJ inválido para empresa {dados_empresa.get('codi_emp')}. Pulando."))
-            stats['erros'] += 1
-            return
-        
-        # Buscar empresa usando regra de ouro
-        empresa = self.buscar_empresa_por_cnpj(cnpj_empresa, historical_map)
-        if not empresa:
-            self.stdout.write(self.style.WARNING(f"Empresa com CNPJ {cnpj_empresa} não encontrada. Pulando."))
-            stats['erros'] += 1
-            return
-        
-        # 2. Atualizar dados da empresa (endereço)
-        if not self.dry_run:
-            self.atualizar_dados_empresa(empresa, dados_empresa)
-            stats['empresas_atualizadas'] += 1
-        
-        # 3. Criar capital social
-        self.criar_capital_social(empresa, dados_empresa)
-        
-        # 4. Processar sócios
-        for socio_data in socios:
-            try:
-                self.processar_socio(socio_data, empresa, stats)
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Erro ao processar sócio {socio_data.get("i_socio")}: {e}'))
+        # Sócios válidos do lote: {documento: primeira linha}, como no get_or_create por linha
+        socios_pf, socios_pj = {}, {}
+        for _cnpj_empresa, socios in empresas:
+            for socio_data in socios:
+                inscricao = self.limpar_documento(socio_data.get('inscricao'))
+                nome = str(socio_data.get('nome') or '').strip()
+                if not inscricao or not nome:
+                    continue
+                (socios_pf if len(inscricao) == 11 else socios_pj).setdefault(inscricao, socio_data)
+
+        pessoas_pj = PessoaJuridica.objects.in_bulk(
+            list({cnpj for cnpj, _ in empresas} | set(socios_pj)), field_name='cnpj'
+        )
+        pessoas_pf = PessoaFisica.objects.in_bulk(list(socios_pf), field_name='cpf')
+
+        # 1. Sócios ausentes
+        novas_pf, novas_pj = [], []
+        if self.update_only:
+            stats['ignorados_update_only'] += sum(1 for cpf in socios_pf if cpf not in pessoas_pf)
+            stats['ignorados_update_only'] += sum(1 for cnpj in socios_pj if cnpj not in pessoas_pj)
+        else:
+            novas_pf = [
+                PessoaFisica(cpf=cpf, id_legado=socio_data.get('i_socio'), nome_completo=str(socio_data.get('nome')).strip())
+                for cpf, socio_data in socios_pf.items() if cpf not in pessoas_pf
+            ]
+            novas_pj = [
+                PessoaJuridica(cnpj=cnpj, id_legado=socio_data.get('i_socio'), razao_social=str(socio_data.get('nome')).strip())
+                for cnpj, socio_data in socios_pj.items() if cnpj not in pessoas_pj
+            ]
+        pessoas_pf.update((pessoa.cpf, pessoa) for pessoa in novas_pf)
+        pessoas_pj.update((pessoa.cnpj, pessoa) for pessoa in novas_pj)
+        stats['socios_pf_criados'] += len(novas_pf)
+        stats['socios_pj_criados'] += len(novas_pj)
+
+        # 2. Endereço das empresas, 3. quadro e 4. capital
+        agora = timezone.now()
+        empresas_alteradas, campos_alterados = {}, set()
+        quadro, capitais = [], []
+        for cnpj_empresa, socios in empresas:
+            dados_empresa = socios[0]
+            empresa = pessoas_pj.get(cnpj_empresa)
+            if empresa is None or empresa._state.adding:
+                # Empresa só cadastrada agora como sócia não conta: precisa vir do ETL de contratos
+                self.stdout.write(self.style.WARNING(f"Empresa com CNPJ {cnpj_empresa} não encontrada. Pulando."))
                 stats['erros'] += 1
                 continue
 
-    def buscar_empresa_por_cnpj(self, cnpj, historical_map):
-        """Busca empresa pelo CNPJ usando regra de ouro"""
-        try:
-            # Buscar diretamente na tabela PessoaJuridica
-            empresa = PessoaJuridica.objects.filter(cnpj=cnpj).first()
-            if empresa:
-                return empresa
-            
-            # Se não encontrou, tentar criar usando dados do Sybase
-            # (Isso seria necessário se a empresa não foi importada no ETL 04)
-            self.stdout.write(self.style.WARNING(f"Empresa com CNPJ {cnpj} não encontrada. Seria necessário criar via ETL 04 primeiro."))
-            return None
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao buscar empresa por CNPJ {cnpj}: {e}'))
-            return None
+            alterados = self.atualizar_dados_empresa(empresa, dados_empresa)
+            if alterados:
+                empresa.updated_at = agora
+                empresas_alteradas[empresa.pk] = empresa
+                campos_alterados.update(alterados)
 
-    def processar_socio(self, socio_data, empresa, stats):
-        """Processa um sócio específico"""
-        
+            valor_capital = self.converter_decimal(dados_empresa.get('capital_social'))
+            if valor_capital:
+                capitais.append({
+                    'empresa_id': empresa.id,
+                    'data_referencia': date.today(),
+                    'fonte': 'QUADRO_SOCIETARIO',
+                    'valor_capital': valor_capital,
+                })
+
+            for socio_data in socios:
+                socio = self.resolver_socio(socio_data, pessoas_pf, pessoas_pj, stats)
+                if socio is None:
+                    continue
+                quadro.append(self.linha_quadro_societario(socio, empresa, socio_data))
+
+        if self.update_only:
+            quadro = self.somente_existentes(QuadroSocietario, quadro, ('empresa_id', 'content_type_id', 'object_id'), stats)
+            capitais = self.somente_existentes(CapitalSocial, capitais, ('empresa_id', 'data_referencia', 'fonte'), stats)
+
+        stats['empresas_atualizadas'] += len(empresas_alteradas)
+        stats['socios_processados'] += len(quadro)
+        if self.dry_run:
+            return stats
+
+        if novas_pf:
+            PessoaFisica.objects.bulk_create(novas_pf, batch_size=1000)
+        if novas_pj:
+            PessoaJuridica.objects.bulk_create(novas_pj, batch_size=1000)
+        if empresas_alteradas:
+            PessoaJuridica.objects.bulk_update(
+                list(empresas_alteradas.values()), sorted(campos_alterados) + ['updated_at'], batch_size=500
+            )
+        self.gravar_historico(PessoaFisica, criados=novas_pf)
+        self.gravar_historico(PessoaJuridica, criados=novas_pj, alterados=list(empresas_alteradas.values()))
+
+        resultado = CopyLoader(
+            QuadroSocietario,
+            chave=('empresa', 'content_type', 'object_id'),
+            campos=('participacao_percentual', 'quantidade_quotas', 'id_legado_socio', 'id_legado_empresa', 'ativo'),
+        ).carregar(quadro)
+        stats['socios_criados'] += resultado.criados
+        stats['socios_atualizados'] += resultado.atualizados
+        stats['socios_inalterados'] += resultado.inalterados
+        self.registrar_lote(QuadroSocietario, lote[0][0], lote[-1][0], *resultado)
+
+        if capitais:
+            resultado = CopyLoader(
+                CapitalSocial, chave=('empresa', 'data_referencia', 'fonte'), campos=('valor_capital',),
+            ).carregar(capitais)
+            stats['capitais_gravados'] += resultado.criados + resultado.atualizados
+        return stats
+
+    def somente_existentes(self, model, linhas, chave, stats):
+        """--update-only: mantém só as linhas cuja chave já existe no banco (uma consulta por lote)."""
+        if not linhas:
+            return linhas
+        existentes = set(
+            model.objects.filter(empresa_id__in={linha['empresa_id'] for linha in linhas}).values_list(*chave)
+        )
+        mantidas = [linha for linha in linhas if tuple(linha[campo] for campo in chave) in existentes]
+        stats['ignorados_update_only'] += len(linhas) - len(mantidas)
+        return mantidas
+
+    def resolver_socio(self, socio_data, pessoas_pf, pessoas_pj, stats):
+        """Sócio (PF ou PJ) da linha, a partir das pessoas já resolvidas do lote, ou None."""
         inscricao = self.limpar_documento(socio_data.get('inscricao'))
         nome = str(socio_data.get('nome') or '').strip()
-        
+
         if not inscricao or not nome:
             self.stdout.write(self.style.WARNING(f"Sócio com dados inválidos: inscrição='{inscricao}', nome='{nome}'. Pulando."))
             stats['erros'] += 1
-            return
-        
-        # Determinar se é PF ou PJ baseado no tamanho da inscrição
-        if len(inscricao) == 11:
-            # Pessoa Física
-            socio = self.buscar_ou_criar_pessoa_fisica(inscricao, nome, socio_data)
-            if socio:
-                stats['socios_pf_criados'] += 1
-        elif len(inscricao) == 14:
-            # Pessoa Jurídica
-            socio = self.buscar_ou_criar_pessoa_juridica(inscricao, nome, socio_data)
-            if socio:
-                stats['socios_pj_criados'] += 1
-        else:
-            self.stdout.write(self.style.WARNING(f"Inscrição inválida '{inscricao}' para sócio {nome}. Pulando."))
-            stats['erros'] += 1
-            return
-        
-        if not socio:
-            stats['erros'] += 1
-            return
-        
-        # Criar relacionamento sócio-empresa no quadro societário
-        self.criar_quadro_societario(socio, empresa, socio_data, stats)
-
-    def buscar_ou_criar_pessoa_fisica(self, cpf, nome, socio_data):
-        """Busca ou cria pessoa física"""
-        try:
-            if not self.dry_run:
-                pessoa, created = PessoaFisica.objects.get_or_create(
-                    cpf=cpf,
-                    defaults={
-                        'id_legado': socio_data.get('i_socio'),
-                        'nome_completo': nome,
-                    }
-                )
-                return pessoa
-            else:
-                # Modo dry-run: verificar se existe
-                if PessoaFisica.objects.filter(cpf=cpf).exists():
-                    return PessoaFisica.objects.filter(cpf=cpf).first()
-                else:
-                    return PessoaFisica(cpf=cpf, nome_completo=nome)  # Objeto temporário
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao criar/buscar PF {cpf}: {e}'))
             return None
 
-    def buscar_ou_criar_pessoa_juridica(self, cnpj, nome, socio_data):
-        """Busca ou cria pessoa jurídica"""
+        # Determinar se é PF ou PJ baseado no tamanho da inscrição; com
+        # --update-only o sócio sem cadastro não está no mapa (None)
+        return pessoas_pf.get(inscricao) if len(inscricao) == 11 else pessoas_pj.get(inscricao)
+
+    def linha_quadro_societario(self, socio, empresa, socio_data):
+        """Linha de QuadroSocietario (dict) para o CopyLoader"""
+        # Converter quantidade de quotas
+        qdade_quotas = socio_data.get('qdade_quotas')
+        quantidade_quotas = None
+        if qdade_quotas:
+            try:
+                quantidade_quotas = int(qdade_quotas)
+            except (ValueError, TypeError):
+                pass
+
+        return {
+            'empresa_id': empresa.id,
+            'content_type_id': self.content_types[type(socio)].id,
+            'object_id': socio.id,
+            'participacao_percentual': self.converter_decimal(socio_data.get('participacao')),
+            'quantidade_quotas': quantidade_quotas,
+            'id_legado_socio': socio_data.get('i_socio'),
+            'id_legado_empresa': socio_data.get('codi_emp'),
+            'ativo': True,
+        }
+
+    def converter_decimal(self, valor):
+        """Decimal do valor do legado; None para vazio/zero ou inválido"""
+        if not valor:
+            return None
         try:
-            if not self.dry_run:
-                pessoa, created = PessoaJuridica.objects.get_or_create(
-                    cnpj=cnpj,
-                    defaults={
-                        'id_legado': socio_data.get('i_socio'),
-                        'razao_social': nome,
-                    }
-                )
-                return pessoa
-            else:
-                # Modo dry-run: verificar se existe
-                if PessoaJuridica.objects.filter(cnpj=cnpj).exists():
-                    return PessoaJuridica.objects.filter(cnpj=cnpj).first()
-                else:
-                    return PessoaJuridica(cnpj=cnpj, razao_social=nome)  # Objeto temporário
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao criar/buscar PJ {cnpj}: {e}'))
+            return Decimal(str(valor))
+        except (InvalidOperation, ValueError, TypeError):
             return None
 
     def atualizar_dados_empresa(self, empresa, dados_empresa):
-        """Atualiza dados da empresa com informações do quadro societário"""
-        try:
-            # Atualizar endereço se não estiver preenchido
-            if not empresa.endereco and dados_empresa.get('ende_emp'):
-                empresa.endereco = str(dados_empresa.get('ende_emp', '')).strip()
-            
-            if not empresa.numero and dados_empresa.get('nume_emp'):
-                empresa.numero = str(dados_empresa.get('nume_emp', '')).strip()
-            
-            if not empresa.bairro and dados_empresa.get('bair_emp'):
-                empresa.bairro = str(dados_empresa.get('bair_emp', '')).strip()
-            
-            if not empresa.cidade and dados_empresa.get('geempre_cidade'):
-                empresa.cidade = str(dados_empresa.get('geempre_cidade', '')).strip()
-            
-            if not empresa.uf and dados_empresa.get('esta_emp'):
-                empresa.uf = str(dados_empresa.get('esta_emp', '')).strip()
-            
-            if not empresa.cep and dados_empresa.get('cepe_emp'):
-                cep = str(dados_empresa.get('cepe_emp', '')).strip()
-                empresa.cep = self.formatar_cep(cep)
-            
-            if not empresa.inscricao_municipal and dados_empresa.get('imun_emp'):
-                empresa.inscricao_municipal = str(dados_empresa.get('imun_emp', '')).strip()
-            
-            # Salvar alterações
-            empresa.save()
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao atualizar dados da empresa {empresa.cnpj}: {e}'))
+        """
+        Preenche os campos de endereço vazios da empresa com os dados da
+        GEEMPRE (sem gravar). Retorna os nomes dos campos alterados.
+        """
+        alterados = []
+        for campo, coluna in CAMPOS_ENDERECO:
+            valor = str(dados_empresa.get(coluna) or '').strip()
+            if getattr(empresa, campo) or not valor:
+                continue
+            if campo == 'cep':
+                valor = self.formatar_cep(valor)
+            setattr(empresa, campo, valor)
+            alterados.append(campo)
+        return alterados
 
     def limpar_documento(self, documento):
         """Limpa e valida documento (CPF/CNPJ)"""
@@ -370,91 +444,6 @@ class Command(BaseETLCommand):
         
         return cep_limpo
 
-    def criar_quadro_societario(self, socio, empresa, socio_data, stats):
-        """Cria registro no quadro societário"""
-        try:
-            if not self.dry_run:
-                # Obter ContentType do sócio
-                content_type = ContentType.objects.get_for_model(socio)
-                
-                # Converter participação para decimal
-                participacao = socio_data.get('participacao')
-                participacao_decimal = None
-                if participacao:
-                    try:
-                        participacao_decimal = Decimal(str(participacao))
-                    except (ValueError, TypeError):
-                        pass
-                
-                # Converter quantidade de quotas
-                qdade_quotas = socio_data.get('qdade_quotas')
-                quantidade_quotas = None
-                if qdade_quotas:
-                    try:
-                        quantidade_quotas = int(qdade_quotas)
-                    except (ValueError, TypeError):
-                        pass
-                
-                # Criar ou atualizar quadro societário
-                quadro, created = QuadroSocietario.objects.update_or_create(
-                    empresa=empresa,
-                    content_type=content_type,
-                    object_id=socio.id,
-                    defaults={
-                        'participacao_percentual': participacao_decimal,
-                        'quantidade_quotas': quantidade_quotas,
-                        'id_legado_socio': socio_data.get('i_socio'),
-                        'id_legado_empresa': socio_data.get('codi_emp'),
-                        'ativo': True,
-                    }
-                )
-                
-                if created:
-                    stats['socios_criados'] += 1
-                else:
-                    stats['socios_atualizados'] += 1
-            else:
-                # Modo dry-run: apenas contar
-                if QuadroSocietario.objects.filter(
-                    empresa=empresa,
-                    content_type=ContentType.objects.get_for_model(socio),
-                    object_id=socio.id
-                ).exists():
-                    stats['socios_atualizados'] += 1
-                else:
-                    stats['socios_criados'] += 1
-                    
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao criar quadro societário: {e}'))
-            stats['erros'] += 1
-
-    def criar_capital_social(self, empresa, dados_empresa):
-        """Cria registro de capital social"""
-        try:
-            capital_social = dados_empresa.get('capital_social')
-            if not capital_social or capital_social == 0:
-                return
-            
-            if not self.dry_run:
-                # Converter para decimal
-                try:
-                    valor_capital = Decimal(str(capital_social))
-                except (ValueError, TypeError):
-                    return
-                
-                # Criar registro de capital social
-                CapitalSocial.objects.update_or_create(
-                    empresa=empresa,
-                    data_referencia=date.today(),
-                    fonte='QUADRO_SOCIETARIO',
-                    defaults={
-                        'valor_capital': valor_capital,
-                    }
-                )
-                
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao criar capital social: {e}'))
-
     def gerar_relatorio_final(self, stats):
         """Gera relatório final da importação"""
         self.stdout.write('\n' + '='*70)
@@ -462,9 +451,16 @@ class Command(BaseETLCommand):
         self.stdout.write('='*70)
         self.stdout.write(f'Empresas processadas: {stats["empresas_processadas"]}')
         self.stdout.write(f'Empresas atualizadas: {stats["empresas_atualizadas"]}')
-        self.stdout.write(f'Sócios criados: {stats["socios_criados"]}')
+        self.stdout.write(f'Sócios no quadro: {stats["socios_processados"]}')
+        self.stdout.write(f'  - Criados: {stats["socios_criados"]}')
+        self.stdout.write(f'  - Atualizados: {stats["socios_atualizados"]}')
+        self.stdout.write(f'  - Inalterados: {stats["socios_inalterados"]}')
+        self.stdout.write('Pessoas criadas como sócios:')
         self.stdout.write(f'  - Pessoas Físicas: {stats["socios_pf_criados"]}')
         self.stdout.write(f'  - Pessoas Jurídicas: {stats["socios_pj_criados"]}')
+        self.stdout.write(f'Capitais sociais gravados: {stats["capitais_gravados"]}')
+        if self.update_only:
+            self.stdout.write(f'Ignorados (--update-only): {stats["ignorados_update_only"]}')
         self.stdout.write(f'Erros: {stats["erros"]}')
         
         # Estatísticas de performance
@@ -1,4 +1,4 @@
-from django.db import transaction
+from django.db import connection as pg_connection
 from ._base import BaseETLCommand
 from apps.core.models import Contabilidade
 from apps.contabil.models import PlanoContas
@@ -17,6 +17,121 @@ def batch_iterator(iterator, batch_size):
 class Command(BaseETLCommand):
     help = 'ETL COMPLETO para carregar TODAS as contas do Plano de Contas, incluindo contas sem classificação.'
 
+    # Sem simple_history por conta; cada lote é registrado em ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
+
+    # Contas por UPDATE ... FROM (VALUES ...) na vinculação da hierarquia
+    BLOCO_HIERARQUIA = 1000
+
+    def calcular_hierarquia(self, contas):
+        """
+        Calcula em memória a hierarquia de um plano de contas.
+
+        `contas`: {id: (codigo, conta_pai_id)} de uma contabilidade. O pai é
+        a conta com o maior prefixo da classificação (1.1.01 -> 1.1 -> 1);
+        sem pai pelo código, o vínculo atual é mantido se for uma conta da
+        mesma contabilidade. Retorna {id: (conta_pai_id, caminho, profundidade)}.
+        """
+        id_por_codigo = {codigo: conta_id for conta_id, (codigo, _) in contas.items()}
+        pais = {}
+        for conta_id, (codigo, conta_pai_id) in contas.items():
+            partes = [p for p in re.split(r'[.\s]', codigo) if p]
+            pai = None
+            for i in range(len(partes) - 1, 0, -1):
+                pai = id_por_codigo.get('.'.join(partes[:i]))
+                if pai:
+                    break
+            if pai is None and conta_pai_id in contas:
+                pai = conta_pai_id
+            pais[conta_id] = pai
+
+        caminhos = {}
+        for conta_id in pais:
+            # Sobe até uma conta com caminho já calculado (ou a raiz)
+            cadeia, vistos = [], set()
+            atual = conta_id
+            while atual is not None and atual not in caminhos and atual not in vistos:
+                cadeia.append(atual)
+                vistos.add(atual)
+                atual = pais[atual]
+            if atual in vistos:
+                # Vínculo circular herdado: a conta onde o ciclo fecha vira raiz.
+                # As demais contas do ciclo saem da cadeia e são calculadas ao
+                # serem visitadas, já penduradas nela.
+                pais[atual] = None
+                caminhos[atual] = f"{atual.hex}/"
+                cadeia = cadeia[:cadeia.index(atual)]
+            caminho = caminhos[atual] if atual is not None else ''
+            for conta in reversed(cadeia):
+                caminho = f"{caminho}{conta.hex}/"
+                caminhos[conta] = caminho
+
+        return {
+            conta_id: (pais[conta_id], caminho, caminho.count('/') - 1)
+            for conta_id, caminho in caminhos.items()
+        }
+
+    def gravar_hierarquia(self, alteracoes):
+        """UPDATE ... FROM (VALUES ...) em blocos: [(id, conta_pai_id, caminho, profundidade)]."""
+        tabela = pg_connection.ops.quote_name(PlanoContas._meta.db_table)
+        with pg_connection.cursor() as cursor:
+            for inicio in range(0, len(alteracoes), self.BLOCO_HIERARQUIA):
+                bloco = alteracoes[inicio:inicio + self.BLOCO_HIERARQUIA]
+                valores = ', '.join(['(%s::uuid, %s::uuid, %s, %s)'] * len(bloco))
+                cursor.execute(
+                    f"UPDATE {tabela} AS c "
+                    f"SET conta_pai_id = v.conta_pai_id, caminho = v.caminho, profundidade = v.profundidade "
+                    f"FROM (VALUES {valores}) AS v(id, conta_pai_id, caminho, profundidade) "
+                    f"WHERE c.id = v.id",
+                    [
+                        valor
+                        for conta_id, conta_pai_id, caminho, profundidade in bloco
+                        for valor in (str(conta_id), str(conta_pai_id) if conta_pai_id else None, caminho, profundidade)
+                    ],
+                )
+
+    def vincular_hierarquia(self):
+        """
+        Segunda passada, por contabilidade: carrega (id, código, pai, caminho,
+        profundidade) das contas, calcula a hierarquia em memória e grava só
+        as contas que mudaram, uma transação por contabilidade.
+        Retorna o número de contas atualizadas.
+        """
+        contabilidades = list(
+            PlanoContas.objects.order_by().values_list('contabilidade_id', flat=True).distinct()
+        )
+        self.stdout.write(f"Planos de contas a vincular: {len(contabilidades):,} contabilidades")
+
+        total_atualizadas = 0
+        for numero, contabilidade_id in enumerate(contabilidades, 1):
+            try:
+                atuais = {
+                    conta_id: (codigo, conta_pai_id, caminho, profundidade)
+                    for conta_id, codigo, conta_pai_id, caminho, profundidade in PlanoContas.objects.filter(
+                        contabilidade_id=contabilidade_id
+                    ).values_list('id', 'codigo', 'conta_pai_id', 'caminho', 'profundidade')
+                }
+                hierarquia = self.calcular_hierarquia({
+                    conta_id: (codigo, conta_pai_id) for conta_id, (codigo, conta_pai_id, _, _) in atuais.items()
+                })
+                alteracoes = [
+                    (conta_id, *valores)
+                    for conta_id, valores in hierarquia.items()
+                    if valores != atuais[conta_id][1:]
+                ]
+                if alteracoes:
+                    with self.transacao():
+                        self.gravar_hierarquia(alteracoes)
+                    total_atualizadas += len(alteracoes)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"✗ Erro ao vincular contas-pai da contabilidade {contabilidade_id}: {e}"))
+                continue
+
+            if numero % 100 == 0:
+                self.stdout.write(f"Contabilidades processadas: {numero:,}/{len(contabilidades):,} | Contas atualizadas: {total_atualizadas:,}")
+
+        return total_atualizadas
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('=' * 70))
         self.stdout.write(self.style.SUCCESS('--- INICIANDO ETL COMPLETO DO PLANO DE CONTAS ---'))
@@ -79,6 +194,7 @@ class Command(BaseETLCommand):
         
         for batch in batch_iterator(data_iterator, BATCH_SIZE):
             contas_para_criar = []
+            criados_antes, atualizados_antes = total_criados, total_atualizados
             
             for row in batch:
                 total_processados += 1
@@ -117,8 +233,8 @@ class Command(BaseETLCommand):
                     total_sem_contabilidade += 1
                     continue
 
-                # Para cada período de contrato, criar a conta
-                for data_inicio, data_termino, contabilidade in contratos_empresa:
+                # Para cada contabilidade que teve contrato com a empresa, criar a conta
+                for contabilidade_id in dict.fromkeys(p.contabilidade_id for p in contratos_empresa):
                     tipo_conta = (str(item.get('tipo_cta') or 'A')).strip().upper()
                     nome_conta = str(item.get('nome_cta') or f'Conta {classificacao}').strip()
                     
@@ -130,8 +246,9 @@ class Command(BaseETLCommand):
                     elif classificacao.startswith('2') or classificacao.startswith('3') or classificacao.startswith('4'):
                         natureza = "CREDORA"
                     
-                    conta, created = PlanoContas.objects.update_or_create(
-                        contabilidade=contabilidade,
+                    conta, created = self.update_or_create(
+                        PlanoContas,
+                        contabilidade_id=contabilidade_id,
                         codigo=classificacao,
                         defaults={
                             'id_legado': str(item.get('codi_cta')),
@@ -148,6 +265,11 @@ class Command(BaseETLCommand):
                     else:
                         total_atualizados += 1
                 
+            self.registrar_lote(
+                PlanoContas, (batch[0][4], batch[0][0]), (batch[-1][4], batch[-1][0]),
+                total_criados - criados_antes, total_atualizados - atualizados_antes,
+            )
+
             # Mostrar progresso do lote
             percentual = (total_processados / total_registros * 100) if total_registros > 0 else 0
             self.stdout.write(
@@ -176,49 +298,10 @@ class Command(BaseETLCommand):
         for emp, count in sorted(contas_por_empresa.items(), key=lambda x: x[1], reverse=True)[:10]:
             self.stdout.write(f"  Empresa {emp}: {count:,} contas")
 
-        # Segunda passada: Vincular contas-pai
+        # Segunda passada: Vincular contas-pai e caminho materializado
         self.stdout.write(self.style.WARNING("\n[5/5] Vinculando contas-pai (hierarquia)..."))
-        try:
-            with transaction.atomic():
-                mapa_contas = {
-                    (conta.contabilidade_id, conta.codigo): conta.id 
-                    for conta in PlanoContas.objects.all()
-                }
-                
-                self.stdout.write(f"Mapa de contas carregado: {len(mapa_contas):,} entradas")
-                
-                contas_atualizadas = 0
-                contas_total = PlanoContas.objects.count()
-                contas_processadas = 0
-                
-                for conta in PlanoContas.objects.select_related('contabilidade').iterator():
-                    contas_processadas += 1
-                    
-                    # Tentar extrair hierarquia da classificação
-                    partes = re.split(r'[.\s]', conta.codigo)
-                    partes_pai = [p for p in partes if p]
-                    
-                    if len(partes_pai) > 1:
-                        # Tentar várias formas de encontrar o pai
-                        for i in range(len(partes_pai)-1, 0, -1):
-                            classificacao_pai = '.'.join(partes_pai[:i])
-                            id_pai = mapa_contas.get((conta.contabilidade_id, classificacao_pai))
-                            
-                            if id_pai and conta.conta_pai_id != id_pai:
-                                conta.conta_pai_id = id_pai
-                                conta.save(update_fields=['conta_pai_id'])
-                                contas_atualizadas += 1
-                                break
-                    
-                    # Mostrar progresso a cada 10000 contas
-                    if contas_processadas % 10000 == 0:
-                        percentual = (contas_processadas / contas_total * 100) if contas_total > 0 else 0
-                        self.stdout.write(f"Processadas: {contas_processadas:,}/{contas_total:,} ({percentual:.1f}%) | Vínculos criados: {contas_atualizadas:,}")
-                
-                self.stdout.write(self.style.SUCCESS(f"\n✓ Vinculação concluída. {contas_atualizadas:,} contas vinculadas a suas contas-pai."))
-                
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"✗ Erro ao vincular contas-pai: {e}"))
+        contas_atualizadas = self.vincular_hierarquia()
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Vinculação concluída. {contas_atualizadas:,} contas com pai/caminho atualizados."))
             
         # Estatísticas finais
         self.stdout.write(self.style.SUCCESS('\n' + '=' * 70))
@@ -1,60 +1,121 @@
-from django.db import transaction
-from ._base import BaseETLCommand
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from django.db import connections
+from ._base import BaseETLCommand, ETLPipeline, KeysetExtractor
+from apps.importacao.workers import inicializar_worker, executar_metodo_comando
 from apps.core.models import Contabilidade
 from apps.contabil.models import PlanoContas, LancamentoContabil, Partida
 from apps.pessoas.models import PessoaJuridica, Contrato
 from django.contrib.contenttypes.models import ContentType
-from itertools import islice
+from decimal import Decimal
 import datetime
 import re
+import time
+import uuid
 
-def batch_iterator(iterator, batch_size):
-    while True:
-        batch = list(islice(iterator, batch_size))
-        if not batch: break
-        yield batch
+CENTAVO = Decimal('0.01')
+
+# Campos do lançamento comparados/atualizados pelo carregamento em lote
+CAMPOS_LANCAMENTO = ('data_lancamento', 'historico', 'valor_total')
+
+# Contadores da carga, somados entre as partições no modo --workers
+CONTADORES = ('criados', 'atualizados', 'inalterados', 'sem_mapeamento', 'contas_criadas', 'lotes', 'lotes_com_erro', 'linhas')
+
+# Opções repassadas aos processos de partição
+OPCOES_PARTICAO = ('page_size', 'reiniciar', 'incremental', 'lookback_dias', 'historico')
 
 class Command(BaseETLCommand):
     help = 'ETL para carregar os Lançamentos Contábeis (bethadba.ctlancto) em lotes com criação automática de contas.'
 
-    def __init__(self):
-        super().__init__()
-        self.cache_nomes_contas = {}  # Cache para nomes de contas do Sybase
+    DATA_INICIAL = datetime.date(2019, 1, 1)
 
-    def obter_nome_conta_sybase(self, connection, codigo_conta):
-        """
-        Busca o nome da conta no Sybase.
-        """
-        if codigo_conta in self.cache_nomes_contas:
-            return self.cache_nomes_contas[codigo_conta]
-        
-        query = """
-        SELECT TOP 1 nome_cta 
-        FROM BETHADBA.CTCONTAS 
-        WHERE codi_cta = ?
-        """
-        
-        cursor = connection.cursor()
-        cursor.execute(query, (codigo_conta,))
-        result = cursor.fetchone()
-        
-        if result and result[0]:
-            nome = str(result[0]).strip()
-            self.cache_nomes_contas[codigo_conta] = nome
-            return nome
-        
-        return None
+    # Carga só em bulk; cada lote é registrado em ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
 
-    def criar_conta_automatica(self, connection, contabilidade, codigo_conta, tipo='D'):
+    SELECT_LANCAMENTOS = """
+            l.nume_lan,
+            e.cgce_emp,
+            l.data_lan,
+            l.chis_lan,
+            l.vlor_lan,
+            l.cdeb_lan,
+            l.ccre_lan,
+            l.codi_his,
+            cd.nome_cta AS nome_deb,
+            cc.nome_cta AS nome_cred,
+            l.codi_emp
+            """
+
+    FROM_LANCAMENTOS = """
+        FROM
+            BETHADBA.CTLANCTO l
+        INNER JOIN
+            BETHADBA.GEEMPRE e ON l.codi_emp = e.codi_emp
+        LEFT JOIN
+            BETHADBA.CTCONTAS AS cd ON l.cdeb_lan = cd.codi_cta
+        LEFT JOIN
+            BETHADBA.CTCONTAS AS cc ON l.ccre_lan = cc.codi_cta
+            """
+
+    WHERE_LANCAMENTOS = """
+            l.data_lan IS NOT NULL 
+            AND l.data_lan >= '2019-01-01'
+            AND l.vlor_lan > 0
+            AND e.cgce_emp IS NOT NULL AND e.cgce_emp <> ''
+            """
+
+    # Máximo de codi_emp literais por cláusula IN no modo incremental
+    EMPRESAS_POR_EXTRACAO = 1000
+
+    # Faixa (codi_emp inicial, codi_emp final) processada; None = todas as empresas
+    particao = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=2500,
+            help='Lançamentos por página/lote lidos do Sybase (padrão: 2500)',
+        )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Ignora o checkpoint salvo e recomeça a extração do início',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help="Extrai apenas lançamentos após a marca d'água de cada empresa (menos o look-back)",
+        )
+        parser.add_argument(
+            '--lookback-dias',
+            type=int,
+            default=7,
+            help="Dias relidos antes da marca d'água no modo incremental, para pegar edições tardias (padrão: 7)",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processos paralelos, cada um com uma faixa de codi_emp e conexões próprias (padrão: 1)',
+        )
+        parser.add_argument(
+            '--historico',
+            choices=('lote', 'alterados'),
+            default='lote',
+            help=(
+                'lote: apenas um registro de auditoria por lote (padrão); '
+                'alterados: também grava o simple_history dos lançamentos e partidas criados ou alterados'
+            ),
+        )
+
+    def montar_conta_automatica(self, contabilidade_id, codigo_conta, tipo='D', nome_sybase=None):
         """
-        Cria uma conta automaticamente quando não existe no plano de contas.
-        Busca o nome da conta no Sybase quando possível.
+        Monta (sem salvar) uma conta para código inexistente no plano de contas.
+        Usa o nome da conta no Sybase (CTCONTAS, já trazido na query) quando houver.
         """
-        # Buscar nome da conta no Sybase
-        nome_sybase = self.obter_nome_conta_sybase(connection, codigo_conta)
-        
-        if nome_sybase:
-            nome_conta = nome_sybase
+        if nome_sybase and str(nome_sybase).strip():
+            nome_conta = str(nome_sybase).strip()
             # Determinar natureza baseada no nome
             nome_upper = nome_conta.upper()
             if any(palavra in nome_upper for palavra in ['RECEITA', 'VENDA', 'FATURAMENTO', 'PASSIVO', 'CAPITAL']):
@@ -72,9 +133,8 @@ class Command(BaseETLCommand):
                 nome_conta = f"Conta Crédito {codigo_conta}"
                 natureza = "CREDORA"
         
-        # Criar a conta
-        conta = PlanoContas.objects.create(
-            contabilidade=contabilidade,
+        conta = PlanoContas(
+            contabilidade_id=contabilidade_id,
             id_legado=str(codigo_conta),
             codigo=str(codigo_conta),
             nome=nome_conta,
@@ -84,13 +144,533 @@ class Command(BaseETLCommand):
             natureza=natureza,
             ativo=True
         )
-        
+        # bulk_create não passa pelo save(): conta raiz, caminho só com o próprio id
+        conta.caminho = f"{conta.id.hex}/"
         return conta
 
+    def resolver_periodo(self, contratos_empresa, data_lancamento):
+        """
+        Regra de Ouro para lançamentos: contrato vigente na data ou, na falta
+        dele, o contrato mais recente dos últimos 5 anos (desde 2019).
+        Retorna (contabilidade_id, contrato_id) ou (None, None).
+        """
+        data_limite_5_anos = self.DATA_INICIAL  # Últimos 5 anos (obrigação legal)
+        contrato_valido = False
+        
+        for periodo in contratos_empresa:
+            data_inicio, data_termino = periodo.data_inicio, periodo.data_termino
+            # Contrato é válido se começou em 2019 ou depois, ou se terminou em 2019 ou depois
+            contrato_nos_ultimos_5_anos = (
+                (data_inicio and data_inicio >= data_limite_5_anos) or
+                (data_termino and data_termino >= data_limite_5_anos) or
+                (data_inicio and data_termino and data_inicio <= data_limite_5_anos <= data_termino)
+            )
+            
+            if contrato_nos_ultimos_5_anos:
+                contrato_valido = True
+                # Verificar se o lançamento está dentro do período do contrato
+                if data_inicio and data_termino and data_inicio <= data_lancamento <= data_termino:
+                    return periodo.contabilidade_id, periodo.contrato_id
+        
+        # Sem contrato para a data, mas com contrato válido nos últimos 5 anos: usar o mais recente
+        if contrato_valido:
+            contratos_validos = [
+                periodo for periodo in contratos_empresa
+                if (periodo.data_inicio and periodo.data_inicio >= data_limite_5_anos) or
+                   (periodo.data_termino and periodo.data_termino >= data_limite_5_anos) or
+                   (periodo.data_inicio and periodo.data_termino and periodo.data_inicio <= data_limite_5_anos <= periodo.data_termino)
+            ]
+            if contratos_validos:
+                mais_recente = max(contratos_validos, key=lambda p: p.data_inicio or datetime.date.min)
+                return mais_recente.contabilidade_id, mais_recente.contrato_id
+        
+        return None, None
+
+    def transformar_lote(self, batch, historical_map):
+        """
+        Aplica a Regra de Ouro às linhas do Sybase e devolve
+        ({(contabilidade_id, contrato_id, numero_lancamento): registro}, sem_mapeamento,
+        {codi_emp: maior data_lan carregada}). Linhas repetidas no lote (mesma
+        chave) ficam com a última ocorrência.
+        """
+        registros = {}
+        empresas = {}  # chave do registro -> codi_emp de origem
+        sem_mapeamento = 0
+        data_atual = datetime.date.today()
+        
+        for row in batch:
+            documento_limpo = self.limpar_documento(str(row[1] or ''))
+            
+            # Aplicar a Regra de Ouro: buscar contabilidade no mapa histórico
+            contratos_empresa = historical_map.get(documento_limpo)
+            data_lancamento = row[2]
+            if isinstance(data_lancamento, datetime.datetime):
+                data_lancamento = data_lancamento.date()
+            
+            # Lançamento precisa de contrato e estar no período de importação (01/01/2019 até hoje)
+            if (not contratos_empresa or not data_lancamento
+                    or data_lancamento < self.DATA_INICIAL or data_lancamento > data_atual):
+                sem_mapeamento += 1
+                continue
+            
+            contabilidade_id, contrato_id = self.resolver_periodo(contratos_empresa, data_lancamento)
+            if not contabilidade_id:
+                sem_mapeamento += 1
+                continue
+            
+            if not row[4]:
+                continue
+            
+            historico_completo = ''
+            if row[7]:
+                historico_completo = f"Código: {row[7]} - "
+            if row[3]:
+                historico_completo += str(row[3] or '').strip()
+            
+            numero_lancamento = str(row[0])
+            empresas[(contabilidade_id, contrato_id, numero_lancamento)] = row[10]
+            registros[(contabilidade_id, contrato_id, numero_lancamento)] = {
+                'contabilidade_id': contabilidade_id,
+                'contrato_id': contrato_id,
+                'numero_lancamento': numero_lancamento,
+                'data_lancamento': data_lancamento,
+                'historico': historico_completo[:1000],
+                'valor_total': Decimal(str(row[4])).quantize(CENTAVO),
+                'cdeb_lan': str(row[5]),
+                'ccre_lan': str(row[6]),
+                'nome_deb': row[8],
+                'nome_cred': row[9],
+            }
+        
+        return registros, sem_mapeamento, self.maiores_datas_por_empresa(registros, empresas, data_atual)
+
+    def _carregar_contas(self, chaves, campo):
+        """Preenche cache_contas com as contas existentes para as chaves (contabilidade_id, código)."""
+        contas = PlanoContas.objects.filter(
+            contabilidade_id__in={contabilidade_id for contabilidade_id, _ in chaves},
+            **{f'{campo}__in': {codigo for _, codigo in chaves}}
+        ).values_list('contabilidade_id', campo, 'id')
+        for contabilidade_id, codigo, conta_id in contas:
+            chave = (contabilidade_id, codigo)
+            if chave in chaves:
+                self.cache_contas.setdefault(chave, conta_id)
+
+    def resolver_contas(self, registros):
+        """
+        Garante em cache_contas o id das contas de débito e crédito do lote:
+        uma consulta para as existentes e um bulk_create para as que faltam.
+        Retorna o número de contas criadas.
+        """
+        faltantes = {}
+        for registro in registros.values():
+            for campo_codigo, campo_nome, tipo in (('cdeb_lan', 'nome_deb', 'D'), ('ccre_lan', 'nome_cred', 'C')):
+                chave = (registro['contabilidade_id'], registro[campo_codigo])
+                if chave not in self.cache_contas and chave not in faltantes:
+                    faltantes[chave] = (tipo, registro[campo_nome])
+        if not faltantes:
+            return 0
+        
+        self._carregar_contas(faltantes, 'id_legado')
+        # Ordenadas pela chave única: workers que criam as mesmas contas não entram em deadlock
+        novas = [
+            self.montar_conta_automatica(contabilidade_id, codigo, tipo, nome)
+            for (contabilidade_id, codigo), (tipo, nome) in sorted(faltantes.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+            if (contabilidade_id, codigo) not in self.cache_contas
+        ]
+        if not novas:
+            return 0
+        
+        # Conflito em (contabilidade, codigo) = conta já existe com outro id_legado; reaproveitá-la
+        PlanoContas.objects.bulk_create(novas, batch_size=1000, ignore_conflicts=True)
+        self._carregar_contas({(conta.contabilidade_id, conta.codigo) for conta in novas}, 'codigo')
+        ids_novas = {conta.id for conta in novas}
+        return sum(1 for conta in novas if self.cache_contas.get((conta.contabilidade_id, conta.codigo)) in ids_novas)
+
+    def carregar_lote(self, registros, historico=False):
+        """
+        Upsert set-based do lote em (contabilidade, contrato, numero_lancamento).
+
+        Uma consulta traz os lançamentos existentes e outra as suas partidas.
+        Os lançamentos idênticos são ignorados, os alterados vão em um
+        bulk_update e os novos em um bulk_create. As partidas dos alterados
+        são apagadas com um único DELETE e as novas inseridas com um bulk_create.
+        Com historico=True grava o simple_history só dos criados/alterados.
+        Retorna (criados, atualizados, inalterados).
+        """
+        existentes = {}
+        for lancamento in LancamentoContabil.objects.filter(
+            contabilidade_id__in={chave[0] for chave in registros},
+            numero_lancamento__in={chave[2] for chave in registros},
+        ).only('id', 'contabilidade_id', 'contrato_id', 'numero_lancamento', *CAMPOS_LANCAMENTO):
+            chave = (lancamento.contabilidade_id, lancamento.contrato_id, lancamento.numero_lancamento)
+            if chave in registros:
+                existentes.setdefault(chave, lancamento)
+        
+        partidas_atuais = {}
+        for lancamento_id, tipo, conta_id, valor in Partida.objects.filter(
+            lancamento_id__in=[lancamento.id for lancamento in existentes.values()]
+        ).values_list('lancamento_id', 'tipo', 'conta_id', 'valor'):
+            partidas_atuais.setdefault(lancamento_id, set()).add((tipo, conta_id, valor))
+        
+        novos, alterados, partidas = [], [], []
+        inalterados = 0
+        for chave, registro in registros.items():
+            conta_debito_id = self.cache_contas[(registro['contabilidade_id'], registro['cdeb_lan'])]
+            conta_credito_id = self.cache_contas[(registro['contabilidade_id'], registro['ccre_lan'])]
+            valor = registro['valor_total']
+            
+            lancamento = existentes.get(chave)
+            if lancamento is None:
+                lancamento = LancamentoContabil(
+                    contabilidade_id=registro['contabilidade_id'],
+                    contrato_id=registro['contrato_id'],
+                    numero_lancamento=registro['numero_lancamento'],
+                    **{campo: registro[campo] for campo in CAMPOS_LANCAMENTO}
+                )
+                novos.append(lancamento)
+            else:
+                # Lançamento e partidas idênticos: nada a gravar
+                partidas_novas = {('D', conta_debito_id, valor), ('C', conta_credito_id, valor)}
+                if partidas_atuais.get(lancamento.id) == partidas_novas and all(
+                    getattr(lancamento, campo) == registro[campo] for campo in CAMPOS_LANCAMENTO
+                ):
+                    inalterados += 1
+                    continue
+                for campo in CAMPOS_LANCAMENTO:
+                    setattr(lancamento, campo, registro[campo])
+                alterados.append(lancamento)
+            
+            partidas.append(Partida(lancamento=lancamento, conta_id=conta_debito_id, tipo='D', valor=valor))
+            partidas.append(Partida(lancamento=lancamento, conta_id=conta_credito_id, tipo='C', valor=valor))
+        
+        if alterados:
+            Partida.objects.filter(lancamento_id__in=[lancamento.id for lancamento in alterados])._raw_delete(Partida.objects.db)
+            LancamentoContabil.objects.bulk_update(alterados, CAMPOS_LANCAMENTO, batch_size=500)
+        if novos:
+            LancamentoContabil.objects.bulk_create(novos, batch_size=1000)
+        if partidas:
+            Partida.objects.bulk_create(partidas, batch_size=2000)
+        
+        if historico:
+            self.gravar_historico(LancamentoContabil, criados=novos, alterados=alterados)
+            self.gravar_historico(Partida, criados=partidas)
+        
+        return len(novos), len(alterados), inalterados
+
+    def criar_extrator(self, connection, options, extracao, filtro='', params=(), persistir=True):
+        """
+        Extração paginada por (codi_emp, data_lan, nume_lan) com checkpoint:
+        se a conexão cair, a próxima execução continua da última página carregada.
+        Com partição, a extração fica restrita à faixa de codi_emp e tem
+        checkpoint próprio.
+        """
+        where = self.WHERE_LANCAMENTOS
+        if filtro:
+            where = f"{where} AND {filtro}"
+        if self.particao:
+            where = f"{where} AND l.codi_emp BETWEEN ? AND ?"
+            params = tuple(params) + tuple(self.particao)
+            extracao = f"{extracao}_{self.particao[0]}_{self.particao[1]}"
+        return KeysetExtractor(
+            self, connection, extracao,
+            select=self.SELECT_LANCAMENTOS,
+            from_=self.FROM_LANCAMENTOS,
+            where=where,
+            chave=('l.codi_emp', 'l.data_lan', 'l.nume_lan'),
+            params=params,
+            page_size=options['page_size'],
+            reiniciar=options['reiniciar'] or not persistir,
+            persistir=persistir,
+        )
+
+    def filtros_incrementais(self, connection, options):
+        """
+        Filtros [(filtro, params), ...] do modo incremental: empresas agrupadas
+        pela data de corte (marca d'água - look-back), mais as empresas da
+        GEEMPRE ainda sem marca d'água, lidas desde 2019. As listas de codi_emp
+        vão em blocos de até EMPRESAS_POR_EXTRACAO literais por filtro.
+        """
+        lookback = datetime.timedelta(days=options['lookback_dias'])
+        grupos = {}
+        for codi_emp, marca in self.get_watermarks().items():
+            codi_emp = int(codi_emp)
+            if self.particao and not self.particao[0] <= codi_emp <= self.particao[1]:
+                continue
+            desde = max(marca - lookback, self.DATA_INICIAL)
+            grupos.setdefault(desde, []).append(codi_emp)
+        if not grupos:
+            # Nenhuma marca d'água: todas as empresas desde 2019
+            return [('', ())]
+
+        def blocos(empresas):
+            empresas = sorted(empresas)
+            for i in range(0, len(empresas), self.EMPRESAS_POR_EXTRACAO):
+                yield ', '.join(str(codi_emp) for codi_emp in empresas[i:i + self.EMPRESAS_POR_EXTRACAO])
+
+        filtros = []
+        conhecidas = set()
+        for desde, empresas in sorted(grupos.items()):
+            conhecidas.update(empresas)
+            for bloco in blocos(empresas):
+                filtros.append((f"l.codi_emp IN ({bloco}) AND l.data_lan >= ?", (desde,)))
+
+        # Empresas sem marca d'água (novas ou nunca carregadas): a lista sai da
+        # GEEMPRE em vez de um NOT IN com todas as conhecidas
+        query = "SELECT e.codi_emp FROM BETHADBA.GEEMPRE e WHERE e.cgce_emp IS NOT NULL AND e.cgce_emp <> ''"
+        params = ()
+        if self.particao:
+            query += " AND e.codi_emp BETWEEN ? AND ?"
+            params = tuple(self.particao)
+        novas = {row[0] for row in self.stream_query(connection, query, params)} - conhecidas
+        for bloco in blocos(novas):
+            filtros.append((f"l.codi_emp IN ({bloco})", ()))
+        return filtros
+
+    def montar_extratores(self, connection, options):
+        """
+        Modo completo: uma extração desde 2019. Modo incremental: uma extração
+        por filtro de filtros_incrementais(). No incremental a marca d'água já
+        é o ponto de retomada, então não há checkpoint.
+        """
+        if not options['incremental']:
+            return [self.criar_extrator(connection, options, 'ctlancto')]
+
+        return [
+            self.criar_extrator(
+                connection, options, 'ctlancto_incremental', filtro=filtro, params=params, persistir=False
+            )
+            for filtro, params in self.filtros_incrementais(connection, options)
+        ]
+
+    def maiores_datas_por_empresa(self, registros, empresas, limite):
+        """
+        Maior data_lancamento de cada codi_emp entre os registros que serão
+        carregados, limitada a `limite` (hoje). Linhas descartadas pela Regra
+        de Ouro (sem contrato, fora do período) não avançam a marca d'água.
+        """
+        maiores = {}
+        for chave, registro in registros.items():
+            codi_emp, data_lancamento = empresas[chave], min(registro['data_lancamento'], limite)
+            if codi_emp not in maiores or data_lancamento > maiores[codi_emp]:
+                maiores[codi_emp] = data_lancamento
+        return maiores
+
+    def planejar_particoes(self, connection, workers, options):
+        """
+        Divide as empresas em até `workers` faixas contíguas de codi_emp com
+        volumes de lançamentos parecidos. Retorna [(codi_emp inicial, final), ...].
+        No modo incremental só conta os lançamentos que serão extraídos
+        (a partir da marca d'água de cada empresa).
+        """
+        filtros = self.filtros_incrementais(connection, options) if options['incremental'] else [('', ())]
+        contagem = {}
+        for filtro, params in filtros:
+            where = f"{self.WHERE_LANCAMENTOS} AND {filtro}" if filtro else self.WHERE_LANCAMENTOS
+            query = f"""
+            SELECT l.codi_emp, COUNT(*)
+            FROM
+                BETHADBA.CTLANCTO l
+            INNER JOIN
+                BETHADBA.GEEMPRE e ON l.codi_emp = e.codi_emp
+            WHERE {where}
+            GROUP BY l.codi_emp
+            """
+            for row in self.stream_query(connection, query, params):
+                contagem[row[0]] = contagem.get(row[0], 0) + row[1]
+        volumes = sorted(contagem.items())
+        if not volumes:
+            return []
+
+        alvo = sum(total for _, total in volumes) / min(workers, len(volumes))
+        particoes = []
+        inicio, acumulado = None, 0
+        for codi_emp, total in volumes:
+            if inicio is None:
+                inicio = codi_emp
+            acumulado += total
+            if acumulado >= alvo and len(particoes) < workers - 1:
+                particoes.append((inicio, codi_emp))
+                inicio, acumulado = None, 0
+        if inicio is not None:
+            particoes.append((inicio, volumes[-1][0]))
+        return particoes
+
+    def processar_paginas(self, extratores, historical_map, prefixo='', historico='lote'):
+        """
+        Transforma e carrega as páginas dos extratores, um lote por transação,
+        em pipeline: a leitura da próxima página no Sybase e a Regra de Ouro
+        rodam enquanto o lote anterior é gravado. Retorna os contadores.
+        """
+        stats = dict.fromkeys(CONTADORES, 0)
+        self.cache_contas = {}  # (contabilidade_id, código) -> id da conta
+        # Empresas com lote desfeito: a marca d'água delas não avança mais nesta
+        # execução, para que a próxima releia a partir do lote que falhou
+        empresas_com_erro = set()
+        pipeline = ETLPipeline(self)
+
+        def ler():
+            for extrator in extratores:
+                for batch in extrator.paginas(concluir=False):
+                    stats['linhas'] += len(batch)
+                    yield extrator, batch
+
+        def transformar(item):
+            _extrator, batch = item
+            return self.transformar_lote(batch, historical_map)
+
+        def gravar(item, resultado):
+            extrator, batch = item
+            registros, sem_mapeamento, maiores_datas = resultado
+            maiores_datas = {
+                codi_emp: data for codi_emp, data in maiores_datas.items() if codi_emp not in empresas_com_erro
+            }
+            
+            with self.transacao():
+                # Lotes de outros processos com as mesmas empresas esperam este commit
+                self.lock_escopos({row[10] for row in batch})
+                contas_criadas = self.resolver_contas(registros)
+                criados, atualizados, inalterados = self.carregar_lote(registros, historico=historico == 'alterados')
+                
+                # Checkpoint, marcas d'água e auditoria gravados na mesma transação do lote.
+                # Depois de um lote desfeito o checkpoint não avança: uma retomada
+                # precisa reler a página que falhou
+                if not stats['lotes_com_erro']:
+                    extrator.confirmar(batch)
+                self.update_watermarks(maiores_datas)
+                self.registrar_lote(
+                    LancamentoContabil, extrator.chave_da_linha(batch[0]), extrator.chave_da_linha(batch[-1]),
+                    criados, atualizados, inalterados,
+                )
+            
+            stats['sem_mapeamento'] += sem_mapeamento
+            stats['contas_criadas'] += contas_criadas
+            stats['criados'] += criados
+            stats['atualizados'] += atualizados
+            stats['inalterados'] += inalterados
+            
+            numero_lote = pipeline.lotes + 1
+            if numero_lote % 10 == 0:
+                self.stdout.write(f"{prefixo}Lote {numero_lote} | Criados: {stats['criados']} | Atualizados: {stats['atualizados']} | Inalterados: {stats['inalterados']} | Contas Novas: {stats['contas_criadas']} | Sem Mapeamento: {stats['sem_mapeamento']}")
+
+        def ao_erro(item, e):
+            # Contas criadas no lote desfeito não estão no banco
+            self.cache_contas.clear()
+            empresas_com_erro.update(row[10] for row in item[1])
+            stats['lotes_com_erro'] += 1
+            self.stdout.write(self.style.ERROR(f"{prefixo}Erro no lote {pipeline.lotes + 1}: {e}"))
+
+        pipeline.executar(ler(), gravar, transformar=transformar, ao_erro=ao_erro, linhas_do_lote=lambda item: len(item[1]))
+        # Com lote desfeito a extração não é dada como concluída
+        if not stats['lotes_com_erro']:
+            for extrator in extratores:
+                if extrator.esgotado:
+                    extrator.concluir()
+
+        stats['lotes'] = pipeline.lotes
+        self.stdout.write(f"{prefixo}{pipeline.resumo()}")
+        return stats
+
+    def executar_particao(self, particao, options):
+        """
+        Processa uma faixa de codi_emp com conexões próprias (Sybase e
+        PostgreSQL). Executado nos processos do modo --workers.
+        """
+        self.particao = tuple(particao)
+        # Auditoria dos lotes com o id da execução do coordenador
+        self.execucao_id = uuid.UUID(options['execucao_id'])
+        prefixo = f"[codi_emp {particao[0]}-{particao[1]}] "
+
+        historical_map = self.build_historical_contabilidade_map()
+        connection = self.get_sybase_connection()
+        if not connection:
+            stats = dict.fromkeys(CONTADORES, 0)
+            stats['lotes_com_erro'] = 1
+            return stats
+
+        try:
+            self.stdout.write(f"{prefixo}Iniciando partição...")
+            # O processo filho não passa por execute()
+            with self.instrumentar_orm():
+                stats = self.processar_paginas(
+                    self.montar_extratores(connection, options), historical_map, prefixo, options['historico']
+                )
+            self.stdout.write(self.style.SUCCESS(f"{prefixo}Partição concluída: {stats['lotes']} lotes, {stats['linhas']:,} linhas."))
+            # Métricas do processo, somadas ao relatório do coordenador
+            stats['metricas'] = self.metricas.exportar()
+            return stats
+        finally:
+            connection.close()
+            connections.close_all()
+
+    def executar_com_workers(self, options):
+        """Coordenador do modo --workers: divide as empresas e soma os resultados das partições."""
+        workers = options['workers']
+        connection = self.get_sybase_connection()
+        if not connection: return None
+
+        self.stdout.write(f"\n[2/4] Dividindo as empresas em até {workers} partições por volume de lançamentos...")
+        try:
+            particoes = self.planejar_particoes(connection, workers, options)
+        finally:
+            connection.close()
+        if not particoes:
+            self.stdout.write(self.style.WARNING("Nenhum lançamento encontrado no Sybase."))
+            return None
+        for inicio, fim in particoes:
+            self.stdout.write(f"  - codi_emp {inicio} a {fim}")
+
+        self.stdout.write(f"\n[3/4] Iniciando importação em {len(particoes)} processo(s)...")
+        opcoes = {chave: options[chave] for chave in OPCOES_PARTICAO}
+        opcoes['execucao_id'] = str(self.execucao_id)
+        stats = dict.fromkeys(CONTADORES, 0)
+        # Os processos filhos abrem conexões próprias; não herdam as do coordenador
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=len(particoes), mp_context=get_context('spawn'),
+                                 initializer=inicializar_worker) as pool:
+            futuros = {
+                pool.submit(executar_metodo_comando, self.nome_etl, 'executar_particao', particao, opcoes): particao
+                for particao in particoes
+            }
+            for futuro in as_completed(futuros):
+                inicio, fim = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Erro na partição codi_emp {inicio}-{fim}: {e}"))
+                    stats['lotes_com_erro'] += 1
+                    continue
+                for chave in CONTADORES:
+                    stats[chave] += resultado[chave]
+                if 'metricas' in resultado:
+                    self.metricas.mesclar(resultado['metricas'])
+        return stats
+
+    def imprimir_resumo(self, stats, tempo_carga):
+        self.stdout.write(self.style.SUCCESS('\n--- Resumo Final ---'))
+        self.stdout.write(f"Total de lançamentos criados: {stats['criados']}")
+        self.stdout.write(f"Total de lançamentos atualizados: {stats['atualizados']}")
+        self.stdout.write(f"Total de lançamentos inalterados (não regravados): {stats['inalterados']}")
+        self.stdout.write(f"Total de lançamentos ignorados (sem mapeamento): {stats['sem_mapeamento']}")
+        self.stdout.write(f"Total de contas criadas automaticamente: {stats['contas_criadas']}")
+        self.stdout.write(f"Total de lotes processados: {stats['lotes']}")
+        if stats['lotes_com_erro']:
+            self.stdout.write(self.style.ERROR(f"Total de lotes/partições com erro: {stats['lotes_com_erro']}"))
+        if tempo_carga > 0:
+            self.stdout.write(f"Taxa de carga: {stats['linhas'] / tempo_carga:,.0f} linhas/s ({stats['linhas']:,} linhas em {tempo_carga:.1f}s)")
+        self.stdout.write(self.style.SUCCESS('--- ETL de Lançamentos Contábeis finalizado (Regra de Ouro) ---'))
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('--- Iniciando ETL para Lançamentos Contábeis (Regra de Ouro) ---'))
         self.stdout.write(self.style.WARNING("ATENÇÃO: Esta é uma importação incremental. Dados existentes serão mantidos."))
 
+        if options['workers'] > 1:
+            # Cada partição monta o próprio mapa histórico e abre as próprias conexões
+            inicio_carga = time.time()
+            stats = self.executar_com_workers(options)
+            if stats is not None:
+                self.imprimir_resumo(stats, time.time() - inicio_carga)
+            return
+
         # PASSO 1: Construir o mapa histórico de contabilidades
         self.stdout.write("\n[1/4] Construindo mapa histórico de contabilidades...")
         historical_map = self.build_historical_contabilidade_map()
@@ -98,233 +678,35 @@ class Command(BaseETLCommand):
         connection = self.get_sybase_connection()
         if not connection: return
         
-        count_query = """
-        SELECT COUNT(*)
-        FROM
-            BETHADBA.CTLANCTO l
-        INNER JOIN
-            BETHADBA.GEEMPRE e ON l.codi_emp = e.codi_emp
-        WHERE
-            l.data_lan IS NOT NULL 
-            AND l.data_lan >= '2019-01-01'
-            AND l.vlor_lan > 0
-            AND e.cgce_emp IS NOT NULL AND e.cgce_emp <> ''
-        """
+        extratores = self.montar_extratores(connection, options)
 
-        query = """
-        SELECT TOP 100
-            l.nume_lan,
-            e.cgce_emp,
-            l.data_lan,
-            l.chis_lan,
-            l.vlor_lan,
-            l.cdeb_lan,
-            l.ccre_lan,
-            l.codi_his,
-            cd.nome_cta AS nome_deb,
-            cc.nome_cta AS nome_cred
-        FROM
-            BETHADBA.CTLANCTO l
-        INNER JOIN
-            BETHADBA.GEEMPRE e ON l.codi_emp = e.codi_emp
-        LEFT JOIN
-            BETHADBA.CTCONTAS AS cd ON l.cdeb_lan = cd.codi_cta
-        LEFT JOIN
-            BETHADBA.CTCONTAS AS cc ON l.ccre_lan = cc.codi_cta
-        WHERE
-            l.data_lan IS NOT NULL 
-            AND l.data_lan >= '2019-01-01'
-            AND l.vlor_lan > 0
-            AND e.cgce_emp IS NOT NULL AND e.cgce_emp <> ''
-        ORDER BY
-            l.data_lan, l.nume_lan
-        """
-        
-        try:
-            self.stdout.write("\n[2/4] Contando o número total de lançamentos a serem importados...")
-            cursor = connection.cursor()
-            cursor.execute(count_query)
-            total_lancamentos = cursor.fetchone()[0]
-            self.stdout.write(self.style.SUCCESS(f"✓ Total de lançamentos a serem processados do Sybase: {total_lancamentos:,}"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Erro ao contar lançamentos no Sybase: {e}"))
-            return
+        if options['incremental']:
+            self.stdout.write(f"\n[2/4] Modo incremental: {len(extratores)} extração(ões) a partir das marcas d'água (look-back de {options['lookback_dias']} dias).")
+        else:
+            count_query = f"""
+            SELECT COUNT(*)
+            FROM
+                BETHADBA.CTLANCTO l
+            INNER JOIN
+                BETHADBA.GEEMPRE e ON l.codi_emp = e.codi_emp
+            WHERE {self.WHERE_LANCAMENTOS}
+            """
+            try:
+                self.stdout.write("\n[2/4] Contando o número total de lançamentos a serem importados...")
+                cursor = connection.cursor()
+                cursor.execute(count_query)
+                total_lancamentos = cursor.fetchone()[0]
+                self.stdout.write(self.style.SUCCESS(f"✓ Total de lançamentos a serem processados do Sybase: {total_lancamentos:,}"))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Erro ao contar lançamentos no Sybase: {e}"))
+                return
             
         self.stdout.write("\n[3/4] Iniciando importação dos lançamentos...")
-        cursor.execute(query)
-        data_iterator = iter(lambda: cursor.fetchone(), None)
-
-        total_lancamentos_criados = 0
-        total_lancamentos_atualizados = 0
-        total_contas_criadas = 0
-        total_lotes = 0
-        total_sem_mapeamento = 0
-        BATCH_SIZE = 2500
-
-        cache_contas = {}
 
-        for batch in batch_iterator(data_iterator, BATCH_SIZE):
-            total_lotes += 1
-            
-            try:
-                with transaction.atomic():
-                    for row in batch:
-                        cnpj_bruto = str(row[1] or '')
-                        documento_limpo = self.limpar_documento(cnpj_bruto)
-
-                        # Aplicar a Regra de Ouro: buscar contabilidade no mapa histórico
-                        contratos_empresa = historical_map.get(documento_limpo)
-                        if not contratos_empresa:
-                            total_sem_mapeamento += 1
-                            continue
-
-                        # Encontrar a contabilidade correta para a data do lançamento
-                        data_lancamento = row[2]
-                        if not data_lancamento:
-                            total_sem_mapeamento += 1
-                            continue
-
-                        # Verificar se a empresa tem contrato nos últimos 5 anos (2019-2025)
-                        # e se o lançamento está no período de importação (01/01/2019 até presente)
-                        from datetime import date
-                        data_limite_5_anos = date(2019, 1, 1)  # Últimos 5 anos (obrigação legal)
-                        data_limite_importacao = date(2019, 1, 1)  # Período de importação
-                        data_atual = date.today()
-                        
-                        # Verificar se o lançamento está no período de importação
-                        if data_lancamento < data_limite_importacao or data_lancamento > data_atual:
-                            total_sem_mapeamento += 1
-                            continue
-
-                        contabilidade = None
-                        contrato_correto = None
-                        contrato_valido = False
-                        
-                        for data_inicio, data_termino, contab, contrato in contratos_empresa:
-                            # Verificar se o contrato está nos últimos 5 anos (2019-2025)
-                            # Contrato é válido se começou em 2019 ou depois, ou se terminou em 2019 ou depois
-                            contrato_nos_ultimos_5_anos = (
-                                (data_inicio and data_inicio >= data_limite_5_anos) or
-                                (data_termino and data_termino >= data_limite_5_anos) or
-                                (data_inicio and data_termino and data_inicio <= data_limite_5_anos <= data_termino)
-                            )
-                            
-                            if contrato_nos_ultimos_5_anos:
-                                contrato_valido = True
-                                # Verificar se o lançamento está dentro do período do contrato
-                                if data_inicio and data_termino and data_inicio <= data_lancamento <= data_termino:
-                                    contabilidade = contab
-                                    contrato_correto = contrato
-                                    break
-                        
-                        # Se não encontrou contrato específico para a data, mas tem contrato válido nos últimos 5 anos,
-                        # usar o contrato mais recente
-                        if not contabilidade and contrato_valido:
-                            # Buscar o contrato mais recente dos últimos 5 anos
-                            contratos_validos = [
-                                (data_inicio, data_termino, contab, contrato) 
-                                for data_inicio, data_termino, contab, contrato in contratos_empresa
-                                if (data_inicio and data_inicio >= data_limite_5_anos) or
-                                   (data_termino and data_termino >= data_limite_5_anos) or
-                                   (data_inicio and data_termino and data_inicio <= data_limite_5_anos <= data_termino)
-                            ]
-                            
-                            if contratos_validos:
-                                # Ordenar por data de início (mais recente primeiro)
-                                contratos_validos.sort(key=lambda x: x[0] or date.min, reverse=True)
-                                data_inicio, data_termino, contabilidade, contrato_correto = contratos_validos[0]
-                        
-                        if not contabilidade:
-                            total_sem_mapeamento += 1
-                            continue
-                        
-                        item = {
-                            'nume_lan': row[0],
-                            'cnpj': cnpj_limpo,
-                            'data_lan': row[2],
-                            'chis_lan': row[3],
-                            'vlor_lan': row[4],
-                            'cdeb_lan': row[5],
-                            'ccre_lan': row[6],
-                            'codi_his': row[7],
-                            'nome_deb': row[8],
-                            'nome_cred': row[9]
-                        }
-                        
-                        # Buscar ou criar conta débito
-                        chave_conta_debito = (contabilidade.id, str(item.get('cdeb_lan')))
-                        if chave_conta_debito not in cache_contas:
-                            conta_debito = PlanoContas.objects.filter(
-                                contabilidade=contabilidade,
-                                id_legado=str(item.get('cdeb_lan'))
-                            ).first()
-                            
-                            if not conta_debito:
-                                conta_debito = self.criar_conta_automatica(connection, contabilidade, item.get('cdeb_lan'), tipo='D')
-                                total_contas_criadas += 1
-                            
-                            cache_contas[chave_conta_debito] = conta_debito
-                        else:
-                            conta_debito = cache_contas[chave_conta_debito]
-                        
-                        # Buscar ou criar conta crédito
-                        chave_conta_credito = (contabilidade.id, str(item.get('ccre_lan')))
-                        if chave_conta_credito not in cache_contas:
-                            conta_credito = PlanoContas.objects.filter(
-                                contabilidade=contabilidade,
-                                id_legado=str(item.get('ccre_lan'))
-                            ).first()
-                            
-                            if not conta_credito:
-                                conta_credito = self.criar_conta_automatica(connection, contabilidade, item.get('ccre_lan'), tipo='C')
-                                total_contas_criadas += 1
-                            
-                            cache_contas[chave_conta_credito] = conta_credito
-                        else:
-                            conta_credito = cache_contas[chave_conta_credito]
-                        
-                        if not item.get('vlor_lan'):
-                            continue
-                        
-                        historico_completo = ''
-                        if item.get('codi_his'):
-                            historico_completo = f"Código: {item.get('codi_his')} - "
-                        if item.get('chis_lan'):
-                            historico_completo += str(item.get('chis_lan') or '').strip()
-                        
-                        lancamento, created = LancamentoContabil.objects.update_or_create(
-                            contabilidade=contabilidade,
-                            contrato=contrato_correto,
-                            numero_lancamento=str(item.get('nume_lan')),
-                            defaults={
-                                'data_lancamento': item.get('data_lan'),
-                                'historico': historico_completo[:1000],
-                                'valor_total': item.get('vlor_lan')
-                            }
-                        )
-                        
-                        if created:
-                            total_lancamentos_criados += 1
-                        else:
-                            total_lancamentos_atualizados += 1
-                        
-                        Partida.objects.filter(lancamento=lancamento).delete()
-                        
-                        Partida.objects.create(lancamento=lancamento, conta=conta_debito, tipo='D', valor=lancamento.valor_total)
-                        Partida.objects.create(lancamento=lancamento, conta=conta_credito, tipo='C', valor=lancamento.valor_total)
-                
-                if total_lotes % 10 == 0:
-                    self.stdout.write(f"Lote {total_lotes} | Criados: {total_lancamentos_criados} | Atualizados: {total_lancamentos_atualizados} | Contas Novas: {total_contas_criadas} | Sem Mapeamento: {total_sem_mapeamento}")
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Erro no lote {total_lotes}: {e}"))
+        inicio_carga = time.time()
+        try:
+            stats = self.processar_paginas(extratores, historical_map, historico=options['historico'])
+        finally:
+            connection.close()
 
-        connection.close()
-        
-        self.stdout.write(self.style.SUCCESS('\n--- Resumo Final ---'))
-        self.stdout.write(f'Total de lançamentos criados: {total_lancamentos_criados}')
-        self.stdout.write(f'Total de lançamentos atualizados: {total_lancamentos_atualizados}')
-        self.stdout.write(f'Total de lançamentos ignorados (sem mapeamento): {total_sem_mapeamento}')
-        self.stdout.write(f'Total de contas criadas automaticamente: {total_contas_criadas}')
-        self.stdout.write(f'Total de lotes processados: {total_lotes}')
-        self.stdout.write(self.style.SUCCESS('--- ETL de Lançamentos Contábeis finalizado (Regra de Ouro) ---'))
\ No newline at end of file
+        self.imprimir_resumo(stats, time.time() - inicio_carga)
@@ -1,13 +1,12 @@
-from django.db import transaction
-from ._base import BaseETLCommand
+from ._base import BaseETLCommand, ETLPipeline
 from apps.core.models import Contabilidade
 from apps.pessoas.models import PessoaJuridica, PessoaFisica, Contrato
 from apps.fiscal.models import NotaFiscal, NotaFiscalItem
-from itertools import islice
-import re
+from itertools import groupby, islice
+from operator import itemgetter
 from decimal import Decimal
 from django.contrib.contenttypes.models import ContentType
-from tqdm import tqdm
+from django.utils import timezone
 
 def batch_iterator(iterator, batch_size):
     """Itera sobre os dados em lotes de tamanho 'batch_size'."""
@@ -20,79 +19,82 @@ def batch_iterator(iterator, batch_size):
 class Command(BaseETLCommand):
     help = 'ETL para importar Notas Fiscais, Serviços e Cupons Fiscais.'
 
+    # Sem simple_history por nota; cada lote é registrado em ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
+
+    # Documentos (notas com todos os itens) por lote/transação
+    BATCH_SIZE = 500
+
+    TIPO_NOTA_MAP = {1: 'ENTRADA', 2: 'SAIDA', 3: 'SERVICO', 4: 'CUPOM'}
+
     def __init__(self):
         super().__init__()
-        self.cache_pessoas = {}
-        self.cache_contabilidades_parceiro = {}  # Cache para contabilidade via parceiro
+        # Caches compartilhados entre ETLs quando executados em processo
+        self.cache_pessoas = self.get_shared_cache('pessoas_por_documento', ('pessoas',))
+        self.cache_contabilidades_parceiro = self.get_shared_cache(
+            'contabilidade_por_parceiro', ('pessoas', 'contratos', 'contabilidades')
+        )  # Cache para contabilidade via parceiro
 
-    def obter_contabilidade_por_parceiro(self, documento):
+    def preparar_parceiros(self, lote):
         """
-        Lógica CORRETA: Identifica a contabilidade baseada no CNPJ/CPF do parceiro,
-        buscando o contrato mais recente onde o parceiro é cliente.
+        Resolve em bloco os parceiros do lote que ainda não estão no cache:
+        poucas queries set-based por tipo de pessoa (pessoas pelo documento e
+        o contrato mais recente de cada uma), em vez de várias queries por
+        documento. Depois disso carregar_lote só consulta dicionários.
         """
-        documento_limpo = re.sub(r'\D', '', str(documento or ''))
-        
-        if not documento_limpo or len(documento_limpo) not in [11, 14]:
-            return None
+        nomes = {}
+        for _chave_nota, itens in lote:
+            documento = self.limpar_documento(itens[0]['CPF_CNPJ_PARCEIRO'])
+            if len(documento) in (11, 14) and documento not in self.cache_contabilidades_parceiro:
+                nome = str(itens[0]['NOME_PARCEIRO'] or '').strip() or 'NOME NÃO INFORMADO'
+                nomes.setdefault(documento, nome)
 
-        if documento_limpo in self.cache_contabilidades_parceiro:
-            return self.cache_contabilidades_parceiro[documento_limpo]
+        for pessoa_model, tamanho in ((PessoaJuridica, 14), (PessoaFisica, 11)):
+            documentos = {documento: nome for documento, nome in nomes.items() if len(documento) == tamanho}
+            if documentos:
+                self.resolver_parceiros(pessoa_model, documentos)
 
-        pessoa_model = PessoaJuridica if len(documento_limpo) == 14 else PessoaFisica
-        filtro_documento = {'cnpj': documento_limpo} if len(documento_limpo) == 14 else {'cpf': documento_limpo}
-        
-        pessoas = pessoa_model.objects.filter(**filtro_documento)
-        if not pessoas.exists():
-            self.cache_contabilidades_parceiro[documento_limpo] = None
-            return None
-
-        content_type = ContentType.objects.get_for_model(pessoa_model)
-        
-        contrato = Contrato.objects.filter(
-            content_type=content_type,
-            object_id__in=pessoas.values_list('id', flat=True)
-        ).select_related('contabilidade').order_by('-data_inicio').first()
-
-        if contrato:
-            self.cache_contabilidades_parceiro[documento_limpo] = contrato.contabilidade
-            return contrato.contabilidade
-            
-        self.cache_contabilidades_parceiro[documento_limpo] = None
-        return None
-
-    def criar_ou_obter_pessoa(self, contabilidade, documento, nome):
+    def resolver_parceiros(self, pessoa_model, nomes):
         """
-        Cria ou obtém uma pessoa (PJ/PF) na contabilidade correta.
+        Preenche os caches para os documentos {documento: nome} de um tipo de
+        pessoa. A contabilidade vem do contrato mais recente em que o parceiro
+        é cliente; sem contrato, o documento fica como sem contabilidade.
+        O nome da pessoa só é regravado (em um bulk_update) quando mudou.
         """
-        documento_limpo = re.sub(r'\D', '', str(documento or ''))
-        
-        if not documento_limpo or len(documento_limpo) not in [11, 14]:
-            return None
+        campo_documento = 'cnpj' if pessoa_model is PessoaJuridica else 'cpf'
+        campos_nome = ('razao_social', 'nome_fantasia') if pessoa_model is PessoaJuridica else ('nome_completo',)
 
-        chave_cache = f"{contabilidade.id}_{documento_limpo}"
-        
-        if chave_cache in self.cache_pessoas:
-            return self.cache_pessoas[chave_cache]
-
-        pessoa = None
-        if len(documento_limpo) == 14:
-            pessoa, _ = PessoaJuridica.objects.update_or_create(
-                cnpj=documento_limpo,
-                defaults={
-                    'razao_social': str(nome or '').strip() or 'NOME NÃO INFORMADO',
-                    'nome_fantasia': str(nome or '').strip() or 'NOME NÃO INFORMADO',
-                }
-            )
-        else:
-            pessoa, _ = PessoaFisica.objects.update_or_create(
-                cpf=documento_limpo,
-                defaults={
-                    'nome_completo': str(nome or '').strip() or 'NOME NÃO INFORMADO',
-                }
-            )
-        
-        self.cache_pessoas[chave_cache] = pessoa
-        return pessoa
+        pessoas = {
+            getattr(pessoa, campo_documento): pessoa
+            for pessoa in pessoa_model.objects.filter(**{f'{campo_documento}__in': list(nomes)})
+        }
+        content_type = ContentType.objects.get_for_model(pessoa_model)
+        contabilidade_por_pessoa = {
+            contrato.object_id: contrato.contabilidade
+            for contrato in Contrato.objects.filter(
+                content_type=content_type,
+                object_id__in=[pessoa.id for pessoa in pessoas.values()],
+            ).select_related('contabilidade').order_by('object_id', '-data_inicio').distinct('object_id')
+        }
+
+        agora = timezone.now()
+        alteradas = []
+        for documento, nome in nomes.items():
+            pessoa = pessoas.get(documento)
+            contabilidade = contabilidade_por_pessoa.get(pessoa.id) if pessoa else None
+            self.cache_contabilidades_parceiro[documento] = contabilidade
+            if contabilidade is None:
+                continue
+
+            if any(getattr(pessoa, campo) != nome for campo in campos_nome):
+                for campo in campos_nome:
+                    setattr(pessoa, campo, nome)
+                pessoa.updated_at = agora
+                alteradas.append(pessoa)
+            self.cache_pessoas[f"{contabilidade.id}_{documento}"] = pessoa
+
+        if alteradas:
+            pessoa_model.objects.bulk_update(alteradas, [*campos_nome, 'updated_at'], batch_size=500)
 
     def determinar_cfop_item(self, cfop_nota, item_cfop):
         """
@@ -102,6 +104,126 @@ class Command(BaseETLCommand):
             return cfop_nota  # Para serviços, usar o CFOP da nota (1933/2933)
         return item_cfop or cfop_nota
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Limitar o número de documentos fiscais processados (padrão: sem limite)',
+        )
+
+    def agrupar_documentos(self, connection, query, limite=None):
+        """
+        Gera (chave_nf, linhas) por documento fiscal. A query vem ordenada
+        por CHAVE_NF, então os itens de um documento são contíguos: o grupo
+        fecha quando a chave muda e só o documento atual fica em memória.
+        Com limite, a leitura para após esse número de documentos (sempre
+        com todos os itens de cada um).
+        """
+        linhas = self.stream_query(connection, query)
+        documentos = groupby(linhas, key=itemgetter('CHAVE_NF'))
+        for chave_nota, itens in islice(documentos, limite):
+            yield chave_nota, list(itens)
+
+    def carregar_lote(self, lote):
+        """
+        Grava um lote de documentos [(chave_nf, linhas)] na transação atual:
+        upsert da nota e recriação dos itens. Retorna (criados, atualizados, itens criados).
+        """
+        self.preparar_parceiros(lote)
+
+        criados = atualizados = 0
+        itens_novos = []
+        for chave_nota, itens in lote:
+            item_nota = itens[0]
+
+            documento = self.limpar_documento(item_nota['CPF_CNPJ_PARCEIRO'])
+            contabilidade = self.cache_contabilidades_parceiro.get(documento)
+
+            if not contabilidade:
+                self.stdout.write(self.style.WARNING(f"Contabilidade não encontrada para o parceiro {item_nota['CPF_CNPJ_PARCEIRO']}. Pulando doc {chave_nota}"))
+                continue
+
+            parceiro = self.cache_pessoas.get(f"{contabilidade.id}_{documento}")
+            if not parceiro:
+                continue
+
+            tipo_nota = self.TIPO_NOTA_MAP.get(item_nota['TIPO_DOC'], 'SAIDA')
+
+            defaults = {
+                'numero_documento': str(item_nota['NUM_DOCUMENTO'] or ''),
+                'serie': str(item_nota['SERIE'] or ''),
+                'tipo_nota': tipo_nota,
+                'situacao': str(item_nota['SITUACAO'] or ''),
+                'data_emissao': item_nota['DATA_EMISSAO'],
+                'data_entrada_saida': item_nota['DATA_MOVIMENTO'],
+                'valor_total': Decimal(str(item_nota['VALOR_TOTAL_NOTA'] or 0)),
+                'id_legado_empresa': item_nota['CODIGO_EMPRESA'],
+                'id_legado_cli_for': item_nota['CODIGO_PARCEIRO'],
+            }
+
+            if isinstance(parceiro, PessoaJuridica):
+                defaults['parceiro_pj'] = parceiro
+            else:
+                defaults['parceiro_pf'] = parceiro
+
+            nota_fiscal, created = self.update_or_create(
+                NotaFiscal,
+                contabilidade=contabilidade,
+                chave_acesso=chave_nota,
+                defaults=defaults
+            )
+
+            if created: criados += 1
+            else: atualizados += 1
+
+            if not created:
+                # Itens da nota reprocessada são recriados (sem sinais nem histórico por item)
+                NotaFiscalItem.objects.filter(nota_fiscal=nota_fiscal)._raw_delete(NotaFiscalItem.objects.db)
+
+            for item_produto in itens:
+                # Determinar tipo do item baseado no tipo da nota
+                if tipo_nota == 'SERVICO':
+                    tipo_item = 'SERVICO'
+                    ncm_item = None  # Serviços não têm NCM
+                else:
+                    tipo_item = 'PRODUTO'
+                    ncm_item = str(item_produto['NCM_ITEM'] or '')
+                
+                itens_novos.append(NotaFiscalItem(
+                    nota_fiscal=nota_fiscal,
+                    tipo_item=tipo_item,
+                    descricao=str(item_produto['DESCRICAO_ITEM'] or ''),
+                    cfop=self.determinar_cfop_item(str(item_produto.get('CFOP_NOTA')), str(item_produto.get('CFOP_ITEM'))),
+                    ncm=ncm_item,
+                    quantidade=Decimal(str(item_produto['QTDE_ITEM'] or 0)),
+                    valor_unitario=Decimal(str(item_produto['VALOR_UNITARIO_ITEM'] or 0)),
+                    valor_total=Decimal(str(item_produto['VALOR_TOTAL_ITEM'] or 0)),
+                    base_icms=Decimal(str(item_produto['BASE_ICMS_ITEM'] or 0)),
+                    aliquota_icms=Decimal(str(item_produto['ALIQ_ICMS_ITEM'] or 0)),
+                    valor_icms=Decimal(str(item_produto['VALOR_ICMS_ITEM'] or 0)),
+                    base_icms_st=Decimal(str(item_produto['BASE_ICMSST_ITEM'] or 0)),
+                    aliquota_icms_st=Decimal(str(item_produto['ALIQ_ICMSST_ITEM'] or 0)),
+                    valor_icms_st=Decimal(str(item_produto['VALOR_ICMSST_ITEM'] or 0)),
+                    base_ipi=0, valor_ipi=0, aliquota_ipi=0,
+                    base_pis=Decimal(str(item_produto['BASE_PIS_ITEM'] or 0)),
+                    aliquota_pis=0,
+                    valor_pis=Decimal(str(item_produto['VALOR_PIS_ITEM'] or 0)),
+                    cst_pis=str(item_produto['CST_PIS_ITEM'] or ''),
+                    base_cofins=Decimal(str(item_produto['BASE_COFINS_ITEM'] or 0)),
+                    aliquota_cofins=0,
+                    valor_cofins=Decimal(str(item_produto['VALOR_COFINS_ITEM'] or 0)),
+                    cst_cofins=str(item_produto['CST_COFINS_ITEM'] or ''),
+                    valor_desconto=Decimal(str(item_produto['VALOR_DESCONTO_ITEM'] or 0)),
+                    valor_frete=Decimal(str(item_produto['VALOR_FRETE_ITEM'] or 0)),
+                    valor_seguro=0,
+                    valor_outras_despesas=Decimal(str(item_produto['VALOR_DESP_ACES_ITEM'] or 0)),
+                ))
+
+        if itens_novos:
+            NotaFiscalItem.objects.bulk_create(itens_novos, batch_size=2000)
+        return criados, atualizados, len(itens_novos)
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('='*70))
         self.stdout.write(self.style.SUCCESS('--- INICIANDO ETL UNIFICADO DE DOCUMENTOS FISCAIS ---'))
@@ -113,7 +235,7 @@ class Command(BaseETLCommand):
 
         query = """
         -- NOTAS DE ENTRADA (PRODUTOS)
-        SELECT TOP 10
+        SELECT
             1 as TIPO_DOC,
             EFMVEPRO.CODI_EMP as CODIGO_EMPRESA,
             EFENTRADAS.NUME_ENT as NUM_DOCUMENTO,
@@ -158,7 +280,7 @@ class Command(BaseETLCommand):
         UNION ALL
         
         -- NOTAS DE SAÍDA (PRODUTOS)
-        SELECT TOP 10
+        SELECT
             2 as TIPO_DOC,
             EFMVSPRO.CODI_EMP as CODIGO_EMPRESA,
             EFSAIDAS.NUME_SAI as NUM_DOCUMENTO,
@@ -203,7 +325,7 @@ class Command(BaseETLCommand):
         UNION ALL
         
         -- NOTAS DE SERVIÇO (CFOPs 1933/2933)
-        SELECT TOP 10
+        SELECT
             3 as TIPO_DOC,
             EFSERVICOS.CODI_EMP as CODIGO_EMPRESA,
             EFSERVICOS.NUME_NS as NUM_DOCUMENTO,
@@ -244,136 +366,49 @@ class Command(BaseETLCommand):
         WHERE EFSERVICOS.CHAVE_NFE_NS IS NOT NULL AND EFSERVICOS.CHAVE_NFE_NS != '' 
             AND EFSERVICOS.DTEM_NS >= '2019-01-01'
             AND EFSERVICOS.CFOP_NS IN ('1933', '2933')
+
+        -- Itens do mesmo documento ficam contíguos: agrupados em stream
+        ORDER BY CHAVE_NF, TIPO_DOC
         """
 
-        self.stdout.write("Executando query unificada de documentos fiscais...")
-        cursor = connection.cursor()
-        
-        self.stdout.write("Contando registros na query...")
-        # Executar a query e contar os registros no Python para evitar problemas com subquery
-        cursor.execute(query)
-        all_rows = cursor.fetchall()
-        total_rows = len(all_rows)
-        self.stdout.write(f"Total de registros a serem processados (após filtro de data): {total_rows:,}")
-        
-        # Resetar o cursor para o início dos dados
-        data_iterator = iter(all_rows)
+        self.stdout.write("Executando query unificada de documentos fiscais (ordenada por CHAVE_NF)...")
 
-        total_notas_criadas = 0
-        total_notas_atualizadas = 0
-        total_itens_criados = 0
-        BATCH_SIZE = 500
-        
-        notas_agrupadas = {}
-        self.stdout.write("Agrupando dados por chave do documento...")
-        
-        for row in tqdm(data_iterator, total=total_rows, desc="Processando Registros"):
-            item = dict(zip([desc[0] for desc in cursor.description], row))
-            chave_nota = item['CHAVE_NF']
-            if chave_nota not in notas_agrupadas:
-                notas_agrupadas[chave_nota] = {'dados_nota': item, 'itens': []}
-            notas_agrupadas[chave_nota]['itens'].append(item)
-
-        self.stdout.write(f"Total de documentos únicos encontrados: {len(notas_agrupadas):,}")
-        
-        total_lotes = 0
-        for batch in tqdm(batch_iterator(iter(notas_agrupadas.items()), BATCH_SIZE), total=len(notas_agrupadas)//BATCH_SIZE, desc="Importando Lotes"):
-            total_lotes += 1
-            try:
-                with transaction.atomic():
-                    for chave_nota, dados_agrupados in batch:
-                        item_nota = dados_agrupados['dados_nota']
-                        
-                        contabilidade = self.obter_contabilidade_por_parceiro(documento=item_nota['CPF_CNPJ_PARCEIRO'])
-                        
-                        if not contabilidade:
-                            self.stdout.write(self.style.WARNING(f"Contabilidade não encontrada para o parceiro {item_nota['CPF_CNPJ_PARCEIRO']}. Pulando doc {chave_nota}"))
-                            continue
-
-                        parceiro = self.criar_ou_obter_pessoa(
-                            contabilidade=contabilidade,
-                            documento=item_nota['CPF_CNPJ_PARCEIRO'],
-                            nome=item_nota['NOME_PARCEIRO']
-                        )
-                        
-                        if not parceiro:
-                            continue
-
-                        tipo_nota_map = {1: 'ENTRADA', 2: 'SAIDA', 3: 'SERVICO', 4: 'CUPOM'}
-                        tipo_nota = tipo_nota_map.get(item_nota['TIPO_DOC'], 'SAIDA')
-
-                        defaults = {
-                            'numero_documento': str(item_nota['NUM_DOCUMENTO'] or ''),
-                            'serie': str(item_nota['SERIE'] or ''),
-                            'tipo_nota': tipo_nota,
-                            'situacao': str(item_nota['SITUACAO'] or ''),
-                            'data_emissao': item_nota['DATA_EMISSAO'],
-                            'data_entrada_saida': item_nota['DATA_MOVIMENTO'],
-                            'valor_total': Decimal(str(item_nota['VALOR_TOTAL_NOTA'] or 0)),
-                            'id_legado_empresa': item_nota['CODIGO_EMPRESA'],
-                            'id_legado_cli_for': item_nota['CODIGO_PARCEIRO'],
-                        }
-                        
-                        if isinstance(parceiro, PessoaJuridica):
-                            defaults['parceiro_pj'] = parceiro
-                        else:
-                            defaults['parceiro_pf'] = parceiro
-
-                        nota_fiscal, created = NotaFiscal.objects.update_or_create(
-                            contabilidade=contabilidade,
-                            chave_acesso=chave_nota,
-                            defaults=defaults
-                        )
-
-                        if created: total_notas_criadas += 1
-                        else: total_notas_atualizadas += 1
-
-                        nota_fiscal.itens.all().delete()
-                        
-                        for item_produto in dados_agrupados['itens']:
-                            # Determinar tipo do item baseado no tipo da nota
-                            if tipo_nota == 'SERVICO':
-                                tipo_item = 'SERVICO'
-                                ncm_item = None  # Serviços não têm NCM
-                            else:
-                                tipo_item = 'PRODUTO'
-                                ncm_item = str(item_produto['NCM_ITEM'] or '')
-                            
-                            NotaFiscalItem.objects.create(
-                                nota_fiscal=nota_fiscal,
-                                tipo_item=tipo_item,
-                                descricao=str(item_produto['DESCRICAO_ITEM'] or ''),
-                                cfop=self.determinar_cfop_item(str(item_produto.get('CFOP_NOTA')), str(item_produto.get('CFOP_ITEM'))),
-                                ncm=ncm_item,
-                                quantidade=Decimal(str(item_produto['QTDE_ITEM'] or 0)),
-                                valor_unitario=Decimal(str(item_produto['VALOR_UNITARIO_ITEM'] or 0)),
-                                valor_total=Decimal(str(item_produto['VALOR_TOTAL_ITEM'] or 0)),
-                                base_icms=Decimal(str(item_produto['BASE_ICMS_ITEM'] or 0)),
-                                aliquota_icms=Decimal(str(item_produto['ALIQ_ICMS_ITEM'] or 0)),
-                                valor_icms=Decimal(str(item_produto['VALOR_ICMS_ITEM'] or 0)),
-                                base_icms_st=Decimal(str(item_produto['BASE_ICMSST_ITEM'] or 0)),
-                                aliquota_icms_st=Decimal(str(item_produto['ALIQ_ICMSST_ITEM'] or 0)),
-                                valor_icms_st=Decimal(str(item_produto['VALOR_ICMSST_ITEM'] or 0)),
-                                base_ipi=0, valor_ipi=0, aliquota_ipi=0,
-                                base_pis=Decimal(str(item_produto['BASE_PIS_ITEM'] or 0)),
-                                aliquota_pis=0,
-                                valor_pis=Decimal(str(item_produto['VALOR_PIS_ITEM'] or 0)),
-                                cst_pis=str(item_produto['CST_PIS_ITEM'] or ''),
-                                base_cofins=Decimal(str(item_produto['BASE_COFINS_ITEM'] or 0)),
-                                aliquota_cofins=0,
-                                valor_cofins=Decimal(str(item_produto['VALOR_COFINS_ITEM'] or 0)),
-                                cst_cofins=str(item_produto['CST_COFINS_ITEM'] or ''),
-                                valor_desconto=Decimal(str(item_produto['VALOR_DESCONTO_ITEM'] or 0)),
-                                valor_frete=Decimal(str(item_produto['VALOR_FRETE_ITEM'] or 0)),
-                                valor_seguro=0,
-                                valor_outras_despesas=Decimal(str(item_produto['VALOR_DESP_ACES_ITEM'] or 0)),
-                            )
-                            total_itens_criados += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Erro no lote {total_lotes}: {e}'))
-                continue
+        stats = {'notas_criadas': 0, 'notas_atualizadas': 0, 'itens_criados': 0, 'documentos': 0, 'linhas': 0}
+        pipeline = ETLPipeline(self)
+
+        def gravar(lote, _resultado):
+            with self.transacao():
+                criados, atualizados, itens_criados = self.carregar_lote(lote)
+                self.registrar_lote(NotaFiscal, lote[0][0], lote[-1][0], criados, atualizados)
+            stats['notas_criadas'] += criados
+            stats['notas_atualizadas'] += atualizados
+            stats['itens_criados'] += itens_criados
+            stats['documentos'] += len(lote)
+            stats['linhas'] += sum(len(itens) for _, itens in lote)
+
+            if (pipeline.lotes + 1) % 10 == 0:
+                self.stdout.write(f"Lote {pipeline.lotes + 1} | Documentos: {stats['documentos']:,} | Criados: {stats['notas_criadas']:,} | Atualizados: {stats['notas_atualizadas']:,}")
+
+        def ao_erro(lote, e):
+            self.stdout.write(self.style.ERROR(f'Erro no lote {pipeline.lotes + 1}: {e}'))
+
+        # Leitura e agrupamento no Sybase enquanto o lote anterior é gravado;
+        # a memória fica limitada a poucos lotes de documentos
+        documentos = self.agrupar_documentos(connection, query, options['limit'])
+        try:
+            pipeline.executar(
+                batch_iterator(documentos, self.BATCH_SIZE), gravar, ao_erro=ao_erro,
+                linhas_do_lote=lambda lote: sum(len(itens) for _, itens in lote),
+            )
+        finally:
+            connection.close()
+        self.stdout.write(pipeline.resumo())
 
-        connection.close()
+        total_notas_criadas = stats['notas_criadas']
+        total_notas_atualizadas = stats['notas_atualizadas']
+        total_itens_criados = stats['itens_criados']
+        total_lotes = pipeline.lotes
+        self.stdout.write(f"Documentos únicos processados: {stats['documentos']:,} ({stats['linhas']:,} linhas do Sybase)")
         self.stdout.write(self.style.SUCCESS('='*70))
         self.stdout.write(self.style.SUCCESS('--- ESTATÍSTICAS FINAIS ---'))
         self.stdout.write(self.style.SUCCESS(f'✓ Documentos criados: {total_notas_criadas:,}'))
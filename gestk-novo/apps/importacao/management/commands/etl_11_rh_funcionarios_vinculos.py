@@ -47,20 +47,14 @@ class Command(BaseETLCommand):
             bethadba.geempre ge ON fe.codi_emp = ge.codi_emp
         WHERE fe.admissao >= '2019-01-01'
         """
+        # PASSO 3: Processamento e Carga (linhas lidas do Sybase sob demanda)
+        self.stdout.write(self.style.HTTP_INFO('\n[3/4] Processando e carregando dados no Gestk...'))
         try:
-            data = self.execute_query(connection, query)
+            data = self.stream_query(connection, query)
+            stats = self.processar_dados(data, historical_map, cargos_map, deptos_map, ccustos_map)
         finally:
             connection.close()
         
-        if not data:
-            self.stdout.write(self.style.WARNING('Nenhum funcionário encontrado no Sybase.'))
-            return
-        self.stdout.write(self.style.SUCCESS(f"✓ {len(data):,} registros de funcionários extraídos."))
-
-        # PASSO 3: Processamento e Carga
-        self.stdout.write(self.style.HTTP_INFO('\n[3/4] Processando e carregando dados no Gestk...'))
-        stats = self.processar_dados(data, historical_map, cargos_map, deptos_map, ccustos_map)
-        
         # PASSO 4: Resumo
         self.stdout.write(self.style.SUCCESS('\n--- Resumo do ETL ---'))
         self.stdout.write(f"  - Pessoas Físicas (Funcionários) Criadas: {stats['pf_criadas']}")
@@ -76,7 +70,7 @@ class Command(BaseETLCommand):
         stats = {'pf_criadas': 0, 'emp_criados': 0, 'func_criados': 0, 'vinc_criados': 0, 'vinc_atualizados': 0, 'erros': 0, 'sem_contabilidade': 0}
         batch_size = 500
 
-        for lote in tqdm(batch_iterator(data, batch_size), total=(len(data) + batch_size - 1) // batch_size, desc="Processando Lotes"):
+        for lote in tqdm(batch_iterator(data, batch_size), desc="Processando Lotes"):
             with transaction.atomic():
                 for row in lote:
                     try:
@@ -1,5 +1,4 @@
 import re
-from django.db import transaction
 from tqdm import tqdm
 from django.contrib.contenttypes.models import ContentType
 
@@ -7,17 +6,7 @@ from ._base import BaseETLCommand
 from apps.core.models import Contabilidade
 from apps.pessoas.models import PessoaJuridica, PessoaFisica, Contrato
 from apps.funcionarios.models import Rubrica
-
-def batch_iterator(iterator, batch_size):
-    """Gera lotes de um iterador."""
-    batch = []
-    for item in iterator:
-        batch.append(item)
-        if len(batch) >= batch_size:
-            yield batch
-            batch = []
-    if batch:
-        yield batch
+from apps.importacao.loaders import CopyLoader
 
 class Command(BaseETLCommand):
     help = 'ETL para importar as Rubricas (Eventos) de RH do Sybase.'
@@ -53,58 +42,60 @@ class Command(BaseETLCommand):
 
         self.stdout.write(self.style.HTTP_INFO('\n[3/3] Processando e carregando dados no Gestk...'))
         
-        stats = {'criados': 0, 'atualizados': 0, 'erros': 0, 'sem_contabilidade': 0}
-        batch_size = 1000
-
-        for lote in tqdm(batch_iterator(data, batch_size), total=(len(data) + batch_size - 1) // batch_size, desc="Processando Lotes de Rubricas"):
-            with transaction.atomic():
-                for row in lote:
-                    try:
-                        documento_empregador = self.limpar_documento(row['cgce_emp'])
-                        contabilidade = cpf_map.get(documento_empregador) if len(documento_empregador) == 11 else cnpj_map.get(documento_empregador)
-                        
-                        if not contabilidade:
-                            stats['sem_contabilidade'] += 1
-                            continue
-                        
-                        # Mapeando o tipo de provento/desconto
-                        tipo_rubrica = 'B' # Default para 'Base'
-                        if row['prov_desc'] == 1:
-                            tipo_rubrica = 'P' # Provento
-                        elif row['prov_desc'] == 2:
-                            tipo_rubrica = 'D' # Desconto
-
-                        defaults = {
-                            'nome': row['nome'],
-                            'tipo': tipo_rubrica,
-                            'incide_inss': True if row['base_inss'] == 'S' else False,
-                            'incide_irrf': True if row['base_irrf'] == 'S' else False,
-                            'incide_fgts': True if row['base_fgts'] == 'S' else False,
-                            'ativo': True if row['situacao'] == 'A' else False
-                        }
-                        
-                        rubrica, created = Rubrica.objects.update_or_create(
-                            contabilidade=contabilidade,
-                            id_legado=str(row['i_eventos']),
-                            defaults=defaults
-                        )
-
-                        if created:
-                            stats['criados'] += 1
-                        else:
-                            stats['atualizados'] += 1
-                    
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"Erro ao processar rubrica com i_eventos={row.get('i_eventos')}: {e}"))
-                        stats['erros'] += 1
+        stats = {'criados': 0, 'atualizados': 0, 'inalterados': 0, 'erros': 0, 'sem_contabilidade': 0}
+
+        # Upsert via COPY + ON CONFLICT (contabilidade, id_legado)
+        loader = CopyLoader(
+            Rubrica,
+            chave=('contabilidade', 'id_legado'),
+            campos=('nome', 'tipo', 'incide_inss', 'incide_irrf', 'incide_fgts', 'ativo'),
+        )
+        resultado = loader.carregar(self.transformar_rubricas(tqdm(data, desc="Processando Rubricas"), cnpj_map, cpf_map, stats))
+        stats['criados'] += resultado.criados
+        stats['atualizados'] += resultado.atualizados
+        stats['inalterados'] += resultado.inalterados
 
         self.stdout.write(self.style.SUCCESS('\n--- Resumo do ETL de Rubricas ---'))
         self.stdout.write(f"  - Rubricas Criadas: {stats['criados']}")
         self.stdout.write(f"  - Rubricas Atualizadas: {stats['atualizados']}")
+        self.stdout.write(f"  - Rubricas Inalteradas: {stats['inalterados']}")
         self.stdout.write(f"  - Registros sem contabilidade mapeada: {stats['sem_contabilidade']}")
         self.stdout.write(self.style.ERROR(f"  - Erros: {stats['erros']}"))
         self.stdout.write(self.style.SUCCESS('--- ETL de Rubricas de RH Finalizado ---'))
 
+    def transformar_rubricas(self, data, cnpj_map, cpf_map, stats):
+        """Gera as linhas de Rubrica (dicts) para o CopyLoader."""
+        for row in data:
+            try:
+                documento_empregador = self.limpar_documento(row['cgce_emp'])
+                contabilidade = cpf_map.get(documento_empregador) if len(documento_empregador) == 11 else cnpj_map.get(documento_empregador)
+                
+                if not contabilidade:
+                    stats['sem_contabilidade'] += 1
+                    continue
+                
+                # Mapeando o tipo de provento/desconto
+                tipo_rubrica = 'B' # Default para 'Base'
+                if row['prov_desc'] == 1:
+                    tipo_rubrica = 'P' # Provento
+                elif row['prov_desc'] == 2:
+                    tipo_rubrica = 'D' # Desconto
+
+                yield {
+                    'contabilidade': contabilidade,
+                    'id_legado': str(row['i_eventos']),
+                    'nome': row['nome'],
+                    'tipo': tipo_rubrica,
+                    'incide_inss': True if row['base_inss'] == 'S' else False,
+                    'incide_irrf': True if row['base_irrf'] == 'S' else False,
+                    'incide_fgts': True if row['base_fgts'] == 'S' else False,
+                    'ativo': True if row['situacao'] == 'A' else False
+                }
+            
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Erro ao processar rubrica com i_eventos={row.get('i_eventos')}: {e}"))
+                stats['erros'] += 1
+
     def build_contabilidade_maps(self):
         cnpj_map = {}
         cpf_map = {}
@@ -33,7 +33,7 @@ class Command(BaseETLCommand):
         FROM bethadba.foaltesal a
         WHERE a.competencia >= '2019-01-01'
         """
-        data = self.execute_query(connection, query)
+        data = self.stream_query(connection, query)
         stats = {'criados': 0, 'atualizados': 0, 'erros': 0, 'sem_vinculo': 0, 'sem_contabilidade': 0}
 
         for row in tqdm(data, desc="Processando Hist. Salários"):
@@ -74,7 +74,7 @@ class Command(BaseETLCommand):
         FROM bethadba.fotrocas t
         WHERE t.tabela_troca = 2 AND t.data_troca >= '2019-01-01'
         """
-        data = self.execute_query(connection, query)
+        data = self.stream_query(connection, query)
         stats = {'criados': 0, 'atualizados': 0, 'erros': 0, 'sem_vinculo': 0, 'sem_cargo': 0, 'sem_contabilidade': 0}
 
         for row in tqdm(data, desc="Processando Hist. Cargos"):
@@ -41,11 +41,7 @@ class Command(BaseETLCommand):
             FROM bethadba.FOFERIAS_AQUISITIVOS fa
             WHERE fa.ini_per_aquis >= '2019-01-01'
             """
-            data = self.execute_query(connection, query)
-            if not data:
-                self.stdout.write(self.style.WARNING('Nenhum período aquisitivo encontrado.'))
-                return
-            self.stdout.write(self.style.SUCCESS(f"✓ {len(data):,} registros de períodos aquisitivos extraídos."))
+            data = self.stream_query(connection, query)
 
             self.stdout.write(self.style.HTTP_INFO('\n[4/4] Processando e carregando dados no Gestk...'))
             stats = self.processar_dados(data, vinculos_map, historical_map)
@@ -76,7 +72,7 @@ class Command(BaseETLCommand):
         batch_size = 1000
         situacao_map = {1: 'A', 2: 'F', 3: 'P'} # Aberto, Fechado, Programado
 
-        for lote in tqdm(batch_iterator(data, batch_size), total=(len(data) + batch_size - 1) // batch_size, desc="Processando Lotes"):
+        for lote in tqdm(batch_iterator(data, batch_size), desc="Processando Lotes"):
             with transaction.atomic():
                 for row in lote:
                     try:
@@ -39,10 +39,6 @@ class Command(BaseETLCommand):
 
             self.stdout.write(self.style.HTTP_INFO('\n[4/5] Extraindo dados de Gozo de Férias (desde 2019)...'))
             data = self.extract_gozo_ferias(connection)
-            if not data:
-                self.stdout.write(self.style.WARNING('Nenhum registro de gozo de férias encontrado.'))
-                return
-            self.stdout.write(self.style.SUCCESS(f"✓ {len(data):,} registros de gozo de férias extraídos."))
 
             self.stdout.write(self.style.HTTP_INFO('\n[5/5] Processando e carregando dados no Gestk...'))
             stats = self.processar_dados(data, periodos_map, valores_map, historical_map)
@@ -84,7 +80,7 @@ class Command(BaseETLCommand):
         WHERE m.TIPO_PROCES = 60 AND fs.i_ferias_gozo IS NOT NULL
         GROUP BY fs.i_ferias_gozo, m.i_eventos
         """
-        movimentos_data = self.execute_query(connection, query_movimentos)
+        movimentos_data = self.stream_query(connection, query_movimentos)
         
         valores_map = {}
         for mov in movimentos_data:
@@ -113,13 +109,13 @@ class Command(BaseETLCommand):
         FROM bethadba.FOFERIAS_GOZO fg
         WHERE fg.gozo_inicio >= '2019-01-01'
         """
-        return self.execute_query(connection, query)
+        return self.stream_query(connection, query)
 
     def processar_dados(self, data, periodos_map, valores_map, historical_map):
         stats = {'criados': 0, 'atualizados': 0, 'erros': 0, 'sem_periodo': 0, 'sem_contabilidade': 0}
         batch_size = 1000
 
-        for lote in tqdm(batch_iterator(data, batch_size), total=(len(data) + batch_size - 1) // batch_size, desc="Processando Lotes"):
+        for lote in tqdm(batch_iterator(data, batch_size), desc="Processando Lotes"):
             with transaction.atomic():
                 for row in lote:
                     try:
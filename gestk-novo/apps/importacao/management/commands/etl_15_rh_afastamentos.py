@@ -48,10 +48,7 @@ class Command(BaseETLCommand):
         """
         
         try:
-            cursor = conn.cursor()
-            cursor.execute(query)
-            afastamentos_data = cursor.fetchall()
-            self.stdout.write(self.style.SUCCESS(f"Total de {len(afastamentos_data)} registros de afastamento encontrados (desde 2019)."))
+            afastamentos_data = self.stream_query(conn, query)
             
             total_criados = 0
             total_atualizados = 0
@@ -100,7 +97,6 @@ class Command(BaseETLCommand):
         except pyodbc.Error as e:
             self.stdout.write(self.style.ERROR(f"Erro ao buscar dados de afastamentos: {e}"))
         finally:
-            cursor.close()
             conn.close()
 
     def build_vinculos_map(self):
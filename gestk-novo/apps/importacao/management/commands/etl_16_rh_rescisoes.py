@@ -22,10 +22,6 @@ class Command(BaseETLCommand):
 
             self.stdout.write(self.style.HTTP_INFO('\n[2/3] Extraindo dados de Rescisões (desde 2019)...'))
             rescisoes_data = self.extract_rescisoes(connection)
-            if not rescisoes_data:
-                self.stdout.write(self.style.WARNING('Nenhum registro de rescisão encontrado.'))
-                return
-            self.stdout.write(self.style.SUCCESS(f"✓ {len(rescisoes_data):,} registros de rescisão extraídos."))
 
             self.stdout.write(self.style.HTTP_INFO('\n[3/3] Processando e carregando dados no Gestk...'))
             stats = self.processar_dados(rescisoes_data, historical_map, vinculos_map)
@@ -66,7 +62,7 @@ class Command(BaseETLCommand):
         FROM bethadba.forescisoes
         WHERE demissao >= '2019-01-01'
         """
-        return self.execute_query(connection, query)
+        return self.stream_query(connection, query)
 
     def processar_dados(self, data, historical_map, vinculos_map):
         stats = {'criados': 0, 'atualizados': 0, 'erros': 0, 'sem_vinculo': 0, 'sem_contabilidade': 0}
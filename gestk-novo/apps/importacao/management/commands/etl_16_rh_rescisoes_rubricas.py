@@ -36,12 +36,6 @@ class Command(BaseETLCommand):
             self.stdout.write(self.style.HTTP_INFO('\n[2/4] Extraindo rubricas das rescisões...'))
             self.stdout.flush()
             rubricas_data = self.extract_rubricas_corretas(connection, modo_teste)
-            if not rubricas_data:
-                self.stdout.write(self.style.WARNING('Nenhuma rubrica de rescisão encontrada.'))
-                self.stdout.flush()
-                return
-            self.stdout.write(self.style.SUCCESS(f"✓ {len(rubricas_data):,} registros de rubricas extraídos."))
-            self.stdout.flush()
             
             self.stdout.write(self.style.HTTP_INFO('\n[3/4] Processando e carregando dados...'))
             self.stdout.flush()
@@ -120,7 +114,7 @@ class Command(BaseETLCommand):
         HAVING SUM(m.valor_cal) != 0
         ORDER BY fs.i_calculos, m.i_eventos
         """
-        return self.execute_query(connection, query)
+        return self.stream_query(connection, query)
 
     def processar_dados_corretos(self, data, rescisoes_map, rubricas_map):
         """Processamento CORRETO seguindo a Regra de Ouro: CNPJ/CPF + contabilidade_id."""
@@ -135,6 +129,9 @@ class Command(BaseETLCommand):
         
         # Controle de duplicatas por rescisão usando CNPJ/CPF + contabilidade_id
         rubricas_processadas = set()
+
+        # Mapa histórico construído uma única vez (a Regra de Ouro é resolvida em memória)
+        historical_map = self.build_historical_contabilidade_map()
         
         for row in tqdm(data, desc="Processando Rubricas"):
             try:
@@ -156,7 +153,6 @@ class Command(BaseETLCommand):
                 event_date = row['demissao']
                 
                 # Usar o método da classe base que já implementa a Regra de Ouro
-                historical_map = self.build_historical_contabilidade_map()
                 contabilidade = self.get_contabilidade_for_date(historical_map, codi_emp, event_date)
                 
                 if not contabilidade:
@@ -1,222 +1,238 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
 from decimal import Decimal
-from tqdm import tqdm
-from datetime import datetime
-from apps.importacao.management.commands._base import BaseETLCommand
-from apps.pessoas.models import PessoaFisica, PessoaJuridica
+from itertools import groupby, islice
+from django.utils import timezone
+from apps.importacao.management.commands._base import BaseETLCommand, ETLPipeline
+from apps.pessoas.models import PessoaFisica
 from apps.fiscal.models import NotaFiscal, NotaFiscalItem
 
+# Campos da nota regravados quando o cupom já existe
+CAMPOS_NOTA = (
+    'contabilidade', 'numero_documento', 'serie', 'data_emissao', 'data_entrada_saida', 'situacao',
+    'tipo_nota', 'valor_total', 'parceiro_pf', 'id_legado_nota', 'id_legado_empresa', 'id_legado_cli_for',
+)
+
+
+def batch_iterator(iterator, batch_size):
+    """Itera sobre os dados em lotes de tamanho 'batch_size'."""
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        yield batch
+
 
 class Command(BaseETLCommand):
     help = 'ETL 17: Importação de Cupons Fiscais (CFE e ECF)'
 
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('\n=== ETL 17: CUPONS FISCAIS ==='))
-        
-        # Construir mapa histórico de contabilidades
-        self.stdout.write("\n[1/5] Construindo mapa histórico de contabilidades...")
-        historical_map = self.build_historical_contabilidade_map()
-        
-        # Conectar ao Sybase
-        connection = self.get_sybase_connection()
-        if not connection:
-            return
+    # Sem simple_history por cupom; cada lote é registrado em ETLLoteAuditoria
+    HISTORICO_POR_LOTE = True
+
+    DATA_INICIAL = '2019-01-01'
 
-        # Query com TODOS os dados necessários (cupons + itens)
-        query_completa = """
-        SELECT         
-            emp.nome_emp,  
+    # Cupons e itens em uma única extração ordenada: as linhas de um cupom
+    # são contíguas. O LEFT JOIN mantém cupons sem itens (valor total 0).
+    QUERY_CUPONS = """
+        SELECT
             emp.cgce_emp,
-            ef.codi_emp, 
+            ef.codi_emp,
             ef.I_CFE,
             ef.chave_cfe,
+            ef.DATA_CFE,
             pd.codi_pdi,
             pd.desc_pdi,
             pd.cncm_pdi,
             efe.quantidade,
             efe.valor_unitario,
-            efe.VALOR_PRODUTO,
-            ef.DATA_CFE
+            efe.VALOR_PRODUTO
         FROM BETHADBA.EFCUPOM_FISCAL_ELETRONICO ef
         INNER JOIN BETHADBA.GEEMPRE emp ON emp.codi_emp = ef.codi_emp
-        INNER JOIN BETHADBA.EFCUPOM_FISCAL_ELETRONICO_ESTOQUE efe ON efe.codi_emp = ef.codi_emp AND efe.I_CFE = ef.I_CFE
-        INNER JOIN BETHADBA.EFPRODUTOS pd ON pd.codi_emp = efe.codi_emp AND pd.codi_pdi = efe.codi_pdi
-        WHERE ef.chave_cfe IS NOT NULL AND ef.chave_cfe != '' 
-            AND ef.DATA_CFE >= '2019-01-01'
-        ORDER BY ef.codi_emp, ef.I_CFE, efe.codi_pdi
+        LEFT JOIN (
+            BETHADBA.EFCUPOM_FISCAL_ELETRONICO_ESTOQUE efe
+            INNER JOIN BETHADBA.EFPRODUTOS pd ON pd.codi_emp = efe.codi_emp AND pd.codi_pdi = efe.codi_pdi
+        ) ON efe.codi_emp = ef.codi_emp AND efe.I_CFE = ef.I_CFE
+        WHERE ef.chave_cfe IS NOT NULL AND ef.chave_cfe != ''
+            AND ef.DATA_CFE >= ?
+        ORDER BY ef.codi_emp, ef.I_CFE, pd.codi_pdi
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Limitar o número de cupons processados (padrão: sem limite)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Cupons por lote/transação (padrão: 1000)',
+        )
+
+    def agrupar_cupons(self, connection, limite=None):
+        """
+        Gera ((codi_emp, I_CFE), linhas) por cupom a partir da extração
+        ordenada, lida em páginas de fetchmany; só o cupom atual fica em
+        memória. Com limite, a leitura para após esse número de cupons.
         """
+        linhas = self.stream_query(connection, self.QUERY_CUPONS, (self.DATA_INICIAL,))
+        cupons = groupby(linhas, key=lambda linha: (linha['codi_emp'], linha['I_CFE']))
+        for chave, itens in islice(cupons, limite):
+            yield chave, list(itens)
 
-        self.stdout.write("Executando query de cupons fiscais...")
-        cursor = connection.cursor()
-        
-        # Configurações de importação
-        BATCH_SIZE = 1000  # Cupons por bloco
-        MAX_CUPONS = 10000  # Limite para teste (10 mil cupons)
-        
-        # ABORDAGEM ULTRA OTIMIZADA - Cupons únicos primeiro
-        self.stdout.write("Executando query otimizada de cupons únicos...")
-        
-        # PASSO 1: Buscar apenas cupons únicos (sem itens)
-        query_cupons = f"""
-        SELECT TOP {MAX_CUPONS}
-            emp.nome_emp,  
-            emp.cgce_emp,
-            ef.codi_emp, 
-            ef.I_CFE,
-            ef.chave_cfe,
-            ef.DATA_CFE
-        FROM BETHADBA.EFCUPOM_FISCAL_ELETRONICO ef
-        INNER JOIN BETHADBA.GEEMPRE emp ON emp.codi_emp = ef.codi_emp
-        WHERE ef.chave_cfe IS NOT NULL AND ef.chave_cfe != '' 
-            AND ef.DATA_CFE >= '2019-01-01'
-        ORDER BY ef.codi_emp, ef.I_CFE
+    def contabilidade_do_cupom(self, historical_map, cupom):
+        """Regra de Ouro: contabilidade do CNPJ emitente na data do cupom (ou None)."""
+        documento_limpo = self.limpar_documento(cupom['cgce_emp'])
+        if not documento_limpo:
+            return None
+
+        contratos_empresa = historical_map.get(documento_limpo)
+        data_cupom = cupom['DATA_CFE']
+        if not contratos_empresa or not data_cupom:
+            return None
+
+        for periodo in contratos_empresa:
+            if periodo.data_inicio and periodo.data_termino and periodo.data_inicio <= data_cupom <= periodo.data_termino:
+                return periodo.contabilidade_id
+        return None
+
+    def carregar_lote(self, lote, historical_map, pessoa, stats):
+        """
+        Grava um lote de cupons na transação atual: uma consulta dos cupons
+        já importados, bulk_create/bulk_update das notas, um DELETE dos itens
+        antigos e um bulk_create dos itens. Retorna (criados, atualizados, itens criados).
+        Não usa CopyLoader: os itens precisam do id de cada nota e da lista
+        das notas reimportadas, e o CopyLoader devolve só contadores.
         """
-        
-        self.stdout.write(f"[2/5] Processando {MAX_CUPONS:,} cupons únicos...")
-        
-        cursor.execute(query_cupons)
-        data_cupons = cursor.fetchall()
-        
-        if not data_cupons:
-            self.stdout.write("Nenhum cupom encontrado. Finalizando...")
+        notas = {}
+        for (codi_emp, i_cfe), linhas in lote:
+            cupom = linhas[0]
+            contabilidade_id = self.contabilidade_do_cupom(historical_map, cupom)
+            if not contabilidade_id:
+                stats['sem_contabilidade'] += 1
+                continue
+
+            itens = [linha for linha in linhas if linha['codi_pdi'] is not None]
+            valor_total = sum((Decimal(str(item['VALOR_PRODUTO'] or 0)) for item in itens), Decimal('0.00'))
+            notas[cupom['chave_cfe']] = ({
+                'contabilidade_id': contabilidade_id,
+                'numero_documento': str(i_cfe),
+                'serie': 'CFE',
+                'data_emissao': cupom['DATA_CFE'],
+                'data_entrada_saida': cupom['DATA_CFE'],
+                'situacao': 'AUTORIZADA',
+                'tipo_nota': 'SAIDA',
+                'valor_total': valor_total,
+                'parceiro_pf': pessoa,
+                'id_legado_nota': f"{codi_emp}-{i_cfe}",
+                'id_legado_empresa': str(codi_emp),
+                'id_legado_cli_for': str(i_cfe),
+            }, itens)
+
+        if not notas:
+            return 0, 0, 0
+
+        existentes = NotaFiscal.objects.in_bulk(list(notas), field_name='chave_acesso')
+        novas, alteradas, itens_novos = [], [], []
+        agora = timezone.now()
+        for chave_cfe, (campos, itens) in notas.items():
+            nota_fiscal = existentes.get(chave_cfe)
+            if nota_fiscal is None:
+                nota_fiscal = NotaFiscal(chave_acesso=chave_cfe, **campos)
+                novas.append(nota_fiscal)
+            else:
+                for campo, valor in campos.items():
+                    setattr(nota_fiscal, campo, valor)
+                nota_fiscal.updated_at = agora
+                alteradas.append(nota_fiscal)
+
+            for i, item in enumerate(itens, 1):
+                itens_novos.append(NotaFiscalItem(
+                    nota_fiscal=nota_fiscal,
+                    sequencial_item=i,
+                    tipo_item='PRODUTO',
+                    descricao=item['desc_pdi'] or '',
+                    cfop='5102',
+                    ncm=str(item['cncm_pdi'] or ''),
+                    quantidade=Decimal(str(item['quantidade'] or 0)),
+                    valor_unitario=Decimal(str(item['valor_unitario'] or 0)),
+                    valor_total=Decimal(str(item['VALOR_PRODUTO'] or 0)),
+                ))
+
+        if alteradas:
+            # Itens dos cupons reprocessados são recriados
+            NotaFiscalItem.objects.filter(
+                nota_fiscal_id__in=[nota.id for nota in alteradas]
+            )._raw_delete(NotaFiscalItem.objects.db)
+            NotaFiscal.objects.bulk_update(alteradas, [*CAMPOS_NOTA, 'updated_at'], batch_size=500)
+        if novas:
+            NotaFiscal.objects.bulk_create(novas, batch_size=1000)
+        if itens_novos:
+            NotaFiscalItem.objects.bulk_create(itens_novos, batch_size=2000)
+
+        return len(novas), len(alteradas), len(itens_novos)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('\n=== ETL 17: CUPONS FISCAIS ==='))
+
+        # Construir mapa histórico de contabilidades
+        self.stdout.write("\n[1/4] Construindo mapa histórico de contabilidades...")
+        historical_map = self.build_historical_contabilidade_map()
+
+        # Conectar ao Sybase
+        connection = self.get_sybase_connection()
+        if not connection:
             return
-        
-        # Mapear colunas dos cupons
-        columns_cupons = [column[0] for column in cursor.description]
-        cupons_dict = [dict(zip(columns_cupons, row)) for row in data_cupons]
-        
-        self.stdout.write(f"[3/5] Processando {len(cupons_dict):,} cupons únicos...")
-        
-        # Estatísticas
-        total_notas_criadas = 0
-        total_notas_atualizadas = 0
-        total_itens_criados = 0
-        total_sem_contabilidade = 0
-        total_erros = 0
 
         # Criar pessoa genérica UMA VEZ (otimização)
         pessoa, created = PessoaFisica.objects.get_or_create(
             cpf='00000000000',
-            defaults={'nome': 'CLIENTE CUPOM FISCAL'}
+            defaults={'nome_completo': 'CLIENTE CUPOM FISCAL'}
         )
 
-        # Processar cada cupom (SEM itens por enquanto - apenas notas)
-        for cupom_data in tqdm(cupons_dict, desc="Processando cupons"):
-            try:
-                # Aplicar Regra de Ouro: identificar contabilidade pelo CNPJ da empresa emitente
-                cgce_empresa = cupom_data['cgce_emp']
-                documento_limpo = self.limpar_documento(cgce_empresa)
-                
-                if not documento_limpo:
-                    total_sem_contabilidade += 1
-                    continue
-                
-                # Buscar contabilidade no mapa histórico
-                contratos_empresa = historical_map.get(documento_limpo)
-                if not contratos_empresa:
-                    total_sem_contabilidade += 1
-                    continue
-                
-                # Encontrar a contabilidade correta para a data do cupom
-                data_cupom = cupom_data['DATA_CFE']
-                if not data_cupom:
-                    total_sem_contabilidade += 1
-                    continue
-                
-                # Buscar contabilidade diretamente no mapa
-                contabilidade = None
-                for data_inicio, data_termino, contab in contratos_empresa:
-                    if data_inicio and data_termino and data_inicio <= data_cupom <= data_termino:
-                        contabilidade = contab
-                        break
-                
-                if not contabilidade:
-                    total_sem_contabilidade += 1
-                    continue
-                
-                # Buscar itens do cupom
-                query_itens = f"""
-                SELECT 
-                    pd.codi_pdi,
-                    pd.desc_pdi,
-                    pd.cncm_pdi,
-                    efe.quantidade,
-                    efe.valor_unitario,
-                    efe.VALOR_PRODUTO
-                FROM BETHADBA.EFCUPOM_FISCAL_ELETRONICO_ESTOQUE efe
-                INNER JOIN BETHADBA.EFPRODUTOS pd ON pd.codi_emp = efe.codi_emp AND pd.codi_pdi = efe.codi_pdi
-                WHERE efe.codi_emp = {cupom_data['codi_emp']} AND efe.I_CFE = {cupom_data['I_CFE']}
-                ORDER BY efe.codi_pdi
-                """
-                
-                cursor.execute(query_itens)
-                itens_data = cursor.fetchall()
-                
-                # Calcular valor total do cupom
-                valor_total_cupom = Decimal('0.00')
-                for item_row in itens_data:
-                    valor_item = Decimal(str(item_row[5] or 0))  # VALOR_PRODUTO
-                    valor_total_cupom += valor_item
-                
-                # Criar NotaFiscal com valor total calculado
-                with transaction.atomic():
-                    nota_fiscal, created = NotaFiscal.objects.update_or_create(
-                        contabilidade=contabilidade,
-                        chave_acesso=cupom_data['chave_cfe'],
-                        defaults={
-                            'numero_documento': str(cupom_data['I_CFE']),
-                            'serie': 'CFE',
-                            'data_emissao': cupom_data['DATA_CFE'],
-                            'data_entrada_saida': cupom_data['DATA_CFE'],
-                            'situacao': 'AUTORIZADA',
-                            'tipo_nota': 'SAIDA',
-                            'valor_total': valor_total_cupom,
-                            'parceiro_pf': pessoa,
-                            'id_legado_nota': f"{cupom_data['codi_emp']}-{cupom_data['I_CFE']}",
-                            'id_legado_empresa': str(cupom_data['codi_emp']),
-                            'id_legado_cli_for': str(cupom_data['I_CFE']),
-                        }
-                    )
-                    
-                    if created:
-                        total_notas_criadas += 1
-                    else:
-                        total_notas_atualizadas += 1
-                    
-                    # Limpar itens existentes para reprocessar
-                    NotaFiscalItem.objects.filter(nota_fiscal=nota_fiscal).delete()
-                    
-                    # Criar itens do cupom
-                    for i, item_row in enumerate(itens_data, 1):
-                        NotaFiscalItem.objects.create(
-                            nota_fiscal=nota_fiscal,
-                            sequencial_item=i,
-                            tipo_item='PRODUTO',
-                            descricao=item_row[1] or '',  # desc_pdi
-                            cfop='5102',
-                            ncm=str(item_row[2] or ''),  # cncm_pdi
-                            quantidade=Decimal(str(item_row[3] or 0)),  # quantidade
-                            valor_unitario=Decimal(str(item_row[4] or 0)),  # valor_unitario
-                            valor_total=Decimal(str(item_row[5] or 0)),  # VALOR_PRODUTO
-                        )
-                        total_itens_criados += 1
-                        
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Erro ao processar cupom {cupom_data.get('chave_cfe', 'N/A')}: {e}"))
-                total_erros += 1
-                continue
-        
-        # Fechar conexão
-        connection.close()
-        
+        limite = options['limit']
+        self.stdout.write(
+            f"\n[2/4] Extraindo cupons e itens em uma query ordenada"
+            + (f" (limite de {limite:,} cupons)..." if limite else "...")
+        )
+
+        stats = {'cupons': 0, 'notas_criadas': 0, 'notas_atualizadas': 0, 'itens_criados': 0, 'sem_contabilidade': 0, 'erros': 0}
+        pipeline = ETLPipeline(self)
+
+        def gravar(lote, _resultado):
+            with self.transacao():
+                criados, atualizados, itens_criados = self.carregar_lote(lote, historical_map, pessoa, stats)
+                self.registrar_lote(NotaFiscal, lote[0][0], lote[-1][0], criados, atualizados)
+            stats['cupons'] += len(lote)
+            stats['notas_criadas'] += criados
+            stats['notas_atualizadas'] += atualizados
+            stats['itens_criados'] += itens_criados
+
+            if (pipeline.lotes + 1) % 10 == 0:
+                self.stdout.write(f"Lote {pipeline.lotes + 1} | Cupons: {stats['cupons']:,} | Criados: {stats['notas_criadas']:,} | Atualizados: {stats['notas_atualizadas']:,}")
+
+        def ao_erro(lote, e):
+            stats['erros'] += len(lote)
+            self.stdout.write(self.style.ERROR(f"Erro no lote de cupons {lote[0][0]} a {lote[-1][0]}: {e}"))
+
+        self.stdout.write("\n[3/4] Importando cupons em lotes...")
+        cupons = self.agrupar_cupons(connection, limite)
+        try:
+            pipeline.executar(
+                batch_iterator(cupons, options['batch_size']), gravar, ao_erro=ao_erro,
+                linhas_do_lote=lambda lote: sum(len(linhas) for _, linhas in lote),
+            )
+        finally:
+            connection.close()
+        self.stdout.write(pipeline.resumo())
+
         # Resumo final
-        self.stdout.write(self.style.SUCCESS(f"\n[4/5] RESUMO FINAL:"))
-        self.stdout.write(f"  ✓ Cupons processados: {len(cupons_dict):,}")
-        self.stdout.write(f"  ✓ Notas fiscais criadas: {total_notas_criadas:,}")
-        self.stdout.write(f"  ✓ Notas fiscais atualizadas: {total_notas_atualizadas:,}")
-        self.stdout.write(f"  ✓ Itens criados: {total_itens_criados:,}")
-        self.stdout.write(f"  ✗ Sem contabilidade: {total_sem_contabilidade:,}")
-        self.stdout.write(f"  ✗ Erros: {total_erros:,}")
-        
-        self.stdout.write(self.style.SUCCESS("\n=== ETL 17 CONCLUÍDA (COMPLETA) ==="))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("\n[4/4] RESUMO FINAL:"))
+        self.stdout.write(f"  ✓ Cupons processados: {stats['cupons']:,}")
+        self.stdout.write(f"  ✓ Notas fiscais criadas: {stats['notas_criadas']:,}")
+        self.stdout.write(f"  ✓ Notas fiscais atualizadas: {stats['notas_atualizadas']:,}")
+        self.stdout.write(f"  ✓ Itens criados: {stats['itens_criados']:,}")
+        self.stdout.write(f"  ✗ Sem contabilidade: {stats['sem_contabilidade']:,}")
+        self.stdout.write(f"  ✗ Erros: {stats['erros']:,}")
+
+        self.stdout.write(self.style.SUCCESS("\n=== ETL 17 CONCLUÍDA (COMPLETA) ==="))
@@ -11,19 +11,35 @@ Dados importados:
 """
 
 from django.core.management.base import BaseCommand
+from django.db import connection as pg_connection
 from django.utils import timezone
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from itertools import groupby, islice
+from operator import itemgetter
 import random
 import time
 
-from apps.importacao.management.commands._base import BaseETLCommand
+from apps.importacao.management.commands._base import BaseETLCommand, ETLPipeline
+from apps.importacao.loaders import CopyLoader
 from apps.administracao.models import Usuario, UsuarioContabilidade, UsuarioModulo
 
 
+def batch_iterator(iterator, batch_size):
+    """Itera sobre os dados em lotes de tamanho 'batch_size'."""
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
 class Command(BaseETLCommand):
     help = 'ETL 18 - Importa usuários do sistema legado com mapeamento multitenant'
 
+    # Data de início gravada nos vínculos usuário-empresa
+    DATA_INICIO_VINCULO = date(2023, 1, 1)
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
@@ -40,7 +56,7 @@ class Command(BaseETLCommand):
             '--batch-size',
             type=int,
             default=100,
-            help='Tamanho do lote para processamento (padrão: 100)',
+            help='Usuários por lote/transação (padrão: 100)',
         )
 
     def handle(self, *args, **options):
@@ -62,13 +78,13 @@ class Command(BaseETLCommand):
             self.stdout.write('\n[1] Construindo mapa histórico de contabilidades...')
             contabilidade_historico = self.build_historical_contabilidade_map_cached()
 
-            # 2. Importar vínculos usuário-empresa-módulo do Sybase
+            # 2 e 3. Extrair vínculos usuário-empresa-módulo do Sybase e gravar em lotes de usuários
             self.stdout.write('\n[2] Importando vínculos usuário-empresa-módulo do Sybase...')
-            vinculos = self.fetch_vinculos_usuarios_sybase()
-
-            # 3. Processar vínculos em lotes
+            connection = self.get_sybase_connection()
+            if not connection:
+                return
             self.stdout.write('\n[3] Processando vínculos...')
-            self.processar_vinculos_em_lote(vinculos, contabilidade_historico)
+            self.processar_vinculos_em_lote(self.agrupar_vinculos_por_usuario(connection), contabilidade_historico)
 
             # 4. Relatório final
             self.stdout.write('\n[4] Relatório final...')
@@ -80,13 +96,12 @@ class Command(BaseETLCommand):
         finally:
             self.close_sybase_connection()
 
-    def fetch_vinculos_usuarios_sybase(self):
+    def agrupar_vinculos_por_usuario(self, connection):
         """
-        Busca vínculos usuário-empresa-módulo no Sybase, incluindo usuários administrativos.
-        Retorna lista de dicionários com dados dos vínculos.
+        Gera (nome_usuario, linhas) a partir da extração usuário-empresa-módulo
+        do Sybase, lida em páginas de fetchmany. A query é ordenada por
+        usuário, então as linhas de um usuário são contíguas.
         """
-        self.stdout.write('Buscando vínculos usuário-empresa-módulo no Sybase...')
-
         query = """
         SELECT 
             USCONFUSUARIO.I_USUARIO AS CP_NOME_USUARIO, 
@@ -111,72 +126,203 @@ class Command(BaseETLCommand):
         if self.limit:
             query = f"SELECT TOP {self.limit} * FROM ({query}) AS vinculos"
 
-        connection = self.get_sybase_connection()
-        if not connection:
-            return []
+        for nome_usuario, linhas in groupby(self.stream_query(connection, query), itemgetter('CP_NOME_USUARIO')):
+            yield nome_usuario, list(linhas)
 
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [column[0] for column in cursor.description]
-                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    def processar_vinculos_em_lote(self, usuarios_vinculos, contabilidade_historico):
+        """
+        Grava usuários, vínculos e módulos em lotes de usuários: cada lote é
+        deduplicado em memória e gravado com um upsert (CopyLoader) por tabela.
+        Ao final, vínculos e módulos ausentes da extração são desativados.
+        """
+        stats = {
+            'usuarios': 0, 'linhas': 0, 'erros': 0,
+            'Usuario': [0, 0, 0], 'UsuarioContabilidade': [0, 0, 0], 'UsuarioModulo': [0, 0, 0],
+        }
+        # Chaves vistas na extração, para desativar as ausentes
+        vinculos_vistos, modulos_vistos = set(), set()
+        pipeline = ETLPipeline(self)
 
-            self.stdout.write(f'Encontrados {len(results)} vínculos no Sybase')
-            return results
+        def gravar(lote, _resultado):
+            usuarios, vinculos, modulos = self.montar_lote(lote, contabilidade_historico)
+            vinculos_vistos.update(vinculos)
+            modulos_vistos.update(modulos)
+            stats['usuarios'] += len(lote)
+            stats['linhas'] += sum(len(linhas) for _, linhas in lote)
 
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao buscar vínculos: {e}'))
-            return []
+            if not self.dry_run:
+                with self.transacao():
+                    self.carregar_lote(lote, usuarios, vinculos, modulos, stats)
+
+            if (pipeline.lotes + 1) % 10 == 0:
+                self.stdout.write(f"  Processados: {stats['usuarios']:,} usuários | {stats['linhas']:,} vínculos")
+
+        def ao_erro(lote, e):
+            stats['erros'] += len(lote)
+            self.stdout.write(self.style.ERROR(f'Erro no lote de usuários {lote[0][0]} a {lote[-1][0]}: {e}'))
+
+        pipeline.executar(
+            batch_iterator(usuarios_vinculos, self.batch_size), gravar, ao_erro=ao_erro,
+            linhas_do_lote=lambda lote: sum(len(linhas) for _, linhas in lote),
+        )
+        self.stdout.write(pipeline.resumo())
 
-    def processar_vinculos_em_lote(self, vinculos, contabilidade_historico):
+        desativados = {}
+        if self.dry_run:
+            pass
+        elif self.limit:
+            self.stdout.write(self.style.WARNING('--limit informado: vínculos ausentes não são desativados'))
+        elif not vinculos_vistos:
+            self.stdout.write(self.style.WARNING('Nenhum vínculo extraído: desativação de vínculos ausentes ignorada'))
+        else:
+            desativados['vínculos'] = self.desativar_ausentes(
+                UsuarioContabilidade, ('contabilidade', 'usuario', 'empresa_cnpj'), vinculos_vistos
+            )
+            desativados['módulos'] = self.desativar_ausentes(
+                UsuarioModulo, ('contabilidade', 'usuario', 'modulo_id'), modulos_vistos
+            )
+
+        # Estatísticas do lote
+        self.stdout.write(f'\n✅ Vínculos processados:')
+        self.stdout.write(f"  Usuários processados: {stats['usuarios']:,}")
+        self.stdout.write(f"  Linhas usuário-empresa-módulo: {stats['linhas']:,}")
+        for nome in ('Usuario', 'UsuarioContabilidade', 'UsuarioModulo'):
+            criados, atualizados, inalterados = stats[nome]
+            self.stdout.write(f'  {nome}: {criados:,} criados, {atualizados:,} atualizados, {inalterados:,} inalterados')
+        for nome, total in desativados.items():
+            self.stdout.write(f'  {nome.capitalize()} desativados (ausentes no Sybase): {total:,}')
+        self.stdout.write(f"  Erros (usuários): {stats['erros']:,}")
+
+    def montar_lote(self, lote, contabilidade_historico):
         """
-        Processa vínculos usuário-empresa-módulo em lotes, incluindo usuários administrativos.
-        Agrupa vínculos por usuário e executa processamento individual.
+        Deduplica as linhas (usuário, empresa, módulo) de um lote de usuários.
+
+        Retorna três dicts pela chave unique de cada tabela, com nome_usuario
+        no lugar do id do usuário (resolvido após o upsert de Usuario):
+        - usuarios: {nome_usuario: linha}
+        - vinculos: {(contabilidade_id, nome_usuario, cnpj): linha}, com todos os módulos da empresa
+        - modulos: {(contabilidade_id, nome_usuario, modulo_id): linha}
         """
-        total_vinculos = len(vinculos)
-        total_usuarios = 0
-        total_usuarios_criados = 0
-        total_usuarios_atualizados = 0
-        total_vinculos_criados = 0
-        total_modulos_criados = 0
-        total_erros = 0
-
-        # Agrupa vínculos por usuário
-        usuarios_vinculos = {}
-        for vinculo in vinculos:
-            usuario_nome = vinculo['CP_NOME_USUARIO']
-            if usuario_nome not in usuarios_vinculos:
-                usuarios_vinculos[usuario_nome] = []
-            usuarios_vinculos[usuario_nome].append(vinculo)
-
-        self.stdout.write(f'Processando {len(usuarios_vinculos)} usuários com {total_vinculos} vínculos...')
-
-        # Processa cada usuário
-        for usuario_nome, vinculos_usuario in usuarios_vinculos.items():
-            total_usuarios += 1
-            try:
-                usuario_obj, created = self.processar_usuario_com_vinculos(usuario_nome, vinculos_usuario, contabilidade_historico)
-                if created:
-                    total_usuarios_criados += 1
-                else:
-                    total_usuarios_atualizados += 1
-                total_vinculos_criados += len(vinculos_usuario)
-                total_modulos_criados += len(vinculos_usuario)
-                if len(usuarios_vinculos) > 10 and total_vinculos_criados % 1000 == 0:
-                    self.stdout.write(f'  Processados: {total_vinculos_criados}/{total_vinculos} vínculos')
-                    self.stdout.flush()
-            except Exception as e:
-                total_erros += 1
-                self.stdout.write(self.style.ERROR(f'Erro ao processar usuário {usuario_nome}: {e}'))
+        usuarios, vinculos, modulos = {}, {}, {}
+        for nome_usuario, linhas in lote:
+            for linha in linhas:
+                cnpj_limpo = self.limpar_documento(linha['CP_CNPJ_EMPRESA'])
+                if not cnpj_limpo:
+                    continue
+
+                # Todas as contabilidades que tiveram contratos com esta empresa
+                for contabilidade_id in self.buscar_contabilidades_empresa(contabilidade_historico, cnpj_limpo):
+                    usuarios.setdefault(nome_usuario, {
+                        'id_legado': nome_usuario,
+                        'nome_usuario': nome_usuario,
+                        'tipo_usuario': self.classificar_tipo_usuario_por_nome(nome_usuario),
+                        'ativo': True,
+                    })
+                    vinculo = vinculos.setdefault((contabilidade_id, nome_usuario, cnpj_limpo), {
+                        'empresa_nome': linha['CP_EMPRESA'] or '',
+                        'modulos_acesso': set(),
+                    })
+                    vinculo['modulos_acesso'].add(linha['CP_MODULO'])
+                    modulos.setdefault((contabilidade_id, nome_usuario, linha['CP_MODULO']), {
+                        'modulo_nome': self.obter_nome_modulo(linha['CP_MODULO']),
+                    })
+        return usuarios, vinculos, modulos
+
+    def carregar_lote(self, lote, usuarios, vinculos, modulos, stats):
+        """Um upsert por tabela (Usuario, UsuarioContabilidade, UsuarioModulo) na transação atual."""
+        if not usuarios:
+            return
+
+        resultado = CopyLoader(
+            Usuario, chave=('id_legado',), campos=('nome_usuario', 'tipo_usuario', 'ativo'),
+        ).carregar(usuarios.values())
+        self.somar_resultado(stats, Usuario, resultado, lote)
+
+        usuario_ids = dict(
+            Usuario.objects.filter(id_legado__in=list(usuarios)).values_list('id_legado', 'id')
+        )
 
-        # Estatísticas do lote
-        self.stdout.write(f'\n✅ Lote processado:')
-        self.stdout.write(f'  Usuários processados: {total_usuarios}')
-        self.stdout.write(f'  Usuários criados: {total_usuarios_criados}')
-        self.stdout.write(f'  Usuários atualizados: {total_usuarios_atualizados}')
-        self.stdout.write(f'  Vínculos criados: {total_vinculos_criados}')
-        self.stdout.write(f'  Módulos criados: {total_modulos_criados}')
-        self.stdout.write(f'  Erros: {total_erros}')
+        resultado = CopyLoader(
+            UsuarioContabilidade,
+            chave=('contabilidade', 'usuario', 'empresa_cnpj'),
+            campos=('empresa_nome', 'ativo', 'modulos_acesso'),
+            # Datas do vínculo só na criação; a recarga não sobrescreve as ajustadas no GESTK
+            somente_insercao=('data_inicio', 'data_fim'),
+        ).carregar(
+            {
+                'contabilidade_id': contabilidade_id,
+                'usuario_id': usuario_ids[nome_usuario],
+                'empresa_cnpj': cnpj,
+                'empresa_nome': vinculo['empresa_nome'],
+                'data_inicio': self.DATA_INICIO_VINCULO,
+                'data_fim': None,
+                'ativo': True,
+                'modulos_acesso': sorted(vinculo['modulos_acesso']),
+            }
+            for (contabilidade_id, nome_usuario, cnpj), vinculo in vinculos.items()
+        )
+        self.somar_resultado(stats, UsuarioContabilidade, resultado, lote)
+
+        resultado = CopyLoader(
+            UsuarioModulo,
+            chave=('contabilidade', 'usuario', 'modulo_id'),
+            campos=('modulo_nome', 'ativo'),
+        ).carregar(
+            {
+                'contabilidade_id': contabilidade_id,
+                'usuario_id': usuario_ids[nome_usuario],
+                'modulo_id': modulo_id,
+                'modulo_nome': modulo['modulo_nome'],
+                'ativo': True,
+            }
+            for (contabilidade_id, nome_usuario, modulo_id), modulo in modulos.items()
+        )
+        self.somar_resultado(stats, UsuarioModulo, resultado, lote)
+
+    def somar_resultado(self, stats, model, resultado, lote):
+        totais = stats[model.__name__]
+        for i, valor in enumerate(resultado):
+            totais[i] += valor
+        self.registrar_lote(model, lote[0][0], lote[-1][0], *resultado)
+
+    def desativar_ausentes(self, model, chave, vistos):
+        """
+        Desativa, em um único UPDATE, as linhas ativas de `model` cuja chave
+        (campos de `chave`, na ordem das tuplas de `vistos`, com nome_usuario
+        no lugar do usuário) não apareceu na extração. Retorna as desativadas.
+        """
+        quote = pg_connection.ops.quote_name
+        opts = model._meta
+        campos = [opts.get_field(nome) for nome in chave]
+        campo_usuario = chave.index('usuario')
+
+        usuario_ids = dict(
+            Usuario.objects.filter(id_legado__in={chave_vista[campo_usuario] for chave_vista in vistos})
+            .values_list('id_legado', 'id')
+        )
+        colunas = [[] for _ in campos]
+        for chave_vista in vistos:
+            usuario_id = usuario_ids.get(chave_vista[campo_usuario])
+            if usuario_id is None:
+                continue
+            for i, valor in enumerate(chave_vista):
+                colunas[i].append(usuario_id if i == campo_usuario else valor)
+
+        nomes = [quote(campo.column) for campo in campos]
+        arrays = ', '.join(f'%s::{campo.db_type(pg_connection)}[]' for campo in campos)
+        with self.transacao(), pg_connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(opts.db_table)} AS t "
+                f"SET {quote(opts.get_field('ativo').column)} = FALSE, "
+                f"    {quote(opts.get_field('data_atualizacao').column)} = now() "
+                f"WHERE t.{quote(opts.get_field('ativo').column)} "
+                f"AND NOT EXISTS ("
+                f"  SELECT 1 FROM unnest({arrays}) AS vistos({', '.join(nomes)}) "
+                f"  WHERE {' AND '.join(f'vistos.{nome} = t.{nome}' for nome in nomes)}"
+                f")",
+                colunas,
+            )
+            return cursor.rowcount
 
     def processar_usuario(self, usuario_data, historical_map):
         """Processa um usuário individual"""
@@ -262,91 +408,9 @@ class Command(BaseETLCommand):
         
         return nome_usuario in usuarios_admin
     
-    def processar_usuario_com_vinculos(self, nome_usuario, vinculos_usuario, contabilidade_historico):
-        """
-        Processa um usuário individual e seus vínculos, incluindo administrativos.
-        Cria ou atualiza o usuário e seus vínculos/módulos para cada contabilidade relacionada.
-        """
-        tipo_usuario = self.classificar_tipo_usuario_por_nome(nome_usuario)
-        empresas_processadas = set()
-        usuarios_criados = 0
-
-        for vinculo in vinculos_usuario:
-            codigo_empresa = vinculo['CODIGO_EMPRESA']
-            cnpj_empresa = vinculo['CP_CNPJ_EMPRESA']
-
-            # Evita duplicidade de empresas
-            if codigo_empresa in empresas_processadas:
-                continue
-            empresas_processadas.add(codigo_empresa)
-
-            # Limpa CNPJ
-            cnpj_limpo = self.limpar_documento(cnpj_empresa)
-            if not cnpj_limpo:
-                continue
-
-            # Busca todas as contabilidades que tiveram contratos com esta empresa
-            contabilidades_empresa = self.buscar_contabilidades_empresa(contabilidade_historico, cnpj_limpo)
-            if not contabilidades_empresa:
-                continue
-
-            # Cria usuário para cada contabilidade
-            for contabilidade in contabilidades_empresa:
-                if not self.dry_run:
-                    usuario_obj, created = Usuario.objects.update_or_create(
-                        contabilidade=contabilidade,
-                        cnpj_empresa=cnpj_limpo,
-                        id_legado=nome_usuario,
-                        defaults={
-                            'nome_usuario': nome_usuario,
-                            'tipo_usuario': tipo_usuario,
-                            'ativo': True,
-                            'data_ultimo_acesso': self.gerar_data_ultimo_acesso(),
-                        }
-                    )
-                    if created:
-                        usuarios_criados += 1
-
-                    # Cria vínculo usuário-contabilidade
-                    UsuarioContabilidade.objects.update_or_create(
-                        contabilidade=contabilidade,
-                        usuario=usuario_obj,
-                        data_inicio=datetime(2023, 1, 1),
-                        defaults={
-                            'ativo': True,
-                            'modulos_acesso': [vinculo['CP_MODULO']],
-                        }
-                    )
-
-                    # Cria módulo do usuário
-                    UsuarioModulo.objects.update_or_create(
-                        contabilidade=contabilidade,
-                        usuario=usuario_obj,
-                        modulo_id=vinculo['CP_MODULO'],
-                        defaults={
-                            'modulo_nome': self.obter_nome_modulo(vinculo['CP_MODULO']),
-                            'ativo': True,
-                        }
-                    )
-                else:
-                    usuarios_criados += 1
-
-        return usuarios_criados > 0, usuarios_criados > 0
-    
     def buscar_contabilidades_empresa(self, historical_map, cnpj_limpo):
-        """Busca todas as contabilidades que tiveram contratos com a empresa"""
-        if cnpj_limpo not in historical_map:
-            return []
-        
-        contratos = historical_map[cnpj_limpo]
-        contabilidades = []
-        
-        for data_inicio, data_termino, contabilidade in contratos:
-            # Incluir contabilidade se teve contrato em qualquer período
-            if contabilidade not in contabilidades:
-                contabilidades.append(contabilidade)
-        
-        return contabilidades
+        """Ids das contabilidades que tiveram contrato com a empresa em qualquer período"""
+        return list(dict.fromkeys(periodo.contabilidade_id for periodo in historical_map.get(cnpj_limpo, ())))
     
     def classificar_tipo_usuario_por_nome(self, nome_usuario):
         """
@@ -404,10 +468,7 @@ class Command(BaseETLCommand):
             return []
         
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(query, (i_usuario,))
-                columns = [column[0] for column in cursor.description]
-                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            results = list(self.stream_query(connection, query, (i_usuario,)))
             
             return results
             
@@ -17,17 +17,45 @@ Estratégia NORMALIZADA:
 
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection as pg_connection, transaction
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from bisect import bisect_right
+from collections import defaultdict
 import time
 import hashlib
 
-from apps.importacao.management.commands._base import BaseETLCommand
+from apps.importacao.management.commands._base import BaseETLCommand, ETLPipeline, KeysetExtractor
 from apps.administracao.models import Usuario, UsuarioContabilidade
 from apps.pessoas.models import PessoaJuridica
 
 
+# Fontes de EstatisticaUsuario: (model de log, campo de data, {campo da estatística: agregação SQL}).
+# Cada fonte grava apenas as suas colunas; as das outras fontes entram zeradas na inserção.
+FONTES_ESTATISTICAS = (
+    ('LogAtividade', 'data_atividade', {
+        'total_atividades': "COUNT(*)",
+        'tempo_total_minutos': "COALESCE(SUM(tempo_sessao_minutos), 0)",
+        'modulos_acessados': (
+            "COALESCE(jsonb_agg(DISTINCT sistema_modulo) FILTER (WHERE sistema_modulo IS NOT NULL), '[]'::jsonb)"
+        ),
+    }),
+    ('LogImportacao', 'data_importacao', {
+        'total_importacoes': "COUNT(*)",
+        'importacoes_saidas': "COUNT(*) FILTER (WHERE tipo_importacao = 'SAIDA')",
+        'importacoes_entradas': "COUNT(*) FILTER (WHERE tipo_importacao = 'ENTRADA')",
+        'importacoes_servicos': "COUNT(*) FILTER (WHERE tipo_importacao = 'SERVICO')",
+        'valor_total_importacoes': "COALESCE(SUM(valor_total), 0)",
+    }),
+    ('LogLancamento', 'data_lancamento', {
+        'total_lancamentos': "COUNT(*)",
+        'lancamentos_manuais': "COUNT(*) FILTER (WHERE origem_registro IS DISTINCT FROM 0)",
+        'lancamentos_automaticos': "COUNT(*) FILTER (WHERE origem_registro = 0)",
+        'valor_total_lancamentos': "COALESCE(SUM(valor), 0)",
+    }),
+)
+
+
 class Command(BaseETLCommand):
     help = 'ETL 19 - Importa logs unificados NORMALIZADOS (atividades, importações, lançamentos) com identificação por CNPJ'
 
@@ -73,6 +101,20 @@ class Command(BaseETLCommand):
             default=100,
             help='Intervalo para exibir progresso no terminal (padrão: 100)',
         )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Ignora os checkpoints salvos (GELOGUSER/CTLANCTO) e recomeça do início',
+        )
+        parser.add_argument(
+            '--estatisticas',
+            choices=['incremental', 'completa'],
+            default='incremental',
+            help=(
+                'incremental: recalcula só os meses com logs inseridos nesta execução; '
+                'completa: recalcula todos os meses (padrão: incremental)'
+            ),
+        )
 
     def handle(self, *args, **options):
         """Ponto de entrada principal do ETL 19 unificado NORMALIZADO"""
@@ -83,6 +125,10 @@ class Command(BaseETLCommand):
         self.data_inicio = options['data_inicio']
         self.data_fim = options['data_fim'] or datetime.now().strftime('%Y-%m-%d')
         self.progress_interval = options['progress_interval']
+        self.reiniciar = options['reiniciar']
+        self.estatisticas = options['estatisticas']
+        # Meses (1º dia) com logs inseridos nesta execução, para as estatísticas incrementais
+        self.meses_tocados = set()
         
         # Inicializar estatísticas
         self.stats = {
@@ -93,6 +139,7 @@ class Command(BaseETLCommand):
             'lancamentos_processados': 0,
             'lancamentos_criados': 0,
             'estatisticas_criadas': 0,
+            'estatisticas_atualizadas': 0,
             'erros': 0,
             'cache_hits': 0,
             'cache_misses': 0,
@@ -115,6 +162,9 @@ class Command(BaseETLCommand):
             self.stdout.write('\n[1] Construindo mapa histórico de contabilidades...')
             historical_map = self.build_historical_contabilidade_map_cached()
 
+            # Usuários, empresas e vínculos carregados uma vez por execução
+            self.carregar_mapas_relacionados()
+
             # 2. Conectar ao Sybase
             connection = self.get_sybase_connection()
             if not connection:
@@ -133,8 +183,8 @@ class Command(BaseETLCommand):
                 self.stdout.write('\n[4] Processando logs de lançamentos (CTLANCTO)...')
                 self.processar_lancamentos(connection, historical_map)
 
-            # 5. Gerar estatísticas consolidadas
-            if self.tipo == 'todos':
+            # 5. Gerar estatísticas consolidadas (no incremental, também após um --tipo parcial)
+            if self.tipo == 'todos' or self.meses_tocados:
                 self.stdout.write('\n[5] Gerando estatísticas consolidadas...')
                 self.gerar_estatisticas_consolidadas()
 
@@ -149,9 +199,10 @@ class Command(BaseETLCommand):
             self.close_sybase_connection()
 
     def processar_atividades(self, connection, historical_map):
-        """Processa logs de atividades do GELOGUSER"""
-        query = f"""
-        SELECT 
+        """Processa logs de atividades do GELOGUSER (paginado, com checkpoint)"""
+        extrator = KeysetExtractor(
+            self, connection, 'geloguser',
+            select="""
             gl.usua_log,
             gl.data_log,
             gl.tini_log,
@@ -159,86 +210,94 @@ class Command(BaseETLCommand):
             gl.dfim_log,
             gl.sist_log,
             ge.cgce_emp,
-            ge.nome_emp
+            ge.nome_emp,
+            gl.codi_emp
+            """,
+            from_="""
         FROM BETHADBA.GELOGUSER gl
         INNER JOIN BETHADBA.GEEMPRE ge ON gl.codi_emp = ge.codi_emp
-        WHERE gl.data_log BETWEEN '{self.data_inicio}' AND '{self.data_fim}'
-        AND ge.cgce_emp IS NOT NULL AND ge.cgce_emp != ''
-        ORDER BY gl.data_log, gl.usua_log
-        """
-        
-        if self.limit:
-            query = query.replace('SELECT', f'SELECT TOP {self.limit}')
-        
-        cursor = connection.cursor()
-        cursor.execute(query)
-        atividades_data = cursor.fetchall()
-        
-        if not atividades_data:
-            self.stdout.write(self.style.WARNING('Nenhuma atividade encontrada no período especificado'))
-            return
+            """,
+            where="""
+            gl.data_log BETWEEN ? AND ?
+            AND ge.cgce_emp IS NOT NULL AND ge.cgce_emp != ''
+            """,
+            chave=('gl.data_log', 'gl.usua_log', 'gl.codi_emp', 'gl.tini_log'),
+            params=(self.data_inicio, self.data_fim),
+            page_size=self.batch_size,
+            limite=self.limit,
+            reiniciar=self.reiniciar,
+            persistir=not self.dry_run,
+        )
         
-        self.stdout.write(f'Encontradas {len(atividades_data):,} atividades para processar')
+        processadas = 0
+        pipeline = ETLPipeline(self)
         
-        # Processar em lotes
-        for i in range(0, len(atividades_data), self.batch_size):
-            lote = atividades_data[i:i + self.batch_size]
+        def gravar(lote, _resultado):
+            nonlocal processadas
+            # Linhas gravadas em autocommit; o checkpoint avança após o lote
             self.processar_lote_atividades(lote, historical_map)
+            extrator.confirmar(lote)
+            processadas += len(lote)
             
-            if (i // self.batch_size + 1) % self.progress_interval == 0:
-                self.stdout.write(f'Processadas {i + len(lote):,} atividades...')
+            if (pipeline.lotes + 1) % self.progress_interval == 0:
+                self.stdout.write(f'Processadas {processadas:,} atividades...')
+        
+        # A próxima página é lida do Sybase enquanto o lote atual é gravado
+        pipeline.executar(extrator.paginas(concluir=False), gravar)
+        if extrator.esgotado:
+            extrator.concluir()
+        
+        if not processadas:
+            self.stdout.write(self.style.WARNING('Nenhuma atividade encontrada no período especificado'))
+        else:
+            self.stdout.write(f'Processadas {processadas:,} atividades')
 
     def processar_lote_atividades(self, lote, historical_map):
         """Processa um lote de atividades NORMALIZADO"""
+        from apps.administracao.models_etl19_corrigido import LogAtividade
+
+        logs = {}
         for atividade in lote:
             try:
                 self.stats['atividades_processadas'] += 1
                 
-                usua_log, data_log, tini_log, tfim_log, dfim_log, sist_log, cgce_emp, nome_emp = atividade
+                usua_log, data_log, tini_log, tfim_log, dfim_log, sist_log, cgce_emp, nome_emp, _codi_emp = atividade
                 
                 # Gerar ID único para o log
                 id_legado = self.gerar_id_legado_atividade(usua_log, data_log, tini_log)
                 
-                # NOVA ESTRATÉGIA NORMALIZADA: Buscar usuário e empresa
-                usuario, empresa, contabilidade = self.buscar_objetos_relacionados(
-                    usua_log, cgce_emp, data_log, historical_map
+                usuario_id, empresa_id, contabilidade_id = self.buscar_objetos_relacionados(
+                    usua_log, cgce_emp, data_log
                 )
                 
-                if not usuario or not empresa or not contabilidade:
+                if not usuario_id or not empresa_id or not contabilidade_id:
                     self.stats['erros'] += 1
                     continue
                 
                 # Calcular tempo de sessão em minutos
                 tempo_minutos = self.calcular_tempo_sessao(data_log, tini_log, dfim_log, tfim_log)
                 
-                if not self.dry_run:
-                    # Importar modelo normalizado
-                    from apps.administracao.models_etl19_corrigido import LogAtividade
-                    
-                    # Criar ou atualizar log de atividade NORMALIZADO
-                    log_atividade, created = LogAtividade.objects.get_or_create(
-                        contabilidade=contabilidade,
-                        id_legado=id_legado,
-                        defaults={
-                            'usuario': usuario,
-                            'empresa': empresa,
-                            'data_atividade': data_log,
-                            'hora_inicial': tini_log,
-                            'hora_final': tfim_log,
-                            'data_fim': dfim_log,
-                            'sistema_modulo': sist_log,
-                            'tempo_sessao_minutos': tempo_minutos,
-                        }
-                    )
-                    
-                    if created:
-                        self.stats['atividades_criadas'] += 1
+                logs.setdefault(id_legado, LogAtividade(
+                    contabilidade_id=contabilidade_id,
+                    id_legado=id_legado,
+                    usuario_id=usuario_id,
+                    empresa_id=empresa_id,
+                    data_atividade=data_log,
+                    hora_inicial=tini_log,
+                    hora_final=tfim_log,
+                    data_fim=dfim_log,
+                    sistema_modulo=sist_log,
+                    tempo_sessao_minutos=tempo_minutos,
+                ))
                 
             except Exception as e:
                 self.stats['erros'] += 1
                 if self.stats['erros'] <= 10:  # Limitar logs de erro
                     self.stdout.write(self.style.ERROR(f'Erro ao processar atividade: {e}'))
 
+        if not self.dry_run:
+            self.stats['atividades_criadas'] += self.gravar_logs(LogAtividade, logs, 'data_atividade')
+
     def processar_importacoes(self, connection, historical_map):
         """Processa logs de importações (EFSAIDAS, EFENTRADAS, EFSERVICOS)"""
         tipos_importacao = [
@@ -292,6 +351,9 @@ class Command(BaseETLCommand):
 
     def processar_lote_importacoes(self, lote, historical_map, tipo):
         """Processa um lote de importações NORMALIZADO"""
+        from apps.administracao.models_etl19_corrigido import LogImportacao
+
+        logs = {}
         for importacao in lote:
             try:
                 self.stats['importacoes_processadas'] += 1
@@ -301,45 +363,38 @@ class Command(BaseETLCommand):
                 # Gerar ID único para a importação
                 id_legado = self.gerar_id_legado_importacao(codi_usu, data_importacao, cgce_emp, tipo)
                 
-                # NOVA ESTRATÉGIA NORMALIZADA: Buscar usuário e empresa
-                usuario, empresa, contabilidade = self.buscar_objetos_relacionados(
-                    codi_usu, cgce_emp, data_importacao, historical_map
+                usuario_id, empresa_id, contabilidade_id = self.buscar_objetos_relacionados(
+                    codi_usu, cgce_emp, data_importacao
                 )
                 
-                if not usuario or not empresa or not contabilidade:
+                if not usuario_id or not empresa_id or not contabilidade_id:
                     self.stats['erros'] += 1
                     continue
                 
-                if not self.dry_run:
-                    # Importar modelo normalizado
-                    from apps.administracao.models_etl19_corrigido import LogImportacao
-                    
-                    # Criar ou atualizar log de importação NORMALIZADO
-                    log_importacao, created = LogImportacao.objects.get_or_create(
-                        contabilidade=contabilidade,
-                        id_legado=id_legado,
-                        defaults={
-                            'usuario': usuario,
-                            'empresa': empresa,
-                            'tipo_importacao': tipo,
-                            'data_importacao': data_importacao,
-                            'quantidade_registros': quantidade,
-                            'valor_total': valor_total,
-                        }
-                    )
-                    
-                    if created:
-                        self.stats['importacoes_criadas'] += 1
+                logs.setdefault(id_legado, LogImportacao(
+                    contabilidade_id=contabilidade_id,
+                    id_legado=id_legado,
+                    usuario_id=usuario_id,
+                    empresa_id=empresa_id,
+                    tipo_importacao=tipo,
+                    data_importacao=data_importacao,
+                    quantidade_registros=quantidade,
+                    valor_total=valor_total,
+                ))
                 
             except Exception as e:
                 self.stats['erros'] += 1
                 if self.stats['erros'] <= 10:
                     self.stdout.write(self.style.ERROR(f'Erro ao processar importação: {e}'))
 
+        if not self.dry_run:
+            self.stats['importacoes_criadas'] += self.gravar_logs(LogImportacao, logs, 'data_importacao')
+
     def processar_lancamentos(self, connection, historical_map):
-        """Processa logs de lançamentos do CTLANCTO"""
-        query = f"""
-        SELECT 
+        """Processa logs de lançamentos do CTLANCTO (paginado, com checkpoint)"""
+        extrator = KeysetExtractor(
+            self, connection, 'ctlancto_logs',
+            select="""
             ct.codi_usu,
             ct.data_lan,
             ct.origem_reg,
@@ -348,288 +403,284 @@ class Command(BaseETLCommand):
             ct.ccre_lan,
             ct.chis_lan,
             ge.cgce_emp,
-            ge.nome_emp
+            ge.nome_emp,
+            ct.codi_emp,
+            ct.nume_lan
+            """,
+            from_="""
         FROM BETHADBA.CTLANCTO ct
         INNER JOIN BETHADBA.GEEMPRE ge ON ct.codi_emp = ge.codi_emp
-        WHERE ct.data_lan BETWEEN '{self.data_inicio}' AND '{self.data_fim}'
-        AND ge.cgce_emp IS NOT NULL AND ge.cgce_emp != ''
-        ORDER BY ct.data_lan, ct.codi_usu
-        """
-        
-        if self.limit:
-            query = query.replace('SELECT', f'SELECT TOP {self.limit}')
-        
-        cursor = connection.cursor()
-        cursor.execute(query)
-        lancamentos_data = cursor.fetchall()
-        
-        if not lancamentos_data:
-            self.stdout.write(self.style.WARNING('Nenhum lançamento encontrado no período especificado'))
-            return
+            """,
+            where="""
+            ct.data_lan BETWEEN ? AND ?
+            AND ge.cgce_emp IS NOT NULL AND ge.cgce_emp != ''
+            """,
+            chave=('ct.data_lan', 'ct.codi_emp', 'ct.nume_lan'),
+            params=(self.data_inicio, self.data_fim),
+            page_size=self.batch_size,
+            limite=self.limit,
+            reiniciar=self.reiniciar,
+            persistir=not self.dry_run,
+        )
         
-        self.stdout.write(f'Encontrados {len(lancamentos_data):,} lançamentos para processar')
+        processados = 0
+        pipeline = ETLPipeline(self)
         
-        # Processar em lotes
-        for i in range(0, len(lancamentos_data), self.batch_size):
-            lote = lancamentos_data[i:i + self.batch_size]
+        def gravar(lote, _resultado):
+            nonlocal processados
+            # Linhas gravadas em autocommit; o checkpoint avança após o lote
             self.processar_lote_lancamentos(lote, historical_map)
+            extrator.confirmar(lote)
+            processados += len(lote)
             
-            if (i // self.batch_size + 1) % self.progress_interval == 0:
-                self.stdout.write(f'Processados {i + len(lote):,} lançamentos...')
+            if (pipeline.lotes + 1) % self.progress_interval == 0:
+                self.stdout.write(f'Processados {processados:,} lançamentos...')
+        
+        # A próxima página é lida do Sybase enquanto o lote atual é gravado
+        pipeline.executar(extrator.paginas(concluir=False), gravar)
+        if extrator.esgotado:
+            extrator.concluir()
+        
+        if not processados:
+            self.stdout.write(self.style.WARNING('Nenhum lançamento encontrado no período especificado'))
+        else:
+            self.stdout.write(f'Processados {processados:,} lançamentos')
 
     def processar_lote_lancamentos(self, lote, historical_map):
         """Processa um lote de lançamentos NORMALIZADO"""
+        from apps.administracao.models_etl19_corrigido import LogLancamento
+
+        logs = {}
         for lancamento in lote:
             try:
                 self.stats['lancamentos_processados'] += 1
                 
-                codi_usu, data_lan, origem_reg, vlor_lan, cdeb_lan, ccre_lan, chis_lan, cgce_emp, nome_emp = lancamento
+                codi_usu, data_lan, origem_reg, vlor_lan, cdeb_lan, ccre_lan, chis_lan, cgce_emp, nome_emp, _codi_emp, _nume_lan = lancamento
                 
                 # Gerar ID único para o lançamento
                 id_legado = self.gerar_id_legado_lancamento(codi_usu, data_lan, cgce_emp, origem_reg)
                 
-                # NOVA ESTRATÉGIA NORMALIZADA: Buscar usuário e empresa
-                usuario, empresa, contabilidade = self.buscar_objetos_relacionados(
-                    codi_usu, cgce_emp, data_lan, historical_map
+                usuario_id, empresa_id, contabilidade_id = self.buscar_objetos_relacionados(
+                    codi_usu, cgce_emp, data_lan
                 )
                 
-                if not usuario or not empresa or not contabilidade:
+                if not usuario_id or not empresa_id or not contabilidade_id:
                     self.stats['erros'] += 1
                     continue
                 
                 # Determinar tipo de operação
                 tipo_operacao = 'MANUAL' if origem_reg != 0 else 'AUTOMATICO'
                 
-                if not self.dry_run:
-                    # Importar modelo normalizado
-                    from apps.administracao.models_etl19_corrigido import LogLancamento
-                    
-                    # Criar ou atualizar log de lançamento NORMALIZADO
-                    log_lancamento, created = LogLancamento.objects.get_or_create(
-                        contabilidade=contabilidade,
-                        id_legado=id_legado,
-                        defaults={
-                            'usuario': usuario,
-                            'empresa': empresa,
-                            'data_lancamento': data_lan,
-                            'origem_registro': origem_reg,
-                            'tipo_operacao': tipo_operacao,
-                            'valor': vlor_lan,
-                            'conta_debito': cdeb_lan,
-                            'conta_credito': ccre_lan,
-                            'historico': chis_lan,
-                        }
-                    )
-                    
-                    if created:
-                        self.stats['lancamentos_criados'] += 1
+                logs.setdefault(id_legado, LogLancamento(
+                    contabilidade_id=contabilidade_id,
+                    id_legado=id_legado,
+                    usuario_id=usuario_id,
+                    empresa_id=empresa_id,
+                    data_lancamento=data_lan,
+                    origem_registro=origem_reg,
+                    tipo_operacao=tipo_operacao,
+                    valor=vlor_lan,
+                    conta_debito=cdeb_lan,
+                    conta_credito=ccre_lan,
+                    historico=chis_lan,
+                ))
                 
             except Exception as e:
                 self.stats['erros'] += 1
                 if self.stats['erros'] <= 10:
                     self.stdout.write(self.style.ERROR(f'Erro ao processar lançamento: {e}'))
 
-    def buscar_objetos_relacionados(self, usuario_nome, cnpj_empresa, data_evento, historical_map):
+        if not self.dry_run:
+            self.stats['lancamentos_criados'] += self.gravar_logs(LogLancamento, logs, 'data_lancamento')
+
+    def gravar_logs(self, model, logs, campo_data):
         """
-        NOVA FUNÇÃO NORMALIZADA: Busca usuário, empresa e contabilidade
-        
-        Retorna: (usuario, empresa, contabilidade) ou (None, None, None) se erro
+        Insere os logs do lote ({id_legado: instância}) que ainda não existem.
+        Uma consulta pelos id_legado do lote e um bulk_create; o
+        ignore_conflicts cobre uma execução concorrente. Registra os meses
+        dos logs inseridos em self.meses_tocados. Retorna os inseridos.
+        Não usa CopyLoader: logs são só inseridos (o upsert regravaria os
+        existentes) e meses_tocados precisa das datas dos inseridos.
         """
-        try:
-            # 1. Buscar usuário
-            try:
-                usuario = Usuario.objects.get(nome_usuario=usuario_nome)
-            except Usuario.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f'Usuário {usuario_nome} não encontrado. Pulando registro.'))
-                return None, None, None
-            
-            # 2. Buscar empresa
-            try:
-                empresa = PessoaJuridica.objects.get(cnpj=cnpj_empresa)
-            except PessoaJuridica.DoesNotExist:
-                self.stdout.write(self.style.WARNING(f'Empresa {cnpj_empresa} não encontrada. Pulando registro.'))
-                return None, None, None
-            
-            # 3. Buscar vínculo usuário-empresa-contabilidade
-            vinculos = UsuarioContabilidade.objects.filter(
-                usuario=usuario,
-                empresa_cnpj=cnpj_empresa,
-                ativo=True
+        if not logs:
+            return 0
+        existentes = set(
+            model.objects.filter(id_legado__in=list(logs)).values_list('id_legado', flat=True)
+        )
+        novos = [log for id_legado, log in logs.items() if id_legado not in existentes]
+        if novos:
+            model.objects.bulk_create(novos, batch_size=1000, ignore_conflicts=True)
+            self.meses_tocados.update(getattr(log, campo_data).replace(day=1) for log in novos)
+        return len(novos)
+
+    def carregar_mapas_relacionados(self):
+        """
+        Carrega uma vez por execução os mapas usados por buscar_objetos_relacionados:
+        - usuários por nome_usuario
+        - empresas (PessoaJuridica) por CNPJ
+        - vínculos ativos por (usuário, CNPJ), em listas ordenadas por data_inicio
+        """
+        self.usuarios_por_nome = dict(Usuario.objects.values_list('nome_usuario', 'id'))
+        self.empresas_por_cnpj = {
+            self.limpar_documento(cnpj): empresa_id
+            for cnpj, empresa_id in PessoaJuridica.objects.values_list('cnpj', 'id')
+        }
+
+        vinculos = defaultdict(list)
+        for usuario_id, empresa_cnpj, data_inicio, data_fim, contabilidade_id in (
+            UsuarioContabilidade.objects.filter(ativo=True)
+            .values_list('usuario_id', 'empresa_cnpj', 'data_inicio', 'data_fim', 'contabilidade_id')
+        ):
+            vinculos[(usuario_id, self.limpar_documento(empresa_cnpj))].append((data_inicio, data_fim, contabilidade_id))
+        for periodos in vinculos.values():
+            periodos.sort(key=lambda periodo: periodo[0])
+        self.vinculos_usuario_empresa = {
+            chave: ([periodo[0] for periodo in periodos], periodos) for chave, periodos in vinculos.items()
+        }
+
+        # Avisos de registros sem usuário/empresa/vínculo: um por chave, não por linha
+        self.avisos_emitidos = set()
+
+        self.stdout.write(
+            f'✓ {len(self.usuarios_por_nome):,} usuários, {len(self.empresas_por_cnpj):,} empresas '
+            f'e {len(self.vinculos_usuario_empresa):,} vínculos usuário-empresa carregados'
+        )
+
+    def avisar_uma_vez(self, chave, mensagem):
+        if chave not in self.avisos_emitidos:
+            self.avisos_emitidos.add(chave)
+            self.stdout.write(self.style.WARNING(mensagem))
+
+    def buscar_objetos_relacionados(self, usuario_nome, cnpj_empresa, data_evento):
+        """
+        Resolve usuário, empresa e contabilidade pelos mapas pré-carregados.
+
+        Retorna: (usuario_id, empresa_id, contabilidade_id) ou (None, None, None) se erro
+        """
+        # 1. Buscar usuário
+        usuario_id = self.usuarios_por_nome.get(usuario_nome)
+        if not usuario_id:
+            self.avisar_uma_vez(('usuario', usuario_nome), f'Usuário {usuario_nome} não encontrado. Pulando registros.')
+            return None, None, None
+
+        # 2. Buscar empresa
+        cnpj_limpo = self.limpar_documento(cnpj_empresa)
+        empresa_id = self.empresas_por_cnpj.get(cnpj_limpo)
+        if not empresa_id:
+            self.avisar_uma_vez(('empresa', cnpj_limpo), f'Empresa {cnpj_empresa} não encontrada. Pulando registros.')
+            return None, None, None
+
+        # 3. Buscar vínculo usuário-empresa-contabilidade
+        vinculos = self.vinculos_usuario_empresa.get((usuario_id, cnpj_limpo))
+        if not vinculos:
+            self.avisar_uma_vez(
+                ('vinculo', usuario_id, cnpj_limpo),
+                f'Usuário {usuario_nome} não tem vínculo com empresa {cnpj_empresa}. Pulando registros.',
             )
-            
-            if not vinculos.exists():
-                self.stdout.write(self.style.WARNING(f'Usuário {usuario_nome} não tem vínculo com empresa {cnpj_empresa}. Pulando registro.'))
-                return None, None, None
-            
-            # 4. Validar se o vínculo está ativo na data do evento
-            vinculo_valido = None
-            for vinculo in vinculos:
-                if (vinculo.data_inicio <= data_evento and 
-                    (vinculo.data_fim is None or data_evento <= vinculo.data_fim)):
-                    vinculo_valido = vinculo
-                    break
-            
-            if not vinculo_valido:
-                self.stdout.write(self.style.WARNING(f'Vínculo do usuário {usuario_nome} com empresa {cnpj_empresa} não está ativo na data {data_evento}. Pulando registro.'))
-                return None, None, None
-            
-            # 5. Retornar objetos relacionados
-            return usuario, empresa, vinculo_valido.contabilidade
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Erro ao buscar objetos relacionados para usuário {usuario_nome}, empresa {cnpj_empresa}: {e}'))
             return None, None, None
 
-    def gerar_estatisticas_consolidadas(self):
-        """Gera estatísticas consolidadas NORMALIZADAS"""
-        self.stdout.write('Gerando estatísticas consolidadas...')
-        
-        # Importar modelos normalizados
-        from apps.administracao.models_etl19_corrigido import LogAtividade, LogImportacao, LogLancamento, EstatisticaUsuario
-        
-        # Agrupar por usuário, empresa e mês
-        from django.db.models import Sum, Count
-        from datetime import datetime
-        
-        # Processar atividades
-        atividades_stats = LogAtividade.objects.values(
-            'contabilidade', 'usuario', 'empresa'
-        ).annotate(
-            total_atividades=Count('id'),
-            tempo_total_minutos=Sum('tempo_sessao_minutos'),
-        )
-        
-        # Processar importações
-        importacoes_stats = LogImportacao.objects.values(
-            'contabilidade', 'usuario', 'empresa', 'tipo_importacao'
-        ).annotate(
-            total_importacoes=Count('id'),
-            valor_total_importacoes=Sum('valor_total'),
+        # 4. Vínculo ativo na data do evento: o de início mais recente até a data que ainda não terminou
+        inicios, periodos = vinculos
+        for data_inicio, data_fim, contabilidade_id in reversed(periodos[:bisect_right(inicios, data_evento)]):
+            if data_fim is None or data_evento <= data_fim:
+                return usuario_id, empresa_id, contabilidade_id
+
+        self.avisar_uma_vez(
+            ('periodo', usuario_id, cnpj_limpo),
+            f'Vínculo do usuário {usuario_nome} com empresa {cnpj_empresa} não está ativo na data {data_evento}. Pulando registros.',
         )
-        
-        # Processar lançamentos
-        lancamentos_stats = LogLancamento.objects.values(
-            'contabilidade', 'usuario', 'empresa', 'origem_registro'
-        ).annotate(
-            total_lancamentos=Count('id'),
-            valor_total_lancamentos=Sum('valor'),
+        return None, None, None
+
+    def gerar_estatisticas_consolidadas(self):
+        """
+        Consolida EstatisticaUsuario por contabilidade, usuário, empresa e mês
+        (periodo_referencia = 1º dia do mês) com um INSERT ... SELECT ... GROUP BY
+        ... ON CONFLICT DO UPDATE por fonte, inteiramente no PostgreSQL.
+
+        No modo incremental só os meses em self.meses_tocados são recalculados;
+        cada mês é reagregado por completo, então o resultado é o mesmo da
+        consolidação completa.
+        """
+        from apps.administracao import models_etl19_corrigido as modelos_logs
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('DRY-RUN: estatísticas consolidadas não recalculadas'))
+            return
+
+        meses = None
+        if self.estatisticas == 'incremental':
+            meses = sorted(self.meses_tocados)
+            if not meses:
+                self.stdout.write('Nenhum log novo nesta execução; estatísticas mantidas')
+                return
+            self.stdout.write(f'Recalculando {len(meses)} mês(es): {meses[0]:%m/%Y} a {meses[-1]:%m/%Y}')
+        else:
+            self.stdout.write('Recalculando todos os meses...')
+
+        for nome_model, campo_data, agregacoes in FONTES_ESTATISTICAS:
+            model = getattr(modelos_logs, nome_model)
+            with self.transacao():
+                criadas, atualizadas = self.consolidar_fonte(
+                    modelos_logs.EstatisticaUsuario, model, campo_data, agregacoes, meses
+                )
+            self.stats['estatisticas_criadas'] += criadas
+            self.stats['estatisticas_atualizadas'] += atualizadas
+            self.stdout.write(f'  - {nome_model}: {criadas:,} criadas, {atualizadas:,} atualizadas')
+
+    def consolidar_fonte(self, estatistica_model, log_model, campo_data, agregacoes, meses=None):
+        """
+        Um INSERT ... SELECT ... GROUP BY date_trunc('month') ... ON CONFLICT
+        DO UPDATE de uma fonte de logs em EstatisticaUsuario. Só as colunas da
+        fonte são atualizadas no conflito. Retorna (criadas, atualizadas).
+        """
+        quote = pg_connection.ops.quote_name
+        destino = estatistica_model._meta
+        origem = log_model._meta
+        coluna = lambda opts, campo: quote(opts.get_field(campo).column)
+
+        chave = ('contabilidade', 'usuario', 'empresa')
+        mes = f"date_trunc('month', {coluna(origem, campo_data)})::date"
+
+        # Campos da estatística fora desta fonte entram com o valor inicial (zero / lista vazia)
+        estatisticas = [
+            campo for campo in destino.concrete_fields
+            if campo.name not in (*chave, 'id', 'periodo_referencia', 'data_criacao', 'data_atualizacao')
+        ]
+        selecao = [
+            agregacoes[campo.name] if campo.name in agregacoes
+            else ("'[]'::jsonb" if campo.name == 'modulos_acessados' else '0')
+            for campo in estatisticas
+        ]
+
+        colunas_chave = [coluna(destino, campo) for campo in chave]
+        colunas = [
+            quote(destino.pk.column), *colunas_chave, coluna(destino, 'periodo_referencia'),
+            *(quote(campo.column) for campo in estatisticas),
+            coluna(destino, 'data_criacao'), coluna(destino, 'data_atualizacao'),
+        ]
+        atualizar = [coluna(destino, campo) for campo in agregacoes] + [coluna(destino, 'data_atualizacao')]
+
+        filtro, params = '', []
+        if meses is not None:
+            filtro = f"WHERE {mes} = ANY(%s)"
+            params.append(meses)
+
+        sql = (
+            f"WITH upsert AS ("
+            f"  INSERT INTO {quote(destino.db_table)} ({', '.join(colunas)}) "
+            f"  SELECT gen_random_uuid(), {', '.join(coluna(origem, campo) for campo in chave)}, {mes}, "
+            f"         {', '.join(selecao)}, now(), now() "
+            f"  FROM {quote(origem.db_table)} {filtro} "
+            f"  GROUP BY {', '.join(coluna(origem, campo) for campo in chave)}, {mes} "
+            f"  ON CONFLICT ({', '.join(colunas_chave)}, {coluna(destino, 'periodo_referencia')}) "
+            f"  DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in atualizar)} "
+            f"  RETURNING (xmax = 0) AS inserido"
+            f") "
+            f"SELECT COUNT(*) FILTER (WHERE inserido), COUNT(*) FILTER (WHERE NOT inserido) FROM upsert"
         )
-        
-        # Consolidar estatísticas por usuário/empresa
-        stats_consolidadas = {}
-        
-        # Processar atividades
-        for stat in atividades_stats:
-            key = (stat['contabilidade'], stat['usuario'], stat['empresa'])
-            if key not in stats_consolidadas:
-                stats_consolidadas[key] = {
-                    'contabilidade_id': stat['contabilidade'],
-                    'usuario_id': stat['usuario'],
-                    'empresa_id': stat['empresa'],
-                    'total_atividades': 0,
-                    'tempo_total_minutos': 0,
-                    'total_importacoes': 0,
-                    'importacoes_saidas': 0,
-                    'importacoes_entradas': 0,
-                    'importacoes_servicos': 0,
-                    'valor_total_importacoes': 0,
-                    'total_lancamentos': 0,
-                    'lancamentos_manuais': 0,
-                    'lancamentos_automaticos': 0,
-                    'valor_total_lancamentos': 0,
-                }
-            
-            stats_consolidadas[key]['total_atividades'] = stat['total_atividades']
-            stats_consolidadas[key]['tempo_total_minutos'] = stat['tempo_total_minutos'] or 0
-        
-        # Processar importações
-        for stat in importacoes_stats:
-            key = (stat['contabilidade'], stat['usuario'], stat['empresa'])
-            if key not in stats_consolidadas:
-                stats_consolidadas[key] = {
-                    'contabilidade_id': stat['contabilidade'],
-                    'usuario_id': stat['usuario'],
-                    'empresa_id': stat['empresa'],
-                    'total_atividades': 0,
-                    'tempo_total_minutos': 0,
-                    'total_importacoes': 0,
-                    'importacoes_saidas': 0,
-                    'importacoes_entradas': 0,
-                    'importacoes_servicos': 0,
-                    'valor_total_importacoes': 0,
-                    'total_lancamentos': 0,
-                    'lancamentos_manuais': 0,
-                    'lancamentos_automaticos': 0,
-                    'valor_total_lancamentos': 0,
-                }
-            
-            stats_consolidadas[key]['total_importacoes'] += stat['total_importacoes']
-            stats_consolidadas[key]['valor_total_importacoes'] += stat['valor_total_importacoes'] or 0
-            
-            if stat['tipo_importacao'] == 'SAIDA':
-                stats_consolidadas[key]['importacoes_saidas'] = stat['total_importacoes']
-            elif stat['tipo_importacao'] == 'ENTRADA':
-                stats_consolidadas[key]['importacoes_entradas'] = stat['total_importacoes']
-            elif stat['tipo_importacao'] == 'SERVICO':
-                stats_consolidadas[key]['importacoes_servicos'] = stat['total_importacoes']
-        
-        # Processar lançamentos
-        for stat in lancamentos_stats:
-            key = (stat['contabilidade'], stat['usuario'], stat['empresa'])
-            if key not in stats_consolidadas:
-                stats_consolidadas[key] = {
-                    'contabilidade_id': stat['contabilidade'],
-                    'usuario_id': stat['usuario'],
-                    'empresa_id': stat['empresa'],
-                    'total_atividades': 0,
-                    'tempo_total_minutos': 0,
-                    'total_importacoes': 0,
-                    'importacoes_saidas': 0,
-                    'importacoes_entradas': 0,
-                    'importacoes_servicos': 0,
-                    'valor_total_importacoes': 0,
-                    'total_lancamentos': 0,
-                    'lancamentos_manuais': 0,
-                    'lancamentos_automaticos': 0,
-                    'valor_total_lancamentos': 0,
-                }
-            
-            stats_consolidadas[key]['total_lancamentos'] += stat['total_lancamentos']
-            stats_consolidadas[key]['valor_total_lancamentos'] += stat['valor_total_lancamentos'] or 0
-            
-            if stat['origem_registro'] == 0:
-                stats_consolidadas[key]['lancamentos_automaticos'] = stat['total_lancamentos']
-            else:
-                stats_consolidadas[key]['lancamentos_manuais'] = stat['total_lancamentos']
-        
-        # Criar registros de estatísticas NORMALIZADOS
-        from apps.core.models import Contabilidade
-        
-        for key, stats in stats_consolidadas.items():
-            try:
-                contabilidade = Contabilidade.objects.get(id=stats['contabilidade_id'])
-                usuario = Usuario.objects.get(id=stats['usuario_id'])
-                empresa = PessoaJuridica.objects.get(id=stats['empresa_id'])
-                
-                # Usar primeiro dia do mês como período de referência
-                periodo_referencia = datetime.now().replace(day=1).date()
-                
-                if not self.dry_run:
-                    estatistica, created = EstatisticaUsuario.objects.get_or_create(
-                        contabilidade=contabilidade,
-                        usuario=usuario,
-                        empresa=empresa,
-                        periodo_referencia=periodo_referencia,
-                        defaults=stats
-                    )
-                    
-                    if created:
-                        self.stats['estatisticas_criadas'] += 1
-                
-            except Exception as e:
-                self.stats['erros'] += 1
-                if self.stats['erros'] <= 10:
-                    self.stdout.write(self.style.ERROR(f'Erro ao criar estatística: {e}'))
+        with pg_connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
 
     def gerar_id_legado_atividade(self, usuario, data, hora):
         """Gera ID único para atividade"""
@@ -683,9 +734,10 @@ class Command(BaseETLCommand):
             self.stdout.write(f'  - Processados: {self.stats["lancamentos_processados"]:,}')
             self.stdout.write(f'  - Criados: {self.stats["lancamentos_criados"]:,}')
         
-        if self.tipo == 'todos':
+        if self.tipo == 'todos' or self.meses_tocados:
             self.stdout.write(f'📊 ESTATÍSTICAS:')
             self.stdout.write(f'  - Criadas: {self.stats["estatisticas_criadas"]:,}')
+            self.stdout.write(f'  - Atualizadas: {self.stats["estatisticas_atualizadas"]:,}')
         
         self.stdout.write(f'❌ ERROS: {self.stats["erros"]:,}')
         self.stdout.write(f'⏱️  TEMPO TOTAL: {tempo_total:.2f} segundos')
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.15 on 2026-10-17 09:00
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ETLCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('etl', models.CharField(help_text='Nome do comando de ETL', max_length=100, verbose_name='ETL')),
+                ('extracao', models.CharField(help_text='Identificador da extração dentro do ETL (ex.: ctlancto)', max_length=100, verbose_name='Extração')),
+                ('assinatura', models.CharField(help_text='Hash da query e parâmetros; checkpoint de outra query é descartado', max_length=64, verbose_name='Assinatura')),
+                ('ultima_chave', models.JSONField(blank=True, null=True, verbose_name='Última Chave')),
+                ('linhas_processadas', models.BigIntegerField(default=0, verbose_name='Linhas Processadas')),
+                ('concluido', models.BooleanField(default=False, verbose_name='Concluído')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data de Atualização')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de ETL',
+                'verbose_name_plural': 'Checkpoints de ETL',
+                'db_table': 'importacao_etl_checkpoints',
+                'unique_together': {('etl', 'extracao')},
+            },
+        ),
+    ]
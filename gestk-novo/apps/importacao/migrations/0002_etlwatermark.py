@@ -0,0 +1,30 @@
+# Generated by Django 4.2.15 on 2026-10-17 11:30
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importacao', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ETLWatermark',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('etl', models.CharField(help_text='Nome do comando de ETL', max_length=100, verbose_name='ETL')),
+                ('escopo', models.CharField(help_text="Chave do escopo da marca d'água (ex.: codi_emp)", max_length=100, verbose_name='Escopo')),
+                ('valor', models.DateField(verbose_name='Valor')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data de Atualização')),
+            ],
+            options={
+                'verbose_name': "Marca d'água de ETL",
+                'verbose_name_plural': "Marcas d'água de ETL",
+                'db_table': 'importacao_etl_watermarks',
+                'unique_together': {('etl', 'escopo')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.15 on 2026-10-17 15:10
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('importacao', '0002_etlwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ETLLoteAuditoria',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('etl', models.CharField(help_text='Nome do comando de ETL', max_length=100, verbose_name='ETL')),
+                ('execucao', models.UUIDField(help_text='Identificador da execução do ETL', verbose_name='Execução')),
+                ('modelo', models.CharField(help_text='Model carregado no lote (ex.: contabil.LancamentoContabil)', max_length=100, verbose_name='Modelo')),
+                ('chave_inicial', models.JSONField(blank=True, help_text='Chave da origem da primeira linha do lote', null=True, verbose_name='Chave Inicial')),
+                ('chave_final', models.JSONField(blank=True, help_text='Chave da origem da última linha do lote', null=True, verbose_name='Chave Final')),
+                ('criados', models.IntegerField(default=0, verbose_name='Criados')),
+                ('atualizados', models.IntegerField(default=0, verbose_name='Atualizados')),
+                ('inalterados', models.IntegerField(default=0, verbose_name='Inalterados')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+            ],
+            options={
+                'verbose_name': 'Auditoria de Lote de ETL',
+                'verbose_name_plural': 'Auditorias de Lotes de ETL',
+                'db_table': 'importacao_etl_lotes_auditoria',
+                'indexes': [models.Index(fields=['etl', 'execucao'], name='importacao_etl_exec_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,78 @@
+import uuid
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+
+class ETLCheckpoint(models.Model):
+    """
+    Ponto de retomada de uma extração paginada do Sybase (KeysetExtractor).
+
+    Guarda a última chave cujo lote foi carregado com sucesso, para que uma
+    nova execução do ETL continue a partir dela em vez de recomeçar do zero.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    etl = models.CharField(_('ETL'), max_length=100, help_text="Nome do comando de ETL")
+    extracao = models.CharField(_('Extração'), max_length=100, help_text="Identificador da extração dentro do ETL (ex.: ctlancto)")
+    assinatura = models.CharField(_('Assinatura'), max_length=64, help_text="Hash da query e parâmetros; checkpoint de outra query é descartado")
+    ultima_chave = models.JSONField(_('Última Chave'), null=True, blank=True)
+    linhas_processadas = models.BigIntegerField(_('Linhas Processadas'), default=0)
+    concluido = models.BooleanField(_('Concluído'), default=False)
+    created_at = models.DateTimeField(_('Data de Criação'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Data de Atualização'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Checkpoint de ETL')
+        verbose_name_plural = _('Checkpoints de ETL')
+        db_table = 'importacao_etl_checkpoints'
+        unique_together = [('etl', 'extracao')]
+
+    def __str__(self):
+        return f"{self.etl}/{self.extracao} ({self.linhas_processadas} linhas)"
+
+
+class ETLWatermark(models.Model):
+    """
+    Marca d'água do modo incremental de um ETL: maior data já carregada
+    por escopo (ex.: codi_emp da empresa no Sybase).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    etl = models.CharField(_('ETL'), max_length=100, help_text="Nome do comando de ETL")
+    escopo = models.CharField(_('Escopo'), max_length=100, help_text="Chave do escopo da marca d'água (ex.: codi_emp)")
+    valor = models.DateField(_('Valor'))
+    updated_at = models.DateTimeField(_('Data de Atualização'), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Marca d'água de ETL")
+        verbose_name_plural = _("Marcas d'água de ETL")
+        db_table = 'importacao_etl_watermarks'
+        unique_together = [('etl', 'escopo')]
+
+    def __str__(self):
+        return f"{self.etl}/{self.escopo}: {self.valor}"
+
+
+
+class ETLLoteAuditoria(models.Model):
+    """
+    Registro compacto de um lote carregado por um ETL, gravado no lugar do
+    histórico por linha do simple_history (ver BaseETLCommand.HISTORICO_POR_LOTE).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    etl = models.CharField(_('ETL'), max_length=100, help_text="Nome do comando de ETL")
+    execucao = models.UUIDField(_('Execução'), help_text="Identificador da execução do ETL")
+    modelo = models.CharField(_('Modelo'), max_length=100, help_text="Model carregado no lote (ex.: contabil.LancamentoContabil)")
+    chave_inicial = models.JSONField(_('Chave Inicial'), null=True, blank=True, help_text="Chave da origem da primeira linha do lote")
+    chave_final = models.JSONField(_('Chave Final'), null=True, blank=True, help_text="Chave da origem da última linha do lote")
+    criados = models.IntegerField(_('Criados'), default=0)
+    atualizados = models.IntegerField(_('Atualizados'), default=0)
+    inalterados = models.IntegerField(_('Inalterados'), default=0)
+    created_at = models.DateTimeField(_('Data de Criação'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Auditoria de Lote de ETL')
+        verbose_name_plural = _('Auditorias de Lotes de ETL')
+        db_table = 'importacao_etl_lotes_auditoria'
+        indexes = [models.Index(fields=['etl', 'execucao'], name='importacao_etl_exec_idx')]
+
+    def __str__(self):
+        return f"{self.etl}/{self.modelo}: {self.criados} criados, {self.atualizados} atualizados"
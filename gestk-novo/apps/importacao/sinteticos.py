@@ -0,0 +1,201 @@
+"""
+Gerador de dados sintéticos do legado para o substituto local do Sybase.
+
+Gera, de forma determinística (semente), escritórios de contabilidade,
+empresas clientes com contratos, plano de contas, lançamentos contábeis,
+logs de usuário, notas de entrada/saída/serviço e eventos de folha no
+arquivo SQLite do apps.importacao.standin.
+
+Uso:
+    from apps.importacao.sinteticos import gerar_base_sintetica
+    totais = gerar_base_sintetica('/tmp/base.sqlite3', empresas=50, anos=2, lancamentos_dia=20)
+"""
+
+import json
+import os
+import random
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from apps.importacao.standin import criar_esquema
+
+
+# Data final fixa: a mesma semente gera sempre a mesma base
+DATA_FINAL = date(2024, 12, 31)
+
+CONTAS_POR_EMPRESA = 40
+EVENTOS_POR_EMPRESA = 20
+USUARIOS = [f'USUARIO{i:02d}' for i in range(1, 11)]
+SISTEMAS = ['CONTABIL', 'ESCRITA FISCAL', 'FOLHA', 'PATRIMONIO']
+HISTORICOS = [
+    'PAGAMENTO DE FORNECEDOR', 'RECEBIMENTO DE CLIENTE', 'TARIFA BANCARIA',
+    'FOLHA DE PAGAMENTO', 'APROPRIACAO DE DESPESA', 'VENDA DE MERCADORIAS',
+]
+NOMES_CONTAS = [
+    'CAIXA', 'BANCO CONTA MOVIMENTO', 'CLIENTES', 'ESTOQUE', 'FORNECEDORES',
+    'SALARIOS A PAGAR', 'RECEITA DE VENDAS', 'DESPESAS ADMINISTRATIVAS',
+    'CAPITAL SOCIAL', 'IMPOSTOS A RECOLHER',
+]
+
+BLOCO_INSERT = 10000
+
+
+def gerar_cnpj(rng):
+    """CNPJ de 14 dígitos com dígitos verificadores válidos."""
+    base = [rng.randint(0, 9) for _ in range(8)] + [0, 0, 0, 1]
+    for pesos in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        resto = sum(d * p for d, p in zip(base, pesos)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+    return ''.join(str(d) for d in base)
+
+
+def _inserir(conexao, tabela, linhas):
+    """executemany em blocos; `linhas` pode ser um generator."""
+    bloco = []
+    total = 0
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= BLOCO_INSERT:
+            total += _inserir_bloco(conexao, tabela, bloco)
+            bloco = []
+    if bloco:
+        total += _inserir_bloco(conexao, tabela, bloco)
+    return total
+
+
+def _inserir_bloco(conexao, tabela, bloco):
+    marcadores = ', '.join('?' * len(bloco[0]))
+    conexao._conexao.executemany(f'INSERT INTO BETHADBA.{tabela} VALUES ({marcadores})', bloco)
+    return len(bloco)
+
+
+def _dias(anos):
+    inicio = max(date(DATA_FINAL.year - anos + 1, 1, 1), date(2019, 1, 1))
+    dia = inicio
+    while dia <= DATA_FINAL:
+        yield dia
+        dia += timedelta(days=1)
+
+
+def gerar_base_sintetica(caminho, empresas=50, anos=2, lancamentos_dia=20, escritorios=2, semente=42):
+    """
+    Recria o arquivo `caminho` com a base sintética e retorna {tabela: linhas}.
+
+    - empresas: empresas clientes (codi_emp a partir de 1001), distribuídas
+      entre os escritórios (codi_emp 1..escritorios)
+    - anos: anos de movimento até DATA_FINAL (no máximo desde 2019)
+    - lancamentos_dia: lançamentos contábeis por empresa por dia; notas e
+      logs são proporcionais
+    """
+    rng = random.Random(semente)
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    conexao = criar_esquema(caminho)
+    totais = {}
+
+    codigos_escritorios = list(range(1, escritorios + 1))
+    codigos_empresas = list(range(1001, 1001 + empresas))
+
+    def empresas_geempre():
+        for codi_emp in codigos_escritorios + codigos_empresas:
+            escritorio = codi_emp in codigos_escritorios
+            nome = f"{'ESCRITORIO CONTABIL' if escritorio else 'EMPRESA SINTETICA'} {codi_emp} LTDA"
+            yield (
+                codi_emp, nome, nome.split(' LTDA')[0], gerar_cnpj(rng), rng.choice('SN'),
+                '6920601' if escritorio else '4711302', 'COMERCIO', f'RESPONSAVEL {codi_emp}',
+                f'{rng.randint(10 ** 10, 10 ** 11 - 1)}', f'RUA {codi_emp}', str(rng.randint(1, 999)),
+                'CENTRO', f'{rng.randint(10000000, 99999999)}', 'SC', str(rng.randint(10000, 99999)), 4205407,
+            )
+    totais['GEEMPRE'] = _inserir(conexao, 'GEEMPRE', empresas_geempre())
+
+    totais['GECNAE'] = _inserir(conexao, 'GECNAE', [
+        ('6920601', 'ATIVIDADES DE CONTABILIDADE'),
+        ('4711302', 'COMERCIO VAREJISTA DE MERCADORIAS EM GERAL'),
+    ])
+
+    contratos, clientes = [], []
+    for i, codi_emp in enumerate(codigos_empresas, 1):
+        escritorio = codigos_escritorios[i % escritorios]
+        clientes.append((i, escritorio, codi_emp))
+        contratos.append((
+            escritorio, i, i, date(2019, 1, 1), None, rng.randint(1, 28),
+            Decimal(rng.randint(30000, 300000)) / 100,
+        ))
+    totais['HRVCLIENTE'] = _inserir(conexao, 'HRVCLIENTE', clientes)
+    totais['HRCONTRATO'] = _inserir(conexao, 'HRCONTRATO', contratos)
+
+    def contas():
+        for codi_emp in codigos_empresas:
+            for codi_cta in range(1, CONTAS_POR_EMPRESA + 1):
+                nome = f'{NOMES_CONTAS[codi_cta % len(NOMES_CONTAS)]} {codi_cta}'
+                yield codi_emp, codi_cta, f'{codi_cta % 5 + 1}.1.{codi_cta:03d}', nome, 'A'
+    totais['CTCONTAS'] = _inserir(conexao, 'CTCONTAS', contas())
+
+    def lancamentos():
+        for codi_emp in codigos_empresas:
+            nume_lan = 0
+            for dia in _dias(anos):
+                for _ in range(lancamentos_dia):
+                    nume_lan += 1
+                    debito, credito = rng.sample(range(1, CONTAS_POR_EMPRESA + 1), 2)
+                    yield (
+                        codi_emp, nume_lan, dia, Decimal(rng.randint(100, 5000000)) / 100,
+                        debito, credito, rng.randint(1, 50), rng.choice(HISTORICOS),
+                        rng.choice(USUARIOS), rng.choice((1, 2)),
+                    )
+    totais['CTLANCTO'] = _inserir(conexao, 'CTLANCTO', lancamentos())
+
+    def logs():
+        for dia in _dias(anos):
+            for codi_emp in codigos_empresas:
+                inicio = rng.randint(7, 16)
+                yield (
+                    rng.choice(USUARIOS), dia, time(inicio, rng.randint(0, 59)),
+                    time(inicio + rng.randint(1, 3), rng.randint(0, 59)), dia, rng.choice(SISTEMAS), codi_emp,
+                )
+    totais['GELOGUSER'] = _inserir(conexao, 'GELOGUSER', logs())
+
+    notas_dia = max(1, lancamentos_dia // 5)
+
+    def notas(colunas):
+        for codi_emp in codigos_empresas:
+            codigo = 0
+            for dia in _dias(anos):
+                for _ in range(notas_dia):
+                    codigo += 1
+                    valor = Decimal(rng.randint(1000, 2000000)) / 100
+                    yield colunas(codi_emp, codigo, dia, valor)
+    chave = lambda codi_emp, codigo, modelo: f'42{codi_emp:012d}{modelo}{codigo:028d}'[:44]
+    totais['EFENTRADAS'] = _inserir(conexao, 'EFENTRADAS', notas(lambda codi_emp, codigo, dia, valor: (
+        codi_emp, codigo, codigo, '1', 0, chave(codi_emp, codigo, '55'), dia, dia,
+        rng.randint(1, 100), valor, rng.choice(USUARIOS),
+    )))
+    totais['EFSAIDAS'] = _inserir(conexao, 'EFSAIDAS', notas(lambda codi_emp, codigo, dia, valor: (
+        codi_emp, codigo, codigo, '1', 0, chave(codi_emp, codigo, '65'), dia,
+        rng.randint(1, 100), valor, rng.choice(USUARIOS),
+    )))
+    totais['EFSERVICOS'] = _inserir(conexao, 'EFSERVICOS', notas(lambda codi_emp, codigo, dia, valor: (
+        codi_emp, codigo, codigo, dia, rng.randint(1, 100), valor, rng.choice(USUARIOS),
+    )))
+
+    def eventos():
+        for codi_emp in codigos_empresas:
+            for i_eventos in range(1, EVENTOS_POR_EMPRESA + 1):
+                yield (
+                    codi_emp, i_eventos, f'EVENTO {i_eventos}', rng.choice((1, 2, 3)),
+                    rng.choice('SN'), rng.choice('SN'), rng.choice('SN'), 'A',
+                )
+    totais['FOEVENTOS'] = _inserir(conexao, 'FOEVENTOS', eventos())
+
+    conexao.commit()
+    conexao.close()
+
+    # Parâmetros ao lado da base, para os relatórios de benchmark
+    parametros = {
+        'empresas': empresas, 'anos': anos, 'lancamentos_dia': lancamentos_dia,
+        'escritorios': escritorios, 'semente': semente, 'data_final': DATA_FINAL.isoformat(),
+        'totais': totais,
+    }
+    with open(f'{caminho}.json', 'w', encoding='utf-8') as arquivo:
+        json.dump(parametros, arquivo, ensure_ascii=False, indent=2)
+    return totais
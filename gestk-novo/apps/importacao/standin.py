@@ -0,0 +1,254 @@
+"""
+Substituto local do Sybase (SQL Anywhere) para testes e benchmarks dos ETLs.
+
+Um arquivo SQLite anexado com o nome BETHADBA reproduz as tabelas do
+legado usadas pelos ETLs (GEEMPRE, CTLANCTO, CTCONTAS, EF*, FO*...), então
+as queries com "BETHADBA.TABELA" rodam sem alteração. A conexão imita a
+interface do pyodbc usada pelo BaseETLCommand (cursor, execute com '?',
+fetchmany, description, closed).
+
+Para usar nos ETLs:
+    SYBASE_CONNECTION_FACTORY=apps.importacao.standin.conectar
+    SYBASE_STANDIN_PATH=/caminho/base.sqlite3
+
+O dialeto suportado é o subconjunto comum ao SQLite: "SELECT TOP n" no
+início da query vira LIMIT, ISNULL() vira IFNULL() e TODAY() e STRING()
+são emulados.
+Sintaxe exclusiva do SQL Anywhere (ex.: "coluna = expressão" no SELECT,
+TOP dentro de UNION) não é suportada.
+"""
+
+import re
+import sqlite3
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+
+
+ESQUEMA = (
+    """CREATE TABLE IF NOT EXISTS BETHADBA.GEEMPRE (
+        codi_emp INTEGER PRIMARY KEY,
+        nome_emp VARCHAR(150),
+        fantasia_emp VARCHAR(150),
+        cgce_emp VARCHAR(20),
+        simples_emp CHAR(1),
+        cnae_emp VARCHAR(10),
+        ramo_emp VARCHAR(100),
+        rleg_emp VARCHAR(150),
+        cpf_leg_emp VARCHAR(14),
+        ende_emp VARCHAR(150),
+        nume_emp VARCHAR(10),
+        bair_emp VARCHAR(100),
+        cepe_emp VARCHAR(10),
+        esta_emp CHAR(2),
+        imun_emp VARCHAR(20),
+        codigo_municipio INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.GECNAE (
+        codigo_cnae VARCHAR(10) PRIMARY KEY,
+        descricao VARCHAR(250)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.HRCONTRATO (
+        codi_emp INTEGER,
+        i_contrato INTEGER,
+        i_cliente INTEGER,
+        data_inicio_faturamento DATE,
+        data_termino DATE,
+        dia_vencimento INTEGER,
+        valor_contrato DECIMAL(15, 2),
+        PRIMARY KEY (codi_emp, i_contrato)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.HRVCLIENTE (
+        i_cliente INTEGER,
+        codigo_escritorio INTEGER,
+        i_cliente_fixo INTEGER,
+        PRIMARY KEY (i_cliente, codigo_escritorio)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.CTCONTAS (
+        codi_emp INTEGER,
+        codi_cta INTEGER,
+        clas_cta VARCHAR(30),
+        nome_cta VARCHAR(150),
+        tipo_cta CHAR(1),
+        PRIMARY KEY (codi_emp, codi_cta)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.CTLANCTO (
+        codi_emp INTEGER,
+        nume_lan INTEGER,
+        data_lan DATE,
+        vlor_lan DECIMAL(15, 2),
+        cdeb_lan INTEGER,
+        ccre_lan INTEGER,
+        codi_his INTEGER,
+        chis_lan VARCHAR(500),
+        codi_usu VARCHAR(30),
+        origem_reg INTEGER,
+        PRIMARY KEY (codi_emp, nume_lan)
+    )""",
+    "CREATE INDEX IF NOT EXISTS BETHADBA.ix_ctlancto_data ON CTLANCTO (codi_emp, data_lan, nume_lan)",
+    "CREATE INDEX IF NOT EXISTS BETHADBA.ix_ctlancto_data_lan ON CTLANCTO (data_lan, codi_emp, nume_lan)",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.GELOGUSER (
+        usua_log VARCHAR(30),
+        data_log DATE,
+        tini_log TIME,
+        tfim_log TIME,
+        dfim_log DATE,
+        sist_log VARCHAR(30),
+        codi_emp INTEGER
+    )""",
+    "CREATE INDEX IF NOT EXISTS BETHADBA.ix_geloguser_data ON GELOGUSER (data_log, usua_log, codi_emp, tini_log)",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.EFENTRADAS (
+        codi_emp INTEGER,
+        codi_ent INTEGER,
+        nume_ent INTEGER,
+        seri_ent VARCHAR(5),
+        situacao_ent INTEGER,
+        chave_nfe_ent VARCHAR(44),
+        dent_ent DATE,
+        data_entrada DATE,
+        codi_for INTEGER,
+        vcon_ent DECIMAL(15, 2),
+        codi_usu VARCHAR(30),
+        PRIMARY KEY (codi_emp, codi_ent)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.EFSAIDAS (
+        codi_emp INTEGER,
+        codi_sai INTEGER,
+        nume_sai INTEGER,
+        seri_sai VARCHAR(5),
+        situacao_sai INTEGER,
+        chave_nfe_sai VARCHAR(44),
+        dsai_sai DATE,
+        codi_cli INTEGER,
+        vcon_sai DECIMAL(15, 2),
+        codi_usu VARCHAR(30),
+        PRIMARY KEY (codi_emp, codi_sai)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.EFSERVICOS (
+        codi_emp INTEGER,
+        codi_ser INTEGER,
+        nume_ser INTEGER,
+        dser_ser DATE,
+        codi_cli INTEGER,
+        vcon_ser DECIMAL(15, 2),
+        codi_usu VARCHAR(30),
+        PRIMARY KEY (codi_emp, codi_ser)
+    )""",
+    """CREATE TABLE IF NOT EXISTS BETHADBA.FOEVENTOS (
+        codi_emp INTEGER,
+        i_eventos INTEGER,
+        nome VARCHAR(100),
+        prov_desc INTEGER,
+        base_inss CHAR(1),
+        base_irrf CHAR(1),
+        base_fgts CHAR(1),
+        situacao CHAR(1),
+        PRIMARY KEY (codi_emp, i_eventos)
+    )""",
+)
+
+
+def _registrar_tipos():
+    """Adaptadores/conversores explícitos: datas como ISO, DECIMAL como Decimal."""
+    sqlite3.register_adapter(date, date.isoformat)
+    sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(' '))
+    sqlite3.register_adapter(time, time.isoformat)
+    sqlite3.register_adapter(Decimal, str)
+    sqlite3.register_converter('DATE', lambda valor: date.fromisoformat(valor.decode()))
+    sqlite3.register_converter('TIMESTAMP', lambda valor: datetime.fromisoformat(valor.decode()))
+    sqlite3.register_converter('TIME', lambda valor: time.fromisoformat(valor.decode()))
+    sqlite3.register_converter('DECIMAL', lambda valor: Decimal(valor.decode()))
+
+
+_registrar_tipos()
+
+_TOP = re.compile(r'^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s+(\d+)\s+', re.IGNORECASE)
+_ISNULL = re.compile(r'\bISNULL\s*\(', re.IGNORECASE)
+
+
+def traduzir_query(query):
+    """Converte o "SELECT TOP n" inicial do SQL Anywhere em LIMIT e ISNULL() em IFNULL()."""
+    # ISNULL é operador no SQLite; a função equivalente é IFNULL
+    query = _ISNULL.sub('IFNULL(', query)
+    correspondencia = _TOP.match(query)
+    if not correspondencia:
+        return query
+    corpo = query[correspondencia.end():].rstrip().rstrip(';')
+    return f"{correspondencia.group(1)}{corpo}\nLIMIT {correspondencia.group(2)}"
+
+
+class CursorStandin:
+    """Cursor com a interface do pyodbc usada pelos ETLs."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, *params):
+        # pyodbc aceita execute(query, (a, b)) e execute(query, a, b)
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(traduzir_query(query), tuple(params))
+        return self
+
+    @property
+    def arraysize(self):
+        return self._cursor.arraysize
+
+    @arraysize.setter
+    def arraysize(self, valor):
+        self._cursor.arraysize = valor
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class ConexaoStandin:
+    """Conexão com o arquivo SQLite anexado como BETHADBA."""
+
+    def __init__(self, caminho):
+        # Usada também pela thread de leitura do ETLPipeline
+        self._conexao = sqlite3.connect(
+            ':memory:', detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        self._conexao.execute('ATTACH DATABASE ? AS BETHADBA', (str(caminho),))
+        self._conexao.create_function('TODAY', 0, lambda: date.today().isoformat())
+        self._conexao.create_function('STRING', -1, lambda *partes: ''.join('' if p is None else str(p) for p in partes))
+        self.closed = False
+
+    def cursor(self):
+        return CursorStandin(self._conexao.cursor())
+
+    def execute(self, query, *params):
+        return self.cursor().execute(query, *params)
+
+    def commit(self):
+        self._conexao.commit()
+
+    def rollback(self):
+        self._conexao.rollback()
+
+    def close(self):
+        if not self.closed:
+            self._conexao.close()
+            self.closed = True
+
+
+def criar_esquema(caminho):
+    """Cria (se necessário) as tabelas do BETHADBA no arquivo e retorna a conexão."""
+    conexao = ConexaoStandin(caminho)
+    for comando in ESQUEMA:
+        conexao._conexao.execute(comando)
+    conexao.commit()
+    return conexao
+
+
+def conectar(config=None):
+    """
+    Fábrica para SYBASE_CONNECTION_FACTORY: abre o arquivo de
+    SYBASE_STANDIN_PATH (o SYBASE_CONFIG do ODBC é ignorado).
+    """
+    return ConexaoStandin(settings.SYBASE_STANDIN_PATH)
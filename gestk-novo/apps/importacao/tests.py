@@ -1,3 +1,190 @@
-from django.test import TestCase
+import uuid
+from datetime import date
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from apps.importacao.management.commands._base import (
+    ContabilidadeResolver, KeysetExtractor, PeriodoContrato, QueryRow,
+)
+from apps.importacao.management.commands.etl_05_plano_contas import Command as PlanoContasCommand
+from executar_etls_sequencial import ETLSequencialExecutor
+
+
+class CalcularHierarquiaTests(SimpleTestCase):
+
+    def test_vinculo_circular_vira_raiz_e_caminhos_partem_dela(self):
+        # A -> B -> C -> A, sem pai pelo código (classificações de um nível)
+        a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        contas = {a: ('A', b), b: ('B', c), c: ('C', a)}
+
+        hierarquia = PlanoContasCommand().calcular_hierarquia(contas)
+
+        self.assertEqual(hierarquia[a], (None, f"{a.hex}/", 0))
+        self.assertEqual(hierarquia[c], (a, f"{a.hex}/{c.hex}/", 1))
+        self.assertEqual(hierarquia[b], (c, f"{a.hex}/{c.hex}/{b.hex}/", 2))
+
+    def test_conta_pendurada_no_ciclo(self):
+        # D -> A -> B -> A: D fica abaixo da conta onde o ciclo fecha
+        a, b, d = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        contas = {d: ('D', a), a: ('A', b), b: ('B', a)}
+
+        hierarquia = PlanoContasCommand().calcular_hierarquia(contas)
+
+        self.assertEqual(hierarquia[a], (None, f"{a.hex}/", 0))
+        self.assertEqual(hierarquia[d], (a, f"{a.hex}/{d.hex}/", 1))
+        self.assertEqual(hierarquia[b], (a, f"{a.hex}/{b.hex}/", 1))
+
+
+class KeysetExtractorQueryTests(SimpleTestCase):
+
+    def criar_extrator(self):
+        return KeysetExtractor(
+            SimpleNamespace(nome_etl='etl_teste'), None, 'ctlancto',
+            select='l.codi_emp, l.data_lan, l.nume_lan', from_='FROM BETHADBA.CTLANCTO l',
+            where='l.vlor_lan > ?', chave=('l.codi_emp', 'l.data_lan', 'l.nume_lan'), params=(0,),
+        )
+
+    def test_primeira_pagina_sem_condicao_de_chave(self):
+        query, params = self.criar_extrator()._montar_query(None, 100)
+
+        self.assertEqual(
+            query,
+            "SELECT TOP 100 l.codi_emp, l.data_lan, l.nume_lan FROM BETHADBA.CTLANCTO l "
+            "WHERE (l.vlor_lan > ?) ORDER BY l.codi_emp, l.data_lan, l.nume_lan",
+        )
+        self.assertEqual(params, [0])
+
+    def test_comparacao_de_tupla_expandida_e_ordem_dos_parametros(self):
+        data = date(2020, 5, 1)
+        query, params = self.criar_extrator()._montar_query((7, data, 42), 100)
+
+        self.assertIn(
+            "WHERE (l.vlor_lan > ?) AND ((l.codi_emp > ?) "
+            "OR (l.codi_emp = ? AND l.data_lan > ?) "
+            "OR (l.codi_emp = ? AND l.data_lan = ? AND l.nume_lan > ?))",
+            query,
+        )
+        self.assertEqual(params, [0, 7, 7, data, 7, data, 42])
+        self.assertEqual(query.count('?'), len(params))
+
+
+class ContabilidadeResolverTests(SimpleTestCase):
+
+    def setUp(self):
+        self.antiga, self.nova = uuid.uuid4(), uuid.uuid4()
+        self.resolver = ContabilidadeResolver(
+            {
+                '12345678000199': [
+                    PeriodoContrato(date(2020, 6, 1), date.max, self.nova, uuid.uuid4()),
+                    PeriodoContrato(date(2019, 1, 1), date(2021, 12, 31), self.antiga, uuid.uuid4()),
+                    PeriodoContrato(None, date.max, uuid.uuid4(), uuid.uuid4()),
+                ],
+                '98765432100': [
+                    PeriodoContrato(date(2019, 1, 1), date(2019, 6, 30), self.antiga, uuid.uuid4()),
+                    PeriodoContrato(date(2020, 1, 1), date(2020, 12, 31), self.nova, uuid.uuid4()),
+                ],
+            },
+            {1: '12345678000199', 2: '98765432100'},
+        )
+
+    def test_sobreposicao_prevalece_o_inicio_mais_antigo(self):
+        contrato = self.resolver.get_contrato_por_documento('12345678000199', date(2020, 7, 1))
+        self.assertEqual(contrato.contabilidade_id, self.antiga)
+
+    def test_contrato_sem_termino_vale_depois_do_fim_do_anterior(self):
+        contrato = self.resolver.get_contrato_por_documento('12345678000199', date(2022, 1, 1))
+        self.assertEqual(contrato.contabilidade_id, self.nova)
+
+    def test_datas_fora_dos_contratos(self):
+        self.assertIsNone(self.resolver.get_contrato_por_documento('12345678000199', date(2018, 12, 31)))
+        # Intervalo entre dois contratos
+        self.assertIsNone(self.resolver.get_contrato_por_documento('98765432100', date(2019, 9, 1)))
+        self.assertIsNone(self.resolver.get_contrato_por_documento('00000000000', date(2020, 1, 1)))
+
+    def test_resolucao_por_codi_emp_conta_estatisticas(self):
+        self.assertEqual(self.resolver.get_contrato(2, date(2020, 3, 1)).contabilidade_id, self.nova)
+        self.assertIsNone(self.resolver.get_contrato(3, date(2020, 3, 1)))
+
+        self.assertEqual(self.resolver.stats['contabilidade_found'], 1)
+        self.assertEqual(self.resolver.stats['contabilidade_not_found'], 1)
+        self.assertEqual(self.resolver.stats['codi_emp_sem_documento'], 1)
+
+
+class QueryRowTests(SimpleTestCase):
+
+    def test_acesso_por_indice_nome_e_atributo(self):
+        Linha = QueryRow.para_colunas(['codi_emp', 'data_lan'])
+        linha = Linha((10, date(2020, 1, 1)))
+
+        self.assertEqual(linha[0], 10)
+        self.assertEqual(linha['data_lan'], date(2020, 1, 1))
+        self.assertEqual(linha.codi_emp, 10)
+        self.assertEqual(linha.get('codi_emp'), 10)
+        self.assertEqual(linha.get('inexistente', 'padrão'), 'padrão')
+        self.assertEqual(linha, (10, date(2020, 1, 1)))
+        self.assertEqual(tuple(linha.keys()), ('codi_emp', 'data_lan'))
+        self.assertEqual(linha.as_dict(), {'codi_emp': 10, 'data_lan': date(2020, 1, 1)})
+        with self.assertRaises(AttributeError):
+            linha.inexistente
+        with self.assertRaises(KeyError):
+            linha['inexistente']
+
+    def test_colunas_ficam_no_tipo_de_cada_query(self):
+        Primeira = QueryRow.para_colunas(['a'])
+        Segunda = QueryRow.para_colunas(['b'])
+
+        self.assertEqual(Primeira((1,)).a, 1)
+        self.assertEqual(Segunda((2,)).b, 2)
+        self.assertIsNone(Primeira((1,)).get('b'))
+
+
+class ExecucaoParalelaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.executor = ETLSequencialExecutor()
+        self.etls = {etl['numero']: etl for etl in self.executor.etls_sequence}
+
+    def test_conflitos_por_tabelas_escritas_e_lidas(self):
+        conflita = self.executor.conflita
+        # Escrevem pessoas
+        self.assertTrue(conflita(self.etls['04'], self.etls['07']))
+        self.assertTrue(conflita(self.etls['07'], self.etls['17']))
+        self.assertTrue(conflita(self.etls['11'], self.etls['04']))
+        # 05 lê contratos enquanto o 03 os escreve (nos dois sentidos)
+        self.assertTrue(conflita(self.etls['05'], self.etls['03']))
+        self.assertTrue(conflita(self.etls['03'], self.etls['05']))
+        # Só leitores de contratos
+        self.assertFalse(conflita(self.etls['05'], self.etls['08']))
+        self.assertFalse(conflita(self.etls['09'], self.etls['18']))
+
+    def test_ordem_topologica(self):
+        etls = [
+            {'numero': 'b', 'dependencias': ['a']},
+            {'numero': 'a', 'dependencias': []},
+            {'numero': 'c', 'dependencias': ['fora_da_lista']},
+        ]
+        ordem = [etl['numero'] for etl in self.executor.ordenar_topologicamente(etls)]
+        self.assertEqual(ordem, ['a', 'c', 'b'])
+
+    def test_sequencia_declarada_respeita_as_dependencias(self):
+        ordem = [etl['numero'] for etl in self.executor.ordenar_topologicamente(self.executor.etls_sequence)]
+        for etl in self.executor.etls_sequence:
+            for dependencia in etl['dependencias']:
+                self.assertLess(ordem.index(dependencia), ordem.index(etl['numero']))
+
+    def test_dependencia_circular(self):
+        etls = [{'numero': 'a', 'dependencias': ['b']}, {'numero': 'b', 'dependencias': ['a']}]
+        with self.assertRaises(ValueError):
+            self.executor.ordenar_topologicamente(etls)
+
+    def test_caminho_critico(self):
+        etls = [
+            {'numero': 'a', 'dependencias': []},
+            {'numero': 'b', 'dependencias': ['a']},
+            {'numero': 'c', 'dependencias': []},
+            {'numero': 'd', 'dependencias': ['b', 'c']},
+        ]
+        self.executor.duracoes = {'a': 1.0, 'b': 5.0, 'c': 2.0, 'd': 1.0}
+
+        self.assertEqual(self.executor.calcular_caminho_critico(etls), (7.0, ['a', 'b', 'd']))
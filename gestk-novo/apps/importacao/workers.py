@@ -0,0 +1,27 @@
+"""
+Execução de métodos de comandos de ETL em processos de um ProcessPoolExecutor.
+
+Este módulo não importa models no nível do módulo: com o contexto 'spawn'
+(padrão no Windows e usado em todas as plataformas pelos ETLs) o processo
+filho importa o módulo antes de rodar o initializer, e o Django só pode
+carregar os models depois de django.setup().
+
+Uso:
+    with ProcessPoolExecutor(max_workers=4, mp_context=get_context('spawn'),
+                             initializer=inicializar_worker) as pool:
+        pool.submit(executar_metodo_comando, 'etl_06_lancamentos', 'executar_particao', particao, opcoes)
+"""
+
+
+def inicializar_worker():
+    """Configura o Django no processo filho (DJANGO_SETTINGS_MODULE vem do ambiente do pai)."""
+    import django
+    django.setup()
+
+
+def executar_metodo_comando(nome_comando, metodo, *args, **kwargs):
+    """Instancia o comando de management e chama o método; o retorno precisa ser picklable."""
+    from django.core.management import get_commands, load_command_class
+
+    comando = load_command_class(get_commands()[nome_comando], nome_comando)
+    return getattr(comando, metodo)(*args, **kwargs)
@@ -13,6 +13,9 @@ REM     --etl-final N      Para no ETL N
 REM     --skip-etls LIST   Pula ETLs específicos (ex: --skip-etls 05,06,07)
 REM     --batch-size N     Tamanho do lote para ETLs que suportam
 REM     --progress-interval N  Intervalo de progresso para ETLs que suportam
+REM     --paralelo         Executa ETLs independentes em paralelo
+REM     --workers N        Número máximo de ETLs simultâneos (modo paralelo)
+REM     --em-processo      Executa os ETLs no mesmo processo com caches compartilhados
 
 echo.
 echo ======================================================================
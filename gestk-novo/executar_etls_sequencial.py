@@ -15,14 +15,26 @@ Opções:
     --skip-etls LIST   Pula ETLs específicos (ex: --skip-etls 05,06,07)
     --batch-size N     Tamanho do lote para ETLs que suportam
     --progress-interval N  Intervalo de progresso para ETLs que suportam
+    --paralelo         Executa ETLs independentes em paralelo (ordem do grafo de dependências)
+    --workers N        Número máximo de ETLs simultâneos no modo paralelo (padrão: 4)
+    --em-processo      Executa os ETLs no mesmo processo (call_command) reaproveitando
+                       conexão Sybase, mapa histórico e caches entre as etapas
     --help             Exibe esta ajuda
+
+Cada ETL grava um relatório JSON (tempos de Sybase, transformação, gravação e
+commit, queries do ORM, pico de memória) em ETL_RELATORIOS_DIR/execucao_<data>/;
+o relatório final consolida esses dados em relatorio_execucao.json.
 """
 
+import io
+import json
 import os
 import sys
 import subprocess
 import argparse
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 
 # Configuração do Django
@@ -30,6 +42,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestk.settings')
 import django
 django.setup()
 
+from django.conf import settings
+from django.core.management import call_command, get_commands, load_command_class
+from apps.importacao.management.commands._base import ETLContext
+
 class ETLSequencialExecutor:
     """Executor sequencial de ETLs com controle de dependências"""
     
@@ -41,6 +57,8 @@ class ETLSequencialExecutor:
                 'nome': 'mapeamento_empresas',
                 'descricao': 'Mapeamento Completo de Empresas',
                 'dependencias': [],
+                'escreve': ['pessoas', 'contratos'],
+                'le': ['contratos'],
                 'critico': True,
                 'comando': 'etl_00_mapeamento_empresas'
             },
@@ -49,6 +67,8 @@ class ETLSequencialExecutor:
                 'nome': 'contabilidades',
                 'descricao': 'Contabilidades (Tenants)',
                 'dependencias': [],
+                'escreve': ['contabilidades'],
+                'le': [],
                 'critico': True,
                 'comando': 'etl_01_contabilidades'
             },
@@ -57,6 +77,8 @@ class ETLSequencialExecutor:
                 'nome': 'cnaes',
                 'descricao': 'CNAEs',
                 'dependencias': [],
+                'escreve': [],
+                'le': [],
                 'critico': True,
                 'comando': 'etl_02_cnaes'
             },
@@ -64,7 +86,9 @@ class ETLSequencialExecutor:
                 'numero': '03',
                 'nome': 'contratos',
                 'descricao': 'Contratos, Pessoas Físicas e Jurídicas',
-                'dependencias': ['01'],
+                'dependencias': ['00', '01'],
+                'escreve': ['pessoas', 'contratos'],
+                'le': ['contratos'],
                 'critico': True,
                 'comando': 'etl_03_contratos'
             },
@@ -73,6 +97,8 @@ class ETLSequencialExecutor:
                 'nome': 'quadro_societario',
                 'descricao': 'Quadro Societário',
                 'dependencias': ['03'],
+                'escreve': ['pessoas'],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_04_quadro_societario'
             },
@@ -82,7 +108,9 @@ class ETLSequencialExecutor:
                 'numero': '05',
                 'nome': 'plano_contas',
                 'descricao': 'Plano de Contas',
-                'dependencias': ['01'],
+                'dependencias': ['01', '03'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_05_plano_contas'
             },
@@ -91,6 +119,8 @@ class ETLSequencialExecutor:
                 'nome': 'lancamentos',
                 'descricao': 'Lançamentos Contábeis',
                 'dependencias': ['05'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_06_lancamentos'
             },
@@ -101,6 +131,8 @@ class ETLSequencialExecutor:
                 'nome': 'notas_fiscais',
                 'descricao': 'Notas Fiscais (entrada/saída/serviços)',
                 'dependencias': ['03'],
+                'escreve': ['pessoas'],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_07_notas_fiscais'
             },
@@ -109,6 +141,8 @@ class ETLSequencialExecutor:
                 'nome': 'cupons_fiscais',
                 'descricao': 'Cupons Fiscais Eletrônicos',
                 'dependencias': ['03'],
+                'escreve': ['pessoas'],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_17_cupons_fiscais'
             },
@@ -119,6 +153,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_cargos',
                 'descricao': 'Cargos',
                 'dependencias': ['03'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_08_rh_cargos'
             },
@@ -127,6 +163,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_departamentos',
                 'descricao': 'Departamentos',
                 'dependencias': ['03'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_09_rh_departamentos'
             },
@@ -135,6 +173,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_centros_custo',
                 'descricao': 'Centros de Custo',
                 'dependencias': ['03'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_10_rh_centros_custo'
             },
@@ -143,6 +183,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_funcionarios_vinculos',
                 'descricao': 'Funcionários e Vínculos',
                 'dependencias': ['03', '08', '09', '10'],
+                'escreve': ['pessoas'],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_11_rh_funcionarios_vinculos'
             },
@@ -151,6 +193,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_rubricas',
                 'descricao': 'Rubricas de RH',
                 'dependencias': ['11'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_11_rh_rubricas'
             },
@@ -159,6 +203,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_historicos',
                 'descricao': 'Históricos de Salário e Cargo',
                 'dependencias': ['11'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_12_rh_historicos'
             },
@@ -167,6 +213,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_periodos_aquisitivos',
                 'descricao': 'Períodos Aquisitivos de Férias',
                 'dependencias': ['11'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_13_rh_periodos_aquisitivos'
             },
@@ -175,6 +223,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_gozo_ferias',
                 'descricao': 'Gozo de Férias',
                 'dependencias': ['13'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_14_rh_gozo_ferias'
             },
@@ -183,6 +233,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_afastamentos',
                 'descricao': 'Afastamentos',
                 'dependencias': ['11'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_15_rh_afastamentos'
             },
@@ -191,6 +243,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_rescisoes',
                 'descricao': 'Rescisões',
                 'dependencias': ['11'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_16_rh_rescisoes'
             },
@@ -199,6 +253,8 @@ class ETLSequencialExecutor:
                 'nome': 'rh_rescisoes_rubricas',
                 'descricao': 'Rubricas de Rescisão',
                 'dependencias': ['16'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_16_rh_rescisoes_rubricas'
             },
@@ -209,6 +265,8 @@ class ETLSequencialExecutor:
                 'nome': 'usuarios',
                 'descricao': 'Usuários e Configurações',
                 'dependencias': ['03'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_18_usuarios'
             },
@@ -217,6 +275,8 @@ class ETLSequencialExecutor:
                 'nome': 'logs_unificado',
                 'descricao': 'Logs de Acesso e Atividades',
                 'dependencias': ['18'],
+                'escreve': [],
+                'le': ['contratos'],
                 'critico': False,
                 'comando': 'etl_19_logs_unificado_corrigido'
             }
@@ -231,6 +291,38 @@ class ETLSequencialExecutor:
             'etls_pulados': 0,
             'tempo_total': 0
         }
+        
+        # Duração (s) de cada ETL executado, usada no cálculo do caminho crítico
+        self.duracoes = {}
+        self.modo_paralelo = False
+        self._lock = threading.Lock()
+        
+        # Contexto compartilhado do modo --em-processo (None = um subprocesso por ETL)
+        self.contexto = None
+        
+        # Relatórios JSON de cada ETL (tempos por etapa, queries, memória), por número
+        self.relatorios = {}
+        self.dir_relatorios = None
+    
+    def iniciar_relatorios(self):
+        """Cria o diretório desta execução em ETL_RELATORIOS_DIR"""
+        self.dir_relatorios = os.path.join(
+            settings.ETL_RELATORIOS_DIR, f"execucao_{self.stats['inicio']:%Y%m%d_%H%M%S}"
+        )
+        os.makedirs(self.dir_relatorios, exist_ok=True)
+    
+    def caminho_relatorio(self, etl):
+        return os.path.join(self.dir_relatorios, f"{etl['numero']}_{etl['comando']}.json")
+    
+    def carregar_relatorio(self, etl, caminho):
+        """Lê o relatório JSON gravado pelo ETL (ausente se o comando nem chegou a rodar)"""
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                relatorio = json.load(arquivo)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.relatorios[etl['numero']] = relatorio
     
     def executar_etl(self, etl, dry_run=False, batch_size=None, progress_interval=None):
         """Executa um ETL específico"""
@@ -238,6 +330,9 @@ class ETLSequencialExecutor:
         print(f"EXECUTANDO ETL {etl['numero']} - {etl['descricao']}")
         print(f"{'='*70}")
         
+        if self.contexto is not None:
+            return self.executar_etl_em_processo(etl, dry_run, batch_size, progress_interval)
+        
         # Construir comando
         comando = ['python', 'manage.py', etl['comando']]
         
@@ -250,14 +345,16 @@ class ETLSequencialExecutor:
         if progress_interval:
             comando.extend(['--progress-interval', str(progress_interval)])
         
-        # Executar comando
+        # Executar comando (o ETL grava o relatório JSON no caminho indicado)
+        caminho_relatorio = self.caminho_relatorio(etl)
         inicio_etl = time.time()
         try:
             resultado = subprocess.run(
                 comando,
                 capture_output=True,
                 text=True,
-                check=True
+                check=True,
+                env=dict(os.environ, ETL_RELATORIO_JSON=caminho_relatorio)
             )
             
             fim_etl = time.time()
@@ -267,7 +364,9 @@ class ETLSequencialExecutor:
             if resultado.stdout:
                 print("Saída:", resultado.stdout[-500:])  # Últimas 500 caracteres
             
-            self.stats['etls_sucesso'] += 1
+            with self._lock:
+                self.duracoes[etl['numero']] = tempo_etl
+                self.stats['etls_sucesso'] += 1
             return True
             
         except subprocess.CalledProcessError as e:
@@ -281,8 +380,67 @@ class ETLSequencialExecutor:
             if e.stderr:
                 print("Erro:", e.stderr[-500:])
             
-            self.stats['etls_erro'] += 1
+            with self._lock:
+                self.duracoes[etl['numero']] = tempo_etl
+                self.stats['etls_erro'] += 1
             return False
+        
+        finally:
+            self.carregar_relatorio(etl, caminho_relatorio)
+    
+    def executar_etl_em_processo(self, etl, dry_run=False, batch_size=None, progress_interval=None):
+        """
+        Executa um ETL via call_command no processo atual, compartilhando o
+        ETLContext (conexão Sybase, mapa histórico e caches) com os demais.
+        
+        Ao final, os caches que dependem das tabelas gravadas pelo ETL
+        (chave 'escreve') são invalidados, mesmo em caso de erro.
+        """
+        saida = io.StringIO()
+        caminho_relatorio = self.caminho_relatorio(etl)
+        inicio_etl = time.time()
+        try:
+            with self.contexto.ativar():
+                comando = load_command_class(get_commands()[etl['comando']], etl['comando'])
+            comando.caminho_relatorio = caminho_relatorio
+            
+            # Repassar apenas as opções que o comando declara
+            suportadas = {acao.dest for acao in comando.create_parser('manage.py', etl['comando'])._actions}
+            opcoes = {}
+            if dry_run and 'dry_run' in suportadas:
+                opcoes['dry_run'] = True
+            if batch_size and 'batch_size' in suportadas:
+                opcoes['batch_size'] = batch_size
+            if progress_interval and 'progress_interval' in suportadas:
+                opcoes['progress_interval'] = progress_interval
+            
+            call_command(comando, stdout=saida, **opcoes)
+            
+        except Exception as e:
+            tempo_etl = time.time() - inicio_etl
+            print(f"❌ ERRO no ETL {etl['numero']} após {tempo_etl:.2f}s")
+            print(f"Erro: {e}")
+            if saida.getvalue():
+                print("Saída:", saida.getvalue()[-500:])
+            
+            with self._lock:
+                self.duracoes[etl['numero']] = tempo_etl
+                self.stats['etls_erro'] += 1
+            return False
+        
+        finally:
+            self.contexto.invalidar(etl.get('escreve', []))
+            self.carregar_relatorio(etl, caminho_relatorio)
+        
+        tempo_etl = time.time() - inicio_etl
+        print(f"✅ ETL {etl['numero']} executado com sucesso em {tempo_etl:.2f}s (em processo)")
+        if saida.getvalue():
+            print("Saída:", saida.getvalue()[-500:])
+        
+        with self._lock:
+            self.duracoes[etl['numero']] = tempo_etl
+            self.stats['etls_sucesso'] += 1
+        return True
     
     def verificar_dependencias(self, etl, etls_executados):
         """Verifica se as dependências do ETL foram executadas"""
@@ -292,15 +450,28 @@ class ETLSequencialExecutor:
         return True
     
     def executar_sequencia(self, dry_run=False, etl_inicial=None, etl_final=None, 
-                          skip_etls=None, batch_size=None, progress_interval=None):
+                          skip_etls=None, batch_size=None, progress_interval=None, em_processo=False):
         """Executa a sequência completa de ETLs"""
         
+        if em_processo:
+            self.contexto = ETLContext()
+            try:
+                return self._executar_sequencia(dry_run, etl_inicial, etl_final, skip_etls, batch_size, progress_interval)
+            finally:
+                self.contexto.fechar()
+                self.contexto = None
+        
+        return self._executar_sequencia(dry_run, etl_inicial, etl_final, skip_etls, batch_size, progress_interval)
+    
+    def _executar_sequencia(self, dry_run, etl_inicial, etl_final, skip_etls, batch_size, progress_interval):
         self.stats['inicio'] = datetime.now()
+        self.iniciar_relatorios()
         etls_executados = []
         skip_etls = skip_etls or []
         
         print(f"\n🚀 INICIANDO EXECUÇÃO SEQUENCIAL DE ETLs")
         print(f"Modo: {'DRY-RUN' if dry_run else 'PRODUÇÃO'}")
+        print(f"Execução: {'em processo (contexto compartilhado)' if self.contexto else 'um subprocesso por ETL'}")
         print(f"Data/Hora: {self.stats['inicio'].strftime('%d/%m/%Y %H:%M:%S')}")
         print(f"ETLs a pular: {skip_etls}")
         
@@ -341,7 +512,148 @@ class ETLSequencialExecutor:
         
         self.imprimir_relatorio_final()
     
-    def imprimir_relatorio_final(self):
+    def selecionar_etls(self, etl_inicial=None, etl_final=None, skip_etls=None):
+        """Aplica --etl-inicial, --etl-final e --skip-etls sobre a sequência declarada"""
+        skip_etls = skip_etls or []
+        selecionados = []
+        
+        for etl in self.etls_sequence:
+            if etl['numero'] in skip_etls:
+                print(f"⏭️  Pulando ETL {etl['numero']} - {etl['descricao']}")
+                self.stats['etls_pulados'] += 1
+                continue
+            if etl_inicial and etl['numero'] < etl_inicial:
+                continue
+            if etl_final and etl['numero'] > etl_final:
+                continue
+            selecionados.append(etl)
+        
+        return selecionados
+    
+    def ordenar_topologicamente(self, etls):
+        """
+        Ordena os ETLs respeitando 'dependencias' (algoritmo de Kahn).
+        
+        Dependências fora da lista informada são consideradas já atendidas.
+        Em caso de empate, mantém a ordem declarada em etls_sequence.
+        """
+        numeros = {etl['numero'] for etl in etls}
+        pendentes = {etl['numero']: {d for d in etl['dependencias'] if d in numeros} for etl in etls}
+        ordenados = []
+        
+        while pendentes:
+            prontos = [etl for etl in etls if etl['numero'] in pendentes and not pendentes[etl['numero']]]
+            if not prontos:
+                raise ValueError(f"Dependência circular entre os ETLs: {sorted(pendentes)}")
+            for etl in prontos:
+                ordenados.append(etl)
+                del pendentes[etl['numero']]
+            for deps in pendentes.values():
+                deps.difference_update(etl['numero'] for etl in prontos)
+        
+        return ordenados
+    
+    def calcular_caminho_critico(self, etls):
+        """
+        Retorna (duração, [números]) do caminho mais longo do grafo de
+        dependências, usando as durações medidas nesta execução.
+        """
+        melhor = {}
+        for etl in self.ordenar_topologicamente(etls):
+            anteriores = [melhor[d] for d in etl['dependencias'] if d in melhor]
+            duracao_base, caminho_base = max(anteriores, key=lambda x: x[0], default=(0.0, []))
+            melhor[etl['numero']] = (
+                duracao_base + self.duracoes.get(etl['numero'], 0.0),
+                caminho_base + [etl['numero']],
+            )
+        return max(melhor.values(), key=lambda x: x[0], default=(0.0, []))
+    
+    def conflita(self, etl, outro):
+        """
+        True se os dois ETLs não podem rodar ao mesmo tempo: escrevem o mesmo
+        grupo de tabelas ('escreve') ou um lê ('le') um grupo que o outro escreve
+        (ex.: o mapa histórico lido de 'contratos' enquanto o ETL 03 os regrava).
+        """
+        if set(etl['escreve']) & set(outro['escreve']):
+            return True
+        return bool(set(etl['le']) & set(outro['escreve']) or set(outro['le']) & set(etl['escreve']))
+    
+    def executar_paralelo(self, dry_run=False, etl_inicial=None, etl_final=None,
+                          skip_etls=None, batch_size=None, progress_interval=None, workers=4):
+        """
+        Executa os ETLs em paralelo seguindo o grafo de dependências.
+        
+        Um ETL é disparado assim que todas as suas dependências terminam com
+        sucesso e nenhum ETL em execução conflita com ele (ver conflita()),
+        respeitando o limite de 'workers' simultâneos. Dependentes de
+        um ETL que falhou são pulados. Se um ETL crítico falhar, nenhum novo
+        ETL é disparado e a execução termina após os que já estão rodando.
+        """
+        self.modo_paralelo = True
+        self.stats['inicio'] = datetime.now()
+        self.iniciar_relatorios()
+        workers = max(1, workers)
+        
+        print(f"\n🚀 INICIANDO EXECUÇÃO PARALELA DE ETLs ({workers} workers)")
+        print(f"Modo: {'DRY-RUN' if dry_run else 'PRODUÇÃO'}")
+        print(f"Data/Hora: {self.stats['inicio'].strftime('%d/%m/%Y %H:%M:%S')}")
+        print(f"ETLs a pular: {skip_etls or []}")
+        
+        selecionados = self.selecionar_etls(etl_inicial, etl_final, skip_etls)
+        pendentes = self.ordenar_topologicamente(selecionados)
+        numeros = {etl['numero'] for etl in selecionados}
+        sucesso, falhos, pulados = set(), set(), set()
+        em_execucao = {}
+        interromper = False
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pendentes or em_execucao:
+                if not interromper:
+                    for etl in list(pendentes):
+                        dependencias = [d for d in etl['dependencias'] if d in numeros]
+                        
+                        if any(d in falhos or d in pulados for d in dependencias):
+                            print(f"⚠️  ETL {etl['numero']} pulado - dependências não atendidas")
+                            pendentes.remove(etl)
+                            pulados.add(etl['numero'])
+                            self.stats['etls_pulados'] += 1
+                            continue
+                        
+                        if (
+                            len(em_execucao) < workers
+                            and all(d in sucesso for d in dependencias)
+                            and not any(self.conflita(etl, outro) for outro in em_execucao.values())
+                        ):
+                            pendentes.remove(etl)
+                            self.stats['etls_executados'] += 1
+                            futuro = pool.submit(self.executar_etl, etl, dry_run, batch_size, progress_interval)
+                            em_execucao[futuro] = etl
+                
+                if not em_execucao:
+                    break
+                
+                concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    etl = em_execucao.pop(futuro)
+                    if futuro.result():
+                        sucesso.add(etl['numero'])
+                    else:
+                        falhos.add(etl['numero'])
+                        if etl['critico']:
+                            print(f"\n💥 ETL CRÍTICO {etl['numero']} falhou! Nenhum novo ETL será iniciado.")
+                            interromper = True
+                        else:
+                            print(f"⚠️  ETL {etl['numero']} falhou, mas não é crítico. Continuando...")
+        
+        if pendentes:
+            self.stats['etls_pulados'] += len(pendentes)
+        
+        self.stats['fim'] = datetime.now()
+        self.stats['tempo_total'] = (self.stats['fim'] - self.stats['inicio']).total_seconds()
+        
+        self.imprimir_relatorio_final(selecionados)
+    
+    def imprimir_relatorio_final(self, etls=None):
         """Imprime relatório final da execução"""
         print(f"\n{'='*70}")
         print("RELATÓRIO FINAL DE EXECUÇÃO")
@@ -354,11 +666,54 @@ class ETLSequencialExecutor:
         print(f"ETLs com erro: {self.stats['etls_erro']}")
         print(f"ETLs pulados: {self.stats['etls_pulados']}")
         
+        if self.modo_paralelo and self.duracoes:
+            tempo_serial = sum(self.duracoes.values())
+            duracao_critica, caminho_critico = self.calcular_caminho_critico(etls or self.etls_sequence)
+            print(f"Tempo somado dos ETLs (execução sequencial): {tempo_serial:.2f}s")
+            print(f"Tempo economizado pelo paralelismo: {tempo_serial - self.stats['tempo_total']:.2f}s")
+            print(f"Caminho crítico ({duracao_critica:.2f}s): {' -> '.join(caminho_critico)}")
+        
+        self.imprimir_metricas_etls()
+        
         if self.stats['etls_erro'] > 0:
             print(f"\n⚠️  {self.stats['etls_erro']} ETL(s) falharam. Verifique os logs acima.")
         else:
             print(f"\n✅ Todos os ETLs executados com sucesso!")
 
+    def imprimir_metricas_etls(self):
+        """
+        Tabela com os tempos por etapa de cada ETL (dos relatórios JSON) e
+        gravação do relatório consolidado da execução.
+        """
+        if self.relatorios:
+            print(f"\n{'ETL':<4} {'Total':>9} {'Sybase':>9} {'Transf.':>9} {'Gravação':>9} {'Commit':>9} {'Postgres':>9} {'Queries':>9} {'RSS MB':>8}")
+            for numero in sorted(self.relatorios):
+                relatorio = self.relatorios[numero]
+                etapas = relatorio.get('etapas', {})
+                segundos = lambda *nomes: sum(etapas.get(nome, {}).get('segundos', 0) for nome in nomes)
+                print(
+                    f"{numero:<4} {relatorio.get('duracao_segundos') or 0:>8.1f}s "
+                    f"{segundos('sybase_query', 'sybase_fetch'):>8.1f}s {segundos('transformacao'):>8.1f}s "
+                    f"{segundos('gravacao'):>8.1f}s {segundos('commit'):>8.1f}s {segundos('postgres'):>8.1f}s "
+                    f"{relatorio.get('orm_queries', 0):>9} {relatorio.get('pico_rss_mb') or 0:>8.0f}"
+                )
+        
+        consolidado = {
+            'inicio': self.stats['inicio'].isoformat(),
+            'fim': self.stats['fim'].isoformat(),
+            'tempo_total': self.stats['tempo_total'],
+            'etls_executados': self.stats['etls_executados'],
+            'etls_sucesso': self.stats['etls_sucesso'],
+            'etls_erro': self.stats['etls_erro'],
+            'etls_pulados': self.stats['etls_pulados'],
+            'duracoes': self.duracoes,
+            'etls': self.relatorios,
+        }
+        caminho = os.path.join(self.dir_relatorios, 'relatorio_execucao.json')
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(consolidado, arquivo, ensure_ascii=False, indent=2)
+        print(f"Relatório JSON da execução: {caminho}")
+
 def main():
     parser = argparse.ArgumentParser(description='Execução Sequencial de ETLs - GESTK')
     parser.add_argument('--dry-run', action='store_true', 
@@ -373,6 +728,12 @@ def main():
                        help='Tamanho do lote para ETLs que suportam (padrão: 1000)')
     parser.add_argument('--progress-interval', type=int, default=50,
                        help='Intervalo de progresso para ETLs que suportam (padrão: 50)')
+    parser.add_argument('--paralelo', action='store_true',
+                       help='Executa ETLs independentes em paralelo respeitando as dependências')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Número máximo de ETLs simultâneos no modo paralelo (padrão: 4)')
+    parser.add_argument('--em-processo', action='store_true',
+                       help='Executa os ETLs no mesmo processo reaproveitando conexões e caches')
     
     args = parser.parse_args()
     
@@ -383,14 +744,29 @@ def main():
     
     # Executar sequência
     executor = ETLSequencialExecutor()
-    executor.executar_sequencia(
-        dry_run=args.dry_run,
-        etl_inicial=args.etl_inicial,
-        etl_final=args.etl_final,
-        skip_etls=skip_etls,
-        batch_size=args.batch_size,
-        progress_interval=args.progress_interval
-    )
+    if args.paralelo and args.em_processo:
+        print("⚠️  --em-processo não é suportado junto com --paralelo; usando um subprocesso por ETL.")
+    
+    if args.paralelo:
+        executor.executar_paralelo(
+            dry_run=args.dry_run,
+            etl_inicial=args.etl_inicial,
+            etl_final=args.etl_final,
+            skip_etls=skip_etls,
+            batch_size=args.batch_size,
+            progress_interval=args.progress_interval,
+            workers=args.workers
+        )
+    else:
+        executor.executar_sequencia(
+            dry_run=args.dry_run,
+            etl_inicial=args.etl_inicial,
+            etl_final=args.etl_final,
+            skip_etls=skip_etls,
+            batch_size=args.batch_size,
+            progress_interval=args.progress_interval,
+            em_processo=args.em_processo
+        )
 
 if __name__ == '__main__':
     main()
@@ -13,6 +13,9 @@
 #     --skip-etls LIST   Pula ETLs específicos (ex: --skip-etls 05,06,07)
 #     --batch-size N     Tamanho do lote para ETLs que suportam
 #     --progress-interval N  Intervalo de progresso para ETLs que suportam
+#     --paralelo         Executa ETLs independentes em paralelo
+#     --workers N        Número máximo de ETLs simultâneos (modo paralelo)
+#     --em-processo      Executa os ETLs no mesmo processo com caches compartilhados
 
 echo ""
 echo "======================================================================"
@@ -122,6 +122,18 @@ SYBASE_CONFIG = {
     'PWD': config('ODBC_PASSWORD', default='externo'),
 }
 
+# Fábrica alternativa de conexões "Sybase" (caminho pontilhado; vazio = ODBC acima).
+# Ex.: apps.importacao.standin.conectar usa o arquivo SQLite de SYBASE_STANDIN_PATH
+SYBASE_CONNECTION_FACTORY = config('SYBASE_CONNECTION_FACTORY', default='')
+SYBASE_STANDIN_PATH = config('SYBASE_STANDIN_PATH', default=str(BASE_DIR / '.etl_cache' / 'sybase_standin.sqlite3'))
+
+# Diretório para artefatos compartilhados entre execuções de ETL
+# (ex.: snapshot do mapa histórico da Regra de Ouro)
+ETL_CACHE_DIR = config('ETL_CACHE_DIR', default=str(BASE_DIR / '.etl_cache'))
+
+# Diretório dos relatórios JSON de execução dos ETLs (tempos por etapa, queries, memória)
+ETL_RELATORIOS_DIR = config('ETL_RELATORIOS_DIR', default=str(BASE_DIR / '.etl_relatorios'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 